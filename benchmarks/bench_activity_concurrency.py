@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmark activity concurrency on a single worker event loop.
+
+Runs C concurrent `process_in_enclave` activities on one asyncio loop (as the
+Temporal worker does) against enclave/app.py over a UNIX socket, with the
+enclave's `process` handler taking --process-latency seconds and a local
+IMDS stand-in answering configure's credential lookups. Reports throughput
+and the worst event-loop stall observed by a 1ms ticker: a blocking call
+anywhere in the activity path shows up directly as loop lag. (The enclave and
+IMDS stand-ins run as threads in this process, so some lag is GIL contention.)
+
+Usage:
+    python3 benchmarks/bench_activity_concurrency.py --concurrency 1 4 16 64
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+
+import app  # noqa: E402
+import activities  # noqa: E402
+import credentials  # noqa: E402
+import enclave_client  # noqa: E402
+
+
+def start_imds(latency):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, body):
+            time.sleep(latency)
+            data = body.encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_PUT(self):
+            self._reply('imds-token')
+
+        def do_GET(self):
+            if self.path.endswith('/security-credentials/'):
+                self._reply('BenchmarkRole')
+            else:
+                self._reply(json.dumps({'AccessKeyId': 'AKIABENCHMARK', 'SecretAccessKey': 'secret', 'Token': 'token'}))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def start_enclave(process_latency, kms_latency, workers):
+    def kms_decrypt(ciphertext_b64, credentials=None, region=None):
+        time.sleep(kms_latency)
+        return (os.urandom(32), None)
+
+    handle_process = app.HANDLERS['process']
+
+    def slow_process(req, payload):
+        time.sleep(process_latency)
+        return handle_process(req, payload)
+
+    app.kms_decrypt = kms_decrypt
+    app.HANDLERS['process'] = slow_process
+
+    path = os.path.join(tempfile.mkdtemp(), 'enclave.sock')
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(app.LISTEN_BACKLOG)
+    threading.Thread(target=app.serve, args=(listener, workers), daemon=True).start()
+    return f'unix:{path}'
+
+
+async def run_case(concurrency, total):
+    max_lag = 0.0
+    stop = asyncio.Event()
+
+    async def ticker():
+        nonlocal max_lag
+        while not stop.is_set():
+            before = time.perf_counter()
+            await asyncio.sleep(0.001)
+            max_lag = max(max_lag, time.perf_counter() - before - 0.001)
+
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            await activities.process_in_enclave("Sensitive Data Needs Encryption")
+
+    tick = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick
+    await enclave_client.get_enclave_pool().close()
+    return total / elapsed, max_lag * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument('--activities', type=int, default=256, help='activities per concurrency level')
+    parser.add_argument('--process-latency', type=float, default=0.02, help='enclave processing seconds per request')
+    parser.add_argument('--kms-latency', type=float, default=0.08)
+    parser.add_argument('--imds-latency', type=float, default=0.005)
+    parser.add_argument('--sample-rate', type=float, default=0.05, help='ATTESTATION_SAMPLE_RATE (forced configures)')
+    parser.add_argument('--enclave-workers', type=int, default=64)
+    parser.add_argument('--pool-size', type=int, default=enclave_client.POOL_SIZE)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    credentials.IMDS_ENDPOINT = start_imds(args.imds_latency)
+
+    # IMDS lookups stay real; only the encrypted TSK file is stood in
+    get_kms_config = activities.get_kms_config
+
+    async def get_kms_config_with_tsk():
+        return {**await get_kms_config(), 'encrypted_tsk': 'dGVzdA=='}
+    activities.get_kms_config = get_kms_config_with_tsk
+    activities.ATTESTATION_SAMPLE_RATE = args.sample_rate
+    enclave_client.POOL_SIZE = args.pool_size
+
+    results = []
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        enclave_client.ENCLAVE_ADDRESS = start_enclave(args.process_latency, args.kms_latency, args.enclave_workers)
+        for concurrency in args.concurrency:
+            activities._enclave_configured = False
+            results.append((concurrency, *asyncio.run(run_case(concurrency, args.activities))))
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+
+    print(f"{'concurrency':>11} {'activities/s':>13} {'max loop lag ms':>16}")
+    for concurrency, rate, lag in results:
+        print(f"{concurrency:>11} {rate:>13.1f} {lag:>16.2f}")
+
+
+if __name__ == '__main__':
+    main()
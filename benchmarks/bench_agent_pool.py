@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+`process` throughput with CPU-bound agent logic run on the enclave's
+request threads vs. on the agent process pool (enclave/agent_pool.py).
+
+The POC agent does no work, so the benchmark replaces run_agent_step with
+a pure-Python stand-in that burns about `--work-ms` of CPU per state
+while holding the GIL. `--threads` request threads each chain encrypted
+states through app.handle_process (decrypt, agent step, encrypt) for
+`--duration` seconds. With 0 processes the agent runs in-process, as
+before the pool; otherwise on that many forked workers. Throughput can
+only scale up to the number of CPUs available (the enclave's
+`--cpu-count`), printed first.
+
+Usage:
+    python3 benchmarks/bench_agent_pool.py --processes 0 1 2 4 --threads 8 --work-ms 5 --state-bytes 4096
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+
+import agent_pool  # noqa: E402
+import app  # noqa: E402
+
+KEY = os.urandom(32)
+POC_STEP = app.run_agent_step
+ITERATIONS_PER_MS = 1
+
+
+def burn(iterations):
+    total = 0
+    for i in range(iterations):
+        total += i * i % 7
+    return total
+
+
+def calibrate():
+    """Loop iterations per millisecond of CPU on this machine."""
+    iterations = 100000
+    start = time.perf_counter()
+    burn(iterations)
+    return max(1, int(iterations / ((time.perf_counter() - start) * 1000)))
+
+
+def cpu_bound_step(state, req):
+    """Stand-in agent: `work_ms` of pure-Python work, then the POC step."""
+    burn(int(req.get('work_ms', 0) * ITERATIONS_PER_MS))
+    return POC_STEP(state, req)
+
+
+def run_case(processes, threads, duration, work_ms, state_bytes):
+    """States processed per second."""
+    pool = agent_pool.AgentPool(app.AGENT_TASKS, processes).start() if processes else None
+    app.AGENT_POOL = pool
+    app.KEY_CACHE.store(KEY)
+    counts = [0] * threads
+    deadline = time.perf_counter() + duration
+
+    def client(i):
+        _, state = app.handle_process({'workflow_id': f'wf-{i}', 'work_ms': work_ms}, os.urandom(state_bytes))
+        while time.perf_counter() < deadline:
+            response, state = app.handle_process({'encrypted': True, 'work_ms': work_ms}, state)
+            assert response['status'] == 'ok', response
+            counts[i] += 1
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    app.KEY_CACHE.clear()
+    app.AGENT_POOL = None
+    if pool:
+        pool.close()
+    return sum(counts) / elapsed
+
+
+def main():
+    global ITERATIONS_PER_MS
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, nargs='+', default=[0, 1, 2, 4], help='agent worker processes (0 = in-process)')
+    parser.add_argument('--threads', type=int, default=8, help='request threads (ENCLAVE_MAX_WORKERS)')
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds per case')
+    parser.add_argument('--work-ms', type=float, default=5.0, help='CPU time of the stand-in agent per state')
+    parser.add_argument('--state-bytes', type=int, default=4096)
+    args = parser.parse_args()
+
+    app.LOG.level = app.enclave_log.WARNING
+    ITERATIONS_PER_MS = calibrate()
+    # Patched before any pool is forked, so the workers run the stand-in too
+    app.run_agent_step = cpu_bound_step
+
+    print(f"CPUs available: {agent_pool.default_processes('auto') or 1}, agent work {args.work_ms:g} ms/state, "
+          f"{args.threads} request threads")
+    print(f"{'processes':>10} {'states/s':>10} {'speedup':>8}")
+    baseline = None
+    for processes in args.processes:
+        rate = run_case(processes, args.threads, args.duration, args.work_ms, args.state_bytes)
+        baseline = baseline or rate
+        print(f"{processes:>10} {rate:>10.1f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
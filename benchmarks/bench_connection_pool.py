@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark pooled, multiplexed enclave connections against one connection per request.
+
+Starts enclave/app.py's server on a local stand-in transport (UNIX or TCP)
+with a pre-loaded key and sends small `process` requests from C concurrent
+coroutines, either through host/enclave_client.EnclavePool or by opening and
+closing a fresh connection for every request (the previous behaviour).
+
+Usage:
+    python3 benchmarks/bench_connection_pool.py --requests 5000 --concurrency 32
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+
+import app  # noqa: E402
+from enclave_client import EnclaveConnection, EnclavePool, parse_address  # noqa: E402
+
+
+def start_enclave(transport):
+    if transport == 'unix':
+        path = os.path.join(tempfile.mkdtemp(), 'enclave.sock')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        address = f'unix:{path}'
+    else:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        address = f'tcp:127.0.0.1:{listener.getsockname()[1]}'
+    listener.listen(app.LISTEN_BACKLOG)
+    threading.Thread(target=app.serve, args=(listener,), daemon=True).start()
+    return address
+
+
+async def run_case(address, mode, requests, concurrency, pool_size, payload):
+    transport = parse_address(address)
+    pool = EnclavePool(transport, size=pool_size)
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def fresh_request():
+        conn = await EnclaveConnection.open(transport)
+        try:
+            return await conn.request('process', payload=payload)
+        finally:
+            await conn.close()
+
+    async def client():
+        for _ in remaining:
+            start = time.perf_counter()
+            if mode == 'pooled':
+                await pool.request('process', payload=payload)
+            else:
+                await fresh_request()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await pool.close()
+    return requests / elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--payload-bytes', type=int, default=256)
+    parser.add_argument('--transports', nargs='+', default=['unix', 'tcp'], choices=['unix', 'tcp'])
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    payload = os.urandom(args.payload_bytes)
+    app.KEY_CACHE.store(os.urandom(32))
+
+    results = []
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        for transport in args.transports:
+            address = start_enclave(transport)
+            for mode in ('fresh', 'pooled'):
+                rps, latencies = asyncio.run(
+                    run_case(address, mode, args.requests, args.concurrency, args.pool_size, payload))
+                results.append((transport, mode, rps, latencies))
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+
+    print(f"{'transport':>9} {'mode':>7} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for transport, mode, rps, latencies in results:
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{transport:>9} {mode:>7} {rps:>10.1f} {statistics.median(latencies):>8.2f} {p99:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
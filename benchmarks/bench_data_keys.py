@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Cost of per-workflow data keys (enclave/state_crypto.py DataKeys) on the
+seal/open path, vs. encrypting every state under the TSK directly.
+
+Each round seals and opens one state for each of `--workflows` distinct
+workflows. "cached" keeps the derived keys' AESGCM contexts in the LRU
+(sized by `--cache`); "uncached" derives the key with HKDF on every call,
+as a cache too small for the working set would.
+
+Usage:
+    python3 benchmarks/bench_data_keys.py --workflows 100 10000 --state-bytes 1024 --cache 1024
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+
+import state_crypto  # noqa: E402
+
+
+def measure(workflows, plaintext, aead_for_workflow, rounds):
+    """Microseconds per seal + open."""
+    ids = [f'wf-{i}' for i in range(workflows)]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for workflow_id in ids:
+            aead = aead_for_workflow(workflow_id)
+            blob = state_crypto.encrypt_state(aead, plaintext, workflow_id, 1)
+            state_crypto.decrypt_state(aead_for_workflow(workflow_id), blob, workflow_id, 1)
+    return (time.perf_counter() - start) / (rounds * workflows) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workflows', type=int, nargs='+', default=[100, 10000])
+    parser.add_argument('--state-bytes', type=int, default=1024)
+    parser.add_argument('--cache', type=int, default=1024, help='derived keys kept (ENCLAVE_DATA_KEY_CACHE)')
+    parser.add_argument('--states', type=int, default=20000, help='seal/open pairs per case')
+    args = parser.parse_args()
+
+    master = os.urandom(32)
+    plaintext = os.urandom(args.state_bytes)
+    print(f"{'workflows':>10} {'mode':>10} {'us/state':>10} {'derivations':>12}")
+    for workflows in args.workflows:
+        rounds = max(1, args.states // workflows)
+        cases = [('tsk', None), ('cached', args.cache), ('uncached', 0)]
+        for mode, cache in cases:
+            if cache is None:
+                elapsed, derived = measure(workflows, plaintext, lambda w: state_crypto.aead_for(master), rounds), 0
+            else:
+                keys = state_crypto.DataKeys(cache_size=cache)
+                key_id = keys.new_key_id()
+                elapsed = measure(workflows, plaintext, lambda w: keys.aead(master, w, key_id), rounds)
+                derived = keys.derived
+            print(f"{workflows:>10} {mode:>10} {elapsed:>10.2f} {derived:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark the enclave server's concurrent connection handling.
+
+Runs enclave/app.py's accept loop over a local UNIX socket (stand-in for
+vsock) and drives it with N parallel clients sending `health` requests while
+one client keeps issuing slow `configure` calls (KMS latency is simulated).
+Compares the serial mode (--workers 1) against the thread pool.
+
+Usage:
+    python3 benchmarks/bench_enclave_concurrency.py --clients 16 --duration 5
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'enclave'))
+
+import app  # noqa: E402
+
+
+def fake_kms_decrypt(latency):
+    def decrypt(ciphertext_b64, credentials=None, region=None):
+        time.sleep(latency)
+        return (os.urandom(32), None)
+    return decrypt
+
+
+def request(path, msg):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+        s.sendall(json.dumps(msg).encode())
+        return json.loads(s.recv(16384).decode())
+    finally:
+        s.close()
+
+
+def run_case(workers, clients, duration, kms_latency, backlog):
+    path = os.path.join(tempfile.mkdtemp(), 'enclave.sock')
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(backlog)
+
+    stop = threading.Event()
+    server = threading.Thread(target=app.serve, args=(listener, workers, stop), daemon=True)
+    server.start()
+
+    deadline = time.time() + duration
+    counts = [0] * clients
+    errors = [0] * clients
+
+    def health_client(i):
+        while time.time() < deadline:
+            try:
+                request(path, {'type': 'health'})
+                counts[i] += 1
+            except OSError:
+                errors[i] += 1
+
+    configure_msg = {
+        'type': 'configure',
+        'aws_access_key_id': 'AKIABENCHMARK',
+        'aws_secret_access_key': 'secret',
+        'aws_session_token': 'token',
+        'encrypted_tsk': 'dGVzdA==',
+    }
+
+    def configure_client():
+        while time.time() < deadline:
+            request(path, configure_msg)
+
+    threads = [threading.Thread(target=health_client, args=(i,)) for i in range(clients)]
+    threads.append(threading.Thread(target=configure_client))
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+
+    stop.set()
+    listener.close()
+    os.unlink(path)
+    return sum(counts) / elapsed, sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--kms-latency', type=float, default=0.25, help='simulated KMS decrypt seconds')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--backlog', type=int, default=app.LISTEN_BACKLOG)
+    args = parser.parse_args()
+
+    app.kms_decrypt = fake_kms_decrypt(args.kms_latency)
+
+    # Keep the server's per-request console output out of the results
+    real_stdout = sys.stdout
+    print(f"{'workers':>8} {'clients':>8} {'health req/s':>14} {'errors':>8}")
+    for workers in args.workers:
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            rps, errors = run_case(workers, args.clients, args.duration, args.kms_latency, args.backlog)
+        finally:
+            sys.stdout.close()
+            sys.stdout = real_stdout
+        print(f"{workers:>8} {args.clients:>8} {rps:>14.1f} {errors:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Per-call cost of logging on the enclave's request threads: a flushed
+print() per line (the earlier behaviour) vs. the ring-buffer logger
+(enclave/enclave_log.py) with the line enabled and filtered out by level.
+
+The console is a stand-in stream whose every flush takes a fixed time
+(the Nitro console is a slow serial device). Calls are made from
+`--threads` threads at once, as the enclave's request workers would.
+
+Usage:
+    python3 benchmarks/bench_enclave_logging.py --calls 2000 --threads 1 8 --console-latency 0.0005
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+
+import enclave_log  # noqa: E402
+
+
+class SlowConsole:
+    """A text stream whose flush() blocks for `latency` seconds."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        with self.lock:
+            time.sleep(self.latency)
+
+
+def run(threads, calls, log_call):
+    """Seconds per call, averaged over `calls` calls on each of `threads` threads."""
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for i in range(calls):
+            log_call(i)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return (time.perf_counter() - start) / (threads * calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=2000, help='log calls per thread')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--console-latency', type=float, default=0.0005, help='seconds per console flush')
+    args = parser.parse_args()
+
+    console = SlowConsole(args.console_latency)
+
+    def flushed_print(i):
+        print(f"[ENCLAVE] Processing message {i}...", file=console, flush=True)
+
+    log = enclave_log.EnclaveLog(level=enclave_log.INFO, buffer_size=1000, rate_per_second=0, stream=console)
+    cases = [
+        ('print(flush=True)', flushed_print),
+        ('log.info', lambda i: log.info("Processing message", i=i)),
+        ('log.debug (off)', lambda i: log.debug("Processing message", i=i)),
+    ]
+
+    print(f"{'logging':>18} {'threads':>8} {'us/call':>10}")
+    for name, call in cases:
+        for threads in args.threads:
+            print(f"{name:>18} {threads:>8} {run(threads, args.calls, call) * 1e6:>10.2f}")
+    log.flush()
+
+
+if __name__ == '__main__':
+    main()
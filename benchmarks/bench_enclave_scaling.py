@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Measure `process` throughput as enclaves are added behind the host's
+EnclaveDispatcher (host/enclave_client.py).
+
+Each stand-in enclave is enclave/app.py's server on its own UNIX socket with
+a single request worker and a fixed processing time per request, modelling
+one enclave's CPU allotment. A fixed number of concurrent clients send
+requests through the dispatcher; with N enclaves the ideal throughput is
+N / processing time. The dispatcher configures each enclave on first use
+(KMS replaced by a stub).
+
+Usage:
+    python3 benchmarks/bench_enclave_scaling.py --enclaves 1 2 4 8 --policies p2c least
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+
+import app  # noqa: E402
+from enclave_client import EnclaveDispatcher  # noqa: E402
+
+
+def patch_enclave(process_latency):
+    def kms_decrypt(ciphertext_b64, credentials=None, region=None):
+        return (os.urandom(32), None)
+
+    handle_process = app.HANDLERS['process']
+
+    def slow_process(req, payload):
+        time.sleep(process_latency)
+        return handle_process(req, payload)
+
+    app.kms_decrypt = kms_decrypt
+    app.HANDLERS['process'] = slow_process
+
+
+def start_enclaves(count):
+    directory = tempfile.mkdtemp()
+    addresses = []
+    for i in range(count):
+        path = os.path.join(directory, f'enclave-{i}.sock')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(app.LISTEN_BACKLOG)
+        threading.Thread(target=app.serve, args=(listener, 1), daemon=True).start()
+        addresses.append(f'unix:{path}')
+    return addresses
+
+
+async def configure(member):
+    meta, _ = await member.pool.request('configure', {
+        'encrypted_tsk': 'dGVzdA==',
+        'aws_access_key_id': 'AKIABENCHMARK',
+        'aws_secret_access_key': 'secret',
+        'aws_session_token': 'token',
+    })
+    assert meta['status'] == 'ok', meta
+
+
+async def run_case(addresses, policy, concurrency, total):
+    dispatcher = EnclaveDispatcher(addresses, configure=configure, policy=policy)
+    # Configure every enclave up front so the timed run is steady state
+    for member in dispatcher.members:
+        await configure(member)
+        member.configured = True
+
+    remaining = iter(range(total))
+
+    async def client():
+        for _ in remaining:
+            meta, _ = await dispatcher.request('process', {}, b'Sensitive Data Needs Encryption')
+            assert meta['status'] == 'ok', meta
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    served = [member.requests for member in dispatcher.members]
+    await dispatcher.close()
+    return total / elapsed, min(served), max(served)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--enclaves', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--policies', nargs='+', default=['p2c', 'least'], choices=['p2c', 'least'])
+    parser.add_argument('--process-latency', type=float, default=0.01, help='enclave seconds per request')
+    parser.add_argument('--concurrency', type=int, default=64, help='concurrent client coroutines')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per case')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    patch_enclave(args.process_latency)
+
+    results = []
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        addresses = start_enclaves(max(args.enclaves))
+        for policy in args.policies:
+            for count in args.enclaves:
+                rate, low, high = asyncio.run(run_case(addresses[:count], policy, args.concurrency, args.requests))
+                results.append((policy, count, rate, low, high))
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+
+    ideal = 1 / args.process_latency
+    print(f"{'policy':>6} {'enclaves':>8} {'requests/s':>11} {'speedup':>8} {'of ideal':>9} {'min/max per enclave':>20}")
+    for policy, count, rate, low, high in results:
+        base = next(r for p, c, r, _, _ in results if p == policy and c == min(args.enclaves))
+        print(f"{policy:>6} {count:>8} {rate:>11.1f} {rate / base:>7.2f}x {rate / (ideal * count):>8.0%} "
+              f"{f'{low}/{high}':>20}")
+
+
+if __name__ == '__main__':
+    main()
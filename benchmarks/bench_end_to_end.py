@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput and latency of the host activities against simulated
+enclaves (tests/simulator.py), runnable on any machine.
+
+Each case runs `--concurrency` slots of the real `process_in_enclave`
+activity (host/activities.py, host/enclave_client.py) for `--duration`
+seconds; each slot feeds every result back in as its next input, so all
+but the first request decrypt, process and re-encrypt a state. The
+enclaves are enclave/app.py processes on UNIX or TCP sockets, configured
+through the fake KMS, mock libnsm and fake IMDS with the injected
+latencies. `--attestation-sample-rate` forces that fraction of activities
+through a fresh configure, as ATTESTATION_SAMPLE_RATE does on the worker.
+
+Usage:
+    python3 benchmarks/bench_end_to_end.py --concurrency 1 8 32 --size 1K 64K --enclaves 1 --transport unix
+    python3 benchmarks/bench_end_to_end.py --kms-latency 0.05 --nsm-latency-us 500 --attestation-sample-rate 0.1
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+import activities  # noqa: E402
+import enclave_client  # noqa: E402
+from simulator import Simulator  # noqa: E402
+
+UNITS = {'K': 1024, 'M': 1024 * 1024}
+
+
+def parse_size(text):
+    if text[-1].upper() in UNITS:
+        return int(text[:-1]) * UNITS[text[-1].upper()]
+    return int(text)
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+async def run_case(concurrency, size, duration):
+    """Returns (activities/s, sorted latencies in ms)."""
+    data = os.urandom(size // 2).hex()[:size]
+    await activities.ensure_configured()
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def slot():
+        state = data
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            state = await activities.process_in_enclave(state)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(slot() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await enclave_client.get_enclave_pool().close()
+    return len(latencies) / elapsed, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help='concurrent activities')
+    parser.add_argument('--size', nargs='+', default=['1K'], help='input size per workflow (K/M suffix)')
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds per case')
+    parser.add_argument('--enclaves', type=int, default=1)
+    parser.add_argument('--transport', choices=['unix', 'tcp'], default='unix')
+    parser.add_argument('--kms-latency', type=float, default=0.02, help='seconds per KMS Decrypt')
+    parser.add_argument('--nsm-latency-us', type=int, default=200, help='microseconds per NSM request')
+    parser.add_argument('--imds-latency', type=float, default=0.001, help='seconds per IMDS call')
+    parser.add_argument('--attestation-sample-rate', type=float, default=0.0,
+                        help='fraction of activities that reconfigure (KMS + attestation)')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    activities.ATTESTATION_SAMPLE_RATE = args.attestation_sample_rate
+    with Simulator(args.enclaves, args.transport, args.kms_latency, args.nsm_latency_us, args.imds_latency) as sim:
+        sim.attach_host()
+        print(f"{args.enclaves} {args.transport} enclave(s), KMS {args.kms_latency * 1000:g} ms, "
+              f"NSM {args.nsm_latency_us} us, IMDS {args.imds_latency * 1000:g} ms, "
+              f"attestation sample rate {args.attestation_sample_rate:g}")
+        print(f"{'size':>8} {'concurrency':>12} {'activities/s':>13} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9}")
+        for size in args.size:
+            for concurrency in args.concurrency:
+                rate, latencies = asyncio.run(run_case(concurrency, parse_size(size), args.duration))
+                print(f"{size:>8} {concurrency:>12} {rate:>13.1f} {statistics.mean(latencies):>9.2f} "
+                      f"{percentile(latencies, 0.5):>9.2f} {percentile(latencies, 0.99):>9.2f}")
+        print(f"KMS Decrypt calls: {sim.kms.requests}, IMDS credential fetches: {sim.imds.calls['credentials']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark KMS Decrypt latency: long-lived in-process client vs. per-call setup.
+
+Runs enclave/kms_client.NitroKmsBackend against the local fake KMS
+(tests/fake_kms.py) with optional injected KMS latency:
+
+    persistent   one backend reused: key pair, attestation document and
+                 keep-alive connection shared across calls
+    per-call     a new backend per call (fresh RSA key pair, attestation and
+                 connection), as a kmstool_enclave_cli process does
+    spawn        process creation alone (fork/exec of /bin/true with the
+                 copied environment), the floor kmstool adds on top
+
+Usage:
+    python3 benchmarks/bench_kms_decrypt.py --calls 50 --kms-latency 0.005
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+import kms_client  # noqa: E402
+from fake_kms import FakeKms, start_fake_kms  # noqa: E402
+
+CREDENTIALS = {'ak': 'AKIAFAKE', 'sk': 'secret', 'token': 'session-token'}
+
+
+def timed(fn, calls):
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--kms-latency', type=float, default=0.0, help='seconds added by the fake KMS per call')
+    args = parser.parse_args()
+
+    fake, server, endpoint = start_fake_kms(FakeKms(args.kms_latency))
+    tsk = os.urandom(32)
+    blob = fake.encrypt(tsk)
+
+    persistent = kms_client.NitroKmsBackend(endpoint=endpoint, attestation=kms_client.StaticAttestation())
+
+    def per_call():
+        backend = kms_client.NitroKmsBackend(endpoint=endpoint, attestation=kms_client.StaticAttestation())
+        try:
+            assert backend.decrypt(blob, CREDENTIALS) == tsk
+        finally:
+            backend.close()
+
+    env = dict(os.environ, AWS_COMMON_RUNTIME_LOG_LEVEL='Trace')
+    results = [
+        ('persistent', timed(lambda: persistent.decrypt(blob, CREDENTIALS), args.calls)),
+        ('per-call', timed(per_call, args.calls)),
+        ('spawn', timed(lambda: subprocess.run(['/bin/true'], capture_output=True, env=env), args.calls)),
+    ]
+    server.shutdown()
+
+    print(f"{'mode':>10} {'mean ms':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for mode, latencies in results:
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{mode:>10} {statistics.mean(latencies):>9.2f} {statistics.median(latencies):>8.2f} {p99:>8.2f}")
+    print(f"fake KMS connections: {fake.connections} for {fake.requests} requests")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark attestation document retrieval: per-call NSM setup vs. NsmSession.
+
+Uses the mock libnsm (tests/mock_libnsm.c, compiled on the fly) with an
+optional per-request device delay:
+
+    per-call   load the library, declare signatures, init/exit the device
+               and allocate a buffer on every call, then base64 the result
+               (the previous get_attestation_doc_b64 behaviour)
+    session    one NsmSession, nonce per request (no caching)
+    cached     one NsmSession, nonce-less requests served from its cache
+
+Usage:
+    python3 benchmarks/bench_nsm_session.py --calls 2000 --threads 1 8 --delay-us 200
+"""
+import argparse
+import base64
+import ctypes
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+import mock_libnsm  # noqa: E402
+import nsm_util  # noqa: E402
+
+
+def run(fn, calls, threads):
+    per_thread = calls // threads
+
+    def worker():
+        for _ in range(per_thread):
+            fn()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--delay-us', type=int, default=200, help='mock NSM device delay per request')
+    args = parser.parse_args()
+
+    os.environ['MOCK_NSM_DELAY_US'] = str(args.delay_us)
+    path = mock_libnsm.build(os.path.join(tempfile.mkdtemp(), 'libnsm.so'))
+    if path is None:
+        sys.exit("A C compiler is needed to build the mock libnsm")
+    public_key = os.urandom(294)
+
+    def per_call():
+        session = nsm_util.NsmSession(ctypes.CDLL(path), cache_ttl=0)
+        try:
+            base64.b64encode(session.get_attestation_doc(public_key=public_key))
+        finally:
+            session.close()
+
+    session = nsm_util.NsmSession(ctypes.CDLL(path), cache_ttl=0)
+    cached = nsm_util.NsmSession(ctypes.CDLL(path), cache_ttl=30)
+    modes = [
+        ('per-call', per_call),
+        ('session', lambda: session.get_attestation_doc(public_key=public_key, nonce=os.urandom(16))),
+        ('cached', lambda: cached.get_attestation_doc(public_key=public_key)),
+    ]
+
+    print(f"{'mode':>9} {'threads':>8} {'docs/s':>10}")
+    for name, fn in modes:
+        for threads in args.threads:
+            print(f"{name:>9} {threads:>8} {run(fn, args.calls, threads):>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
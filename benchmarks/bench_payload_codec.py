@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Measure the Temporal payload codec (host/payload_codec.py) against the
+default data converter: encode + decode time and the bytes a pipeline run
+leaves in workflow history.
+
+Each case replays the payloads of one planner -> (researcher, analyst) ->
+writer pipeline (starter.py's DEFAULT_STEPS) whose input is a JSON document
+of the given size: the workflow input, every run_agent_in_enclave argument
+and result (AgentStep / EncryptedState bytes, random ciphertext of realistic
+size) and the PipelineResult. Plaintext input compresses; ciphertext does
+not, and only pays the codec's framing.
+
+Usage:
+    python3 benchmarks/bench_payload_codec.py --sizes 1K 64K 1M --codecs zlib zstd none
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'proto'))
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+
+import temporalio.converter  # noqa: E402
+import state_pb2  # noqa: E402
+from payload_codec import EncryptionCodec, data_converter  # noqa: E402
+from starter import DEFAULT_STEPS  # noqa: E402
+from workflows import Pipeline  # noqa: E402
+
+UNITS = {'K': 1024, 'M': 1024 * 1024}
+WORDS = ('patient', 'account', 'balance', 'transfer', 'summary', 'risk', 'review', 'approved', 'pending', 'region')
+
+
+def parse_size(text):
+    if text[-1].upper() in UNITS:
+        return int(text[:-1]) * UNITS[text[-1].upper()]
+    return int(text)
+
+
+def document(size):
+    """A JSON document of about `size` bytes, as compressible as typical agent input."""
+    rng = random.Random(size)
+    records, length = [], 2
+    while length < size:
+        record = {'id': len(records), 'note': ' '.join(rng.choice(WORDS) for _ in range(8)),
+                  'amount': round(rng.uniform(0, 10000), 2)}
+        records.append(record)
+        length += len(json.dumps(record)) + 2
+    return json.dumps(records)[:size]
+
+
+def encrypted_state(size, iteration):
+    return state_pb2.EncryptedState(
+        ciphertext=os.urandom(size + 40), nonce=os.urandom(12), tag=os.urandom(16),
+        workflow_id='confidential-pipeline-bench', iteration=iteration,
+    ).SerializeToString()
+
+
+def pipeline_history(size):
+    """(value, type) of every payload one pipeline run records."""
+    text = document(size)
+    planner = encrypted_state(size, 1)
+    branches = [encrypted_state(size, 2), encrypted_state(size, 2)]
+    writer = encrypted_state(2 * size, 3)
+    step = lambda agent, *inputs: state_pb2.AgentStep(agent_id=agent, inputs=inputs).SerializeToString()  # noqa: E731
+    encrypted = lambda payload: state_pb2.ProcessItem(payload=payload, encrypted=True)  # noqa: E731
+    history = [
+        (Pipeline(text, DEFAULT_STEPS), Pipeline),
+        (step('planner', state_pb2.ProcessItem(payload=text.encode(), workflow_id='wf')), bytes), (planner, bytes),
+        (step('researcher', encrypted(planner)), bytes), (branches[0], bytes),
+        (step('analyst', encrypted(planner)), bytes), (branches[1], bytes),
+        (step('writer', *map(encrypted, branches)), bytes), (writer, bytes),
+    ]
+    result = state_pb2.PipelineResult(states={'planner': planner, 'researcher': branches[0],
+                                              'analyst': branches[1], 'writer': writer})
+    history.append((result.SerializeToString(), bytes))
+    return history
+
+
+async def timed(fn, budget):
+    await fn()
+    count, start = 0, time.perf_counter()
+    while True:
+        await fn()
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget:
+            return elapsed / count
+
+
+async def measure(converter, values, types, budget):
+    """Returns (encode seconds, decode seconds, encoded history bytes) for one history."""
+    payloads = await converter.encode(values)
+    assert await converter.decode(payloads, types) == values
+    enc_t = await timed(lambda: converter.encode(values), budget)
+    dec_t = await timed(lambda: converter.decode(payloads, types), budget)
+    return enc_t, dec_t, sum(p.ByteSize() for p in payloads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['1K', '64K', '1M'])
+    parser.add_argument('--codecs', nargs='+', default=['zlib', 'zstd', 'lz4', 'none'],
+                        help='compression for the codec (unavailable ones are skipped)')
+    parser.add_argument('--budget', type=float, default=0.5, help='seconds per measurement')
+    args = parser.parse_args()
+
+    converters = [('default', temporalio.converter.default())]
+    for name in args.codecs:
+        codec = EncryptionCodec(os.urandom(32), compression=name)
+        if codec.compression.decode() not in (name, '' if name == 'none' else name):
+            print(f"skipping {name}: not installed")
+            continue
+        converters.append((f'codec/{name}', data_converter(codec)))
+
+    print(f"{'input':>6} {'converter':>12} {'encode ms':>10} {'decode ms':>10} {'history bytes':>14} {'vs default':>11}")
+    for label in args.sizes:
+        history = pipeline_history(parse_size(label))
+        values = [value for value, _ in history]
+        types = [kind for _, kind in history]
+        baseline = None
+        for name, converter in converters:
+            enc_t, dec_t, size = asyncio.run(measure(converter, values, types, args.budget))
+            baseline = baseline or size
+            print(f"{label:>6} {name:>12} {enc_t * 1e3:>10.2f} {dec_t * 1e3:>10.2f} {size:>14} "
+                  f"{(size - baseline) / baseline:>+10.1%}")
+
+
+if __name__ == '__main__':
+    main()
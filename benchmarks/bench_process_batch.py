@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark batched `process_batch` requests against one `process` request per state.
+
+Starts enclave/app.py's server on a UNIX socket stand-in with a pre-loaded
+key and pushes N small states through host/enclave_client.EnclavePool,
+either one request per state (C concurrent coroutines) or in
+`process_batch` requests of B states each.
+
+Usage:
+    python3 benchmarks/bench_process_batch.py --states 10000 --batch-sizes 1 16 64 256
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+
+import app  # noqa: E402
+from enclave_client import EnclavePool, parse_address  # noqa: E402
+import state_pb2  # noqa: E402
+
+
+def start_enclave():
+    path = os.path.join(tempfile.mkdtemp(), 'enclave.sock')
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(app.LISTEN_BACKLOG)
+    threading.Thread(target=app.serve, args=(listener,), daemon=True).start()
+    return f'unix:{path}'
+
+
+async def run_single(address, states, concurrency):
+    pool = EnclavePool(parse_address(address))
+    remaining = iter(states)
+
+    async def client():
+        for state in remaining:
+            meta, _ = await pool.request('process', {'encrypted': True}, state)
+            assert meta['status'] == 'ok'
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await pool.close()
+    return elapsed
+
+
+async def run_batched(address, states, batch_size, concurrency):
+    pool = EnclavePool(parse_address(address))
+    batches = iter([
+        state_pb2.ProcessBatch(items=[
+            state_pb2.ProcessItem(payload=state, encrypted=True) for state in states[i:i + batch_size]
+        ]).SerializeToString()
+        for i in range(0, len(states), batch_size)
+    ])
+
+    async def client():
+        for batch in batches:
+            meta, _ = await pool.request('process_batch', payload=batch)
+            assert meta['status'] == 'ok' and meta['failed'] == 0
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await pool.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--states', type=int, default=10000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16, 64, 256])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--state-bytes', type=int, default=256)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    key = os.urandom(32)
+    app.KEY_CACHE.store(key)
+    states = [
+        app.seal_state(key, state_pb2.AgentState(iteration=1, data=os.urandom(args.state_bytes)), f'wf-{i}')
+        .SerializeToString()
+        for i in range(args.states)
+    ]
+
+    results = []
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        address = start_enclave()
+        results.append(('process', 1, asyncio.run(run_single(address, states, args.concurrency))))
+        for batch_size in args.batch_sizes:
+            results.append(('batch', batch_size,
+                            asyncio.run(run_batched(address, states, batch_size, args.concurrency))))
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+
+    print(f"{'mode':>8} {'batch':>6} {'states/s':>10} {'us/state':>9}")
+    for mode, batch_size, elapsed in results:
+        print(f"{mode:>8} {batch_size:>6} {args.states / elapsed:>10.0f} {elapsed / args.states * 1e6:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Peak memory per request on the enclave's framed `process` path, relative
+to the size of the state.
+
+Runs enclave/app.py's connection handler (serve_frames) on one end of a
+socketpair. A client thread sends one `process` frame carrying an
+encrypted state of each size from a prebuilt buffer and reads the
+response into a preallocated one, so the client itself allocates almost
+nothing. Peak memory is measured with tracemalloc over the whole request
+(read, decrypt, agent step, encrypt, send) and reported in MB and as a
+multiple of the state size: 1.0x would be a single copy of the payload.
+tracemalloc sees Python-level buffers only, not memory allocated inside
+the protobuf or OpenSSL libraries.
+
+Usage:
+    python3 benchmarks/bench_request_memory.py --sizes 64K 1M 16M
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+
+import app  # noqa: E402
+from common import framing  # noqa: E402
+import state_pb2  # noqa: E402
+
+UNITS = {'K': 1024, 'M': 1024 * 1024}
+
+
+def parse_size(text):
+    if text[-1].upper() in UNITS:
+        return int(text[:-1]) * UNITS[text[-1].upper()]
+    return int(text)
+
+
+def client(sock, request, response):
+    """Send the prebuilt request and read the response frame into `response`."""
+    sock.sendall(request)
+    view = memoryview(response)
+    header = framing.recv_exactly(sock, framing.HEADER_SIZE)
+    _, _, _, meta_len, payload_len = framing.decode_header(header)
+    got = 0
+    while got < meta_len + payload_len:
+        got += sock.recv_into(view[got:meta_len + payload_len])
+    sock.shutdown(socket.SHUT_WR)
+    return meta_len, payload_len
+
+
+def run_case(key, size):
+    """(seconds, peak bytes) of one `process` request over a socketpair."""
+    state = app.seal_state(key, state_pb2.AgentState(iteration=1, data=os.urandom(size)), 'wf-bench')
+    request = b''.join(framing.encode_frame(framing.MSG_TYPES['process'], 1, {'encrypted': True},
+                                            state.SerializeToString()))
+    del state
+    response = bytearray(len(request) + 4096)
+    server_sock, client_sock = socket.socketpair()
+    for sock in (server_sock, client_sock):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    result = []
+    reader = threading.Thread(target=lambda: result.append(client(client_sock, request, response)))
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        tracemalloc.start()
+        start = time.perf_counter()
+        reader.start()
+        app.serve_frames(server_sock, executor, threading.BoundedSemaphore(1))
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    reader.join()
+    server_sock.close()
+    client_sock.close()
+    meta_len, payload_len = result[0]
+    assert payload_len > size, bytes(response[:meta_len])
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['64K', '1M', '16M'])
+    args = parser.parse_args()
+
+    app.LOG.level = app.enclave_log.WARNING
+    key = os.urandom(32)
+    app.KEY_CACHE.store(key)
+    print(f"{'size':>6} {'MB/s':>9} {'peak MB':>9} {'peak/size':>10}")
+    for label in args.sizes:
+        size = parse_size(label)
+        elapsed, peak = run_case(key, size)
+        print(f"{label:>6} {size / elapsed / 1e6:>9.0f} {peak / 1e6:>9.2f} {peak / size:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
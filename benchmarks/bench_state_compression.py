@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Size and cost of compressing states before encryption
+(enclave/state_codec.py): compression ratio, compress and decompress
+throughput, and the size after padding, for each installed compressor
+and level on representative state contents.
+
+Payloads:
+
+- `chat`: a JSON list of agent messages (the typical context);
+- `prose`: repeated natural-language text;
+- `random`: incompressible bytes (already-compressed or encrypted data);
+- `small`: a short JSON context, below or near the compression threshold.
+
+Usage:
+    python3 benchmarks/bench_state_compression.py --size 64K 1M --padding padme
+    python3 benchmarks/bench_state_compression.py --compressors zlib:1 zlib:6 zstd:3 lz4
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+
+import state_codec  # noqa: E402
+
+UNITS = {'K': 1024, 'M': 1024 * 1024}
+WORDS = ('the agent reviewed quarterly revenue forecast summary customer request policy document '
+         'analysis result pending approval workflow step context tool output').split()
+
+
+def parse_size(text):
+    if text[-1].upper() in UNITS:
+        return int(text[:-1]) * UNITS[text[-1].upper()]
+    return int(text)
+
+
+def sentence(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 20))).capitalize() + '.'
+
+
+def payload(kind, size, rng):
+    if kind == 'random':
+        return os.urandom(size)
+    if kind == 'prose':
+        text = ' '.join(sentence(rng) for _ in range(size // 60 + 1))
+        return text.encode()[:size]
+    messages = []
+    while len(json.dumps(messages)) < size:
+        messages.append({'role': rng.choice(['user', 'assistant', 'tool']), 'turn': len(messages),
+                         'content': ' '.join(sentence(rng) for _ in range(rng.randint(1, 4)))})
+    return json.dumps(messages).encode()
+
+
+def measure(codec, data, rounds):
+    """(encoded size, compress MB/s, decompress MB/s)."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        buffer, compression, padded = codec.encode(data)
+    encode_seconds = (time.perf_counter() - start) / rounds
+    start = time.perf_counter()
+    for _ in range(rounds):
+        decoded = codec.decode(buffer, compression, padded)
+    decode_seconds = (time.perf_counter() - start) / rounds
+    assert bytes(decoded) == data
+    mb = len(data) / 1e6
+    return len(buffer), mb / encode_seconds, mb / decode_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', nargs='+', default=['64K', '1M'], help='state size (K/M suffix)')
+    parser.add_argument('--compressors', nargs='+', default=['zlib:1', 'zlib:6', 'zstd:3', 'zstd:9', 'lz4'],
+                        help='name[:level]; ones not installed are skipped')
+    parser.add_argument('--padding', default='padme', help='none, padme, pow2 or a bucket size')
+    parser.add_argument('--payloads', nargs='+', default=['chat', 'prose', 'random', 'small'])
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    codecs, missing = [], set()
+    for spec in args.compressors:
+        name, _, level = spec.partition(':')
+        try:
+            state_codec.load_compressor(name)
+        except ImportError:
+            missing.add(name)
+            continue
+        codecs.append((spec, state_codec.StateCodec(name, level, threshold=0, padding=args.padding)))
+
+    rng = random.Random(0)
+    if missing:
+        print(f"not installed, skipped: {', '.join(sorted(missing))}")
+    print(f"padding: {args.padding} (`pad only`: the padded size without compression)")
+    print(f"{'payload':>8} {'size':>8} {'compressor':>10} {'ratio':>7} {'stored':>9} {'pad only':>9} "
+          f"{'comp MB/s':>10} {'decomp MB/s':>12}")
+    for kind in args.payloads:
+        for size in ([512] if kind == 'small' else [parse_size(s) for s in args.size]):
+            data = payload(kind, size, rng)
+            for spec, codec in codecs:
+                encoded, compress_rate, decompress_rate = measure(codec, data, args.rounds)
+                plain = state_codec.padded_size(len(data), args.padding) if codec.padding else len(data)
+                print(f"{kind:>8} {len(data):>8} {spec:>10} {len(data) / encoded:>7.2f} {encoded:>9} {plain:>9} "
+                      f"{compress_rate:>10.1f} {decompress_rate:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Bytes on the wire and enclave time per `process` step with delta states
+(enclave/state_delta.py) vs. full states, for an agent that appends
+`--append` bytes to its context at each step.
+
+Each case runs `--steps` chained steps through the enclave's process
+handler (enclave/app.py, in-process), keeping the chain as the host does
+(host/activities.py process_delta_state):
+
+- `full`: every step sends and returns the whole state;
+- `delta`: the enclave holds each delta's base, so only deltas travel;
+- `miss`: the enclave never holds the base (e.g. another enclave takes
+  every step), so each step is refused once and resent with its chain.
+
+Usage:
+    python3 benchmarks/bench_state_delta.py --sizes 64K 1M 8M --append 2K --steps 20
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+
+import app  # noqa: E402
+import state_pb2  # noqa: E402
+
+UNITS = {'K': 1024, 'M': 1024 * 1024}
+
+
+def parse_size(text):
+    if text[-1].upper() in UNITS:
+        return int(text[:-1]) * UNITS[text[-1].upper()]
+    return int(text)
+
+
+def run_case(mode, size, append, steps):
+    """Returns (bytes sent per step, bytes returned per step, ms per step, full states sealed)."""
+    turn = os.urandom(append)
+
+    def run_agent_step(state, req):
+        return state_pb2.AgentState(agent_id=state.agent_id, iteration=state.iteration + 1, data=state.data + turn)
+
+    app.run_agent_step = run_agent_step
+    app.CONTEXT_CACHE.clear()
+    _, body = app.handle_process({'workflow_id': 'wf-bench'}, os.urandom(size))
+    state = state_pb2.EncryptedState.FromString(bytes(body))
+    sent = returned = fulls = 0
+    start = time.perf_counter()
+    for _ in range(steps):
+        req = {'encrypted': True}
+        chain = list(state.chain)
+        state.ClearField('chain')
+        if mode != 'full':
+            deltas = chain[1:] + [state] if state.base_iteration else []
+            req.update(delta=True, delta_chain=len(deltas), delta_chain_bytes=sum(len(d.ciphertext) for d in deltas))
+        if mode == 'miss':
+            app.CONTEXT_CACHE.clear()
+        payload = state.SerializeToString()
+        response, body = app.handle_process(req, payload)
+        if response['msg'] == 'delta_base_missing':
+            sent += len(payload)
+            state.chain.extend(chain)
+            payload = state.SerializeToString()
+            state.ClearField('chain')
+            response, body = app.handle_process(req, payload)
+        assert response['status'] == 'ok', response
+        sent += len(payload)
+        returned += len(body)
+        result = state_pb2.EncryptedState.FromString(bytes(body))
+        if result.base_iteration:
+            result.chain.extend(chain + [state])
+        else:
+            fulls += 1
+        state = result
+    elapsed = time.perf_counter() - start
+    return sent / steps, returned / steps, elapsed / steps * 1000, fulls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['64K', '1M', '8M'], help='initial context size (K/M suffix)')
+    parser.add_argument('--append', default='2K', help='bytes the agent appends per step')
+    parser.add_argument('--steps', type=int, default=20)
+    args = parser.parse_args()
+
+    app.KEY_CACHE.store(os.urandom(32))
+    append = parse_size(args.append)
+    print(f"agent appends {append} bytes per step; max chain {app.state_delta.MAX_CHAIN}, "
+          f"max ratio {app.state_delta.MAX_RATIO:g}")
+    print(f"{'size':>8} {'mode':>6} {'sent/step':>12} {'returned/step':>14} {'ms/step':>9} {'full states':>12}")
+    for size in args.sizes:
+        for mode in ('full', 'delta', 'miss'):
+            sent, returned, ms, fulls = run_case(mode, parse_size(size), append, args.steps)
+            print(f"{size:>8} {mode:>6} {sent:>12.0f} {returned:>14.0f} {ms:>9.2f} {fulls:>12}")
+
+
+if __name__ == '__main__':
+    main()
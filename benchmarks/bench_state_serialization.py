@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Compare protobuf EncryptedState serialization with the legacy JSON format.
+
+The legacy path carried encrypted state as a JSON object with a base64
+`ciphertext` field (nonce || ciphertext || tag); the protobuf path
+serializes proto/state.proto's EncryptedState with raw bytes fields.
+Reports encode/decode time and encoded size per ciphertext size.
+
+Usage:
+    python3 benchmarks/bench_state_serialization.py --sizes 1K 64K 1M 16M
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'proto'))
+
+import state_pb2  # noqa: E402
+
+UNITS = {'K': 1024, 'M': 1024 * 1024}
+
+
+def parse_size(text):
+    if text[-1].upper() in UNITS:
+        return int(text[:-1]) * UNITS[text[-1].upper()]
+    return int(text)
+
+
+def json_encode(nonce, ciphertext, tag):
+    return json.dumps({
+        'status': 'ok',
+        'msg': 'processed',
+        'workflow_id': 'confidential-workflow-test-1',
+        'iteration': 1,
+        'ciphertext': base64.b64encode(nonce + ciphertext + tag).decode('utf-8'),
+    }).encode('utf-8')
+
+
+def json_decode(data):
+    state = json.loads(data.decode('utf-8'))
+    blob = base64.b64decode(state['ciphertext'])
+    return blob[:12], blob[12:-16], blob[-16:]
+
+
+def proto_encode(nonce, ciphertext, tag):
+    return state_pb2.EncryptedState(
+        ciphertext=ciphertext, nonce=nonce, tag=tag,
+        workflow_id='confidential-workflow-test-1', iteration=1,
+    ).SerializeToString()
+
+
+def proto_decode(data):
+    state = state_pb2.EncryptedState.FromString(data)
+    return state.nonce, state.ciphertext, state.tag
+
+
+def timed(fn, budget):
+    fn()
+    count, start = 0, time.perf_counter()
+    while True:
+        fn()
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget:
+            return elapsed / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['1K', '16K', '256K', '1M', '16M'])
+    parser.add_argument('--budget', type=float, default=0.3, help='seconds per measurement')
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'format':>7} {'encode us':>11} {'decode us':>11} {'bytes':>11} {'overhead':>9}")
+    for label in args.sizes:
+        size = parse_size(label)
+        nonce, ciphertext, tag = os.urandom(12), os.urandom(size), os.urandom(16)
+        for name, encode, decode in (('json', json_encode, json_decode), ('proto', proto_encode, proto_decode)):
+            encoded = encode(nonce, ciphertext, tag)
+            assert decode(encoded) == (nonce, ciphertext, tag)
+            enc_t = timed(lambda: encode(nonce, ciphertext, tag), args.budget)
+            dec_t = timed(lambda: decode(encoded), args.budget)
+            overhead = (len(encoded) - size) / size * 100
+            print(f"{label:>6} {name:>7} {enc_t * 1e6:>11.1f} {dec_t * 1e6:>11.1f} {len(encoded):>11} {overhead:>8.1f}%")
+
+
+if __name__ == '__main__':
+    main()
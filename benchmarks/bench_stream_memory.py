@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark enclave peak memory and throughput: single-shot `process` vs. `process_stream`.
+
+Runs enclave/app.py's handlers in-process with a pre-loaded key on an
+encrypted state of each size. The single-shot path decrypts and
+re-encrypts the whole state at once; the streamed path is fed one frame
+at a time (as the connection reader would) and discards each response
+segment once "sent". Peak memory is measured with tracemalloc and
+excludes the input state itself.
+
+Usage:
+    python3 benchmarks/bench_stream_memory.py --sizes 1M 16M 64M --chunk 1M
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+
+import app  # noqa: E402
+from common import framing  # noqa: E402
+import state_pb2  # noqa: E402
+
+UNITS = {'K': 1024, 'M': 1024 * 1024}
+
+
+def parse_size(text):
+    if text[-1].upper() in UNITS:
+        return int(text[:-1]) * UNITS[text[-1].upper()]
+    return int(text)
+
+
+def single_state(key, data):
+    return app.seal_state(key, state_pb2.AgentState(iteration=1, data=data), 'wf-bench').SerializeToString()
+
+
+def stream_state(aead, data, chunk):
+    encryptor = app.state_crypto.StreamEncryptor(aead, 'wf-bench', 1)
+    count = max(1, -(-len(data) // chunk))
+    segments = [encryptor.encrypt_chunk(data[i * chunk:(i + 1) * chunk], i == count - 1) for i in range(count)]
+    return encryptor.prefix, segments
+
+
+def run_single(state):
+    meta, body = app.handle_process({'encrypted': True}, state)
+    assert meta['status'] == 'ok'
+
+
+def run_stream(prefix, segments, chunk):
+    meta = {'encrypted': True, 'workflow_id': 'wf-bench', 'iteration': 1,
+            'nonce_prefix': prefix.hex(), 'chunk_size': chunk}
+    code = framing.MSG_TYPES['process_stream']
+    frames = (
+        framing.Frame(code, 1, framing.FLAG_END if i == len(segments) - 1 else 0, meta if i == 0 else {}, seg)
+        for i, seg in enumerate(segments)
+    )
+    result = {}
+
+    def respond(m, payload, end):
+        if end:
+            result.update(m)
+
+    app.process_stream(frames, respond)
+    assert result['status'] == 'ok'
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['1M', '16M', '64M'])
+    parser.add_argument('--chunk', default='1M')
+    args = parser.parse_args()
+
+    chunk = parse_size(args.chunk)
+    key = os.urandom(32)
+    app.KEY_CACHE.store(key)
+    aead = app.state_crypto.aead_for(key)
+
+    results = []
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        for label in args.sizes:
+            data = os.urandom(parse_size(label))
+            state = single_state(key, data)
+            results.append((label, 'process') + measure(lambda: run_single(state)))
+            del state
+            prefix, segments = stream_state(aead, data, chunk)
+            results.append((label, 'stream') + measure(lambda: run_stream(prefix, segments, chunk)))
+            del data, segments
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+
+    print(f"{'size':>6} {'mode':>8} {'MB/s':>9} {'peak MB':>9}")
+    for label, mode, elapsed, peak in results:
+        print(f"{label:>6} {mode:>8} {parse_size(label) / elapsed / 1e6:>9.0f} {peak / 1e6:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
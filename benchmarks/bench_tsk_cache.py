@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Compare cold vs warm `process_in_enclave` latency.
+
+Cold activities configure the enclave first (IMDS fetch + KMS decrypt), which
+is what every activity did before the enclave cached the TSK. Warm activities
+reuse the cached key. The enclave runs over a local UNIX socket; IMDS and KMS
+are replaced by sleeps of the configured latency.
+
+Usage:
+    python3 benchmarks/bench_tsk_cache.py --iterations 50 --kms-latency 0.08
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+
+import app  # noqa: E402
+import activities  # noqa: E402
+import enclave_client  # noqa: E402
+
+
+def start_enclave(kms_latency):
+    def kms_decrypt(ciphertext_b64, credentials=None, region=None):
+        time.sleep(kms_latency)
+        return (os.urandom(32), None)
+    app.kms_decrypt = kms_decrypt
+
+    path = os.path.join(tempfile.mkdtemp(), 'enclave.sock')
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(app.LISTEN_BACKLOG)
+    threading.Thread(target=app.serve, args=(listener,), daemon=True).start()
+    return path
+
+
+def stub_host(path, imds_latency):
+    async def get_kms_config():
+        # token, role and credentials round trips
+        await asyncio.sleep(3 * imds_latency)
+        return {
+            'kms_key_id': '',
+            'encrypted_tsk': 'dGVzdA==',
+            'region': 'ap-southeast-1',
+            'aws_access_key_id': 'AKIABENCHMARK',
+            'aws_secret_access_key': 'secret',
+            'aws_session_token': 'token',
+        }
+
+    enclave_client.ENCLAVE_ADDRESS = f'unix:{path}'
+    activities.get_kms_config = get_kms_config
+
+
+async def measure(iterations, sample_rate):
+    activities.ATTESTATION_SAMPLE_RATE = sample_rate
+    # Prime the host flag so warm runs start from a configured enclave
+    await activities.configure_enclave()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await activities.process_in_enclave("Sensitive Data Needs Encryption")
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--kms-latency', type=float, default=0.08, help='simulated KMS decrypt seconds')
+    parser.add_argument('--imds-latency', type=float, default=0.002, help='simulated seconds per IMDS call')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        path = start_enclave(args.kms_latency)
+        stub_host(path, args.imds_latency)
+        cold = asyncio.run(measure(args.iterations, 1.0))
+        warm = asyncio.run(measure(args.iterations, 0.0))
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+
+    print(f"{'mode':>6} {'mean ms':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for name, samples in (('cold', cold), ('warm', warm)):
+        samples.sort()
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        print(f"{name:>6} {statistics.mean(samples):>10.2f} {statistics.median(samples):>10.2f} {p99:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+"""
+Runtime modules shared by the host worker and the enclave: the frame codec
+(framing) and metrics. Generated protobuf bindings stay in proto/.
+
+The enclave image copies this package to /app/common, next to app.py; on the
+host, telemetry.py puts the repository root on sys.path for it.
+"""
@@ -0,0 +1,194 @@
+"""
+Host <-> Enclave Framing
+
+Versioned, length-prefixed binary frames shared by host/activities.py and
+enclave/app.py. Each frame is a fixed header followed by a JSON metadata
+section and a raw binary payload, so ciphertext travels without base64/JSON
+inflation:
+
+    +-------+---------+------+-------+------------+----------+-------------+
+    | magic | version | type | flags | request_id | meta_len | payload_len |
+    |  2B   |   1B    |  1B  |  2B   |     4B     |    4B    |     4B      |
+    +-------+---------+------+-------+------------+----------+-------------+
+    | meta: UTF-8 JSON object (meta_len bytes)                              |
+    | payload: raw bytes (payload_len bytes)                                |
+    +-----------------------------------------------------------------------+
+
+Integers are big-endian. The low 7 bits of `type` select the message type
+(see MSG_TYPES); the high bit marks a response. Responses echo the request id.
+Streamed messages (`process_stream`) are a run of frames sharing one request
+id, the last of which sets FLAG_END.
+"""
+
+import asyncio
+import json
+import os
+import struct
+from collections import namedtuple
+
+MAGIC = b'CS'
+VERSION = 1
+
+HEADER = struct.Struct('!2sBBHIII')
+HEADER_SIZE = HEADER.size
+
+# Upper bound on meta + payload for a single frame
+MAX_FRAME_SIZE = int(os.environ.get('ENCLAVE_MAX_FRAME_BYTES', str(64 * 1024 * 1024)))
+
+MSG_TYPES = {
+    'ping': 0x01,
+    'configure': 0x02,
+    'process': 0x03,
+    'health': 0x04,
+    'process_batch': 0x05,
+    'process_stream': 0x06,
+    'merge': 0x07,
+    'metrics': 0x08,
+    'get_logs': 0x09,
+    'rotate_keys': 0x0A,
+}
+MSG_NAMES = {code: name for name, code in MSG_TYPES.items()}
+RESPONSE_BIT = 0x80
+
+# Streamed requests/responses span several frames with the same request id;
+# FLAG_END marks the last one.
+FLAG_END = 0x0001
+
+# Payloads up to this size are sent in the same write as the header
+_COALESCE_LIMIT = 64 * 1024
+
+
+class FrameError(Exception):
+    """Raised for malformed, oversized or truncated frames."""
+
+
+class FrameBuffer(bytearray):
+    """
+    Payload of a received frame. It belongs to the request it arrived
+    with, so handlers may reuse or release it (e.g. empty it once the
+    state it carries has been decrypted).
+    """
+    __slots__ = ()
+
+
+class Frame(namedtuple('Frame', ['type_code', 'request_id', 'flags', 'meta', 'payload'])):
+    __slots__ = ()
+
+    @property
+    def name(self):
+        """Message type name, or None if the code is unknown."""
+        return MSG_NAMES.get(self.type_code & ~RESPONSE_BIT)
+
+    @property
+    def is_response(self):
+        return bool(self.type_code & RESPONSE_BIT)
+
+
+def encode_header(type_code, request_id, flags, meta_len, payload_len):
+    return HEADER.pack(MAGIC, VERSION, type_code, flags, request_id, meta_len, payload_len)
+
+
+def decode_header(buf, max_size=MAX_FRAME_SIZE):
+    """Parse a header; returns (type_code, request_id, flags, meta_len, payload_len)."""
+    magic, version, type_code, flags, request_id, meta_len, payload_len = HEADER.unpack(buf)
+    if magic != MAGIC:
+        raise FrameError(f"bad magic {magic!r}")
+    if version != VERSION:
+        raise FrameError(f"unsupported frame version {version}")
+    if meta_len + payload_len > max_size:
+        raise FrameError(f"frame of {meta_len + payload_len} bytes exceeds limit of {max_size}")
+    return type_code, request_id, flags, meta_len, payload_len
+
+
+def type_code_for(msg_type, response=False):
+    try:
+        code = MSG_TYPES[msg_type]
+    except KeyError:
+        raise FrameError(f"unknown message type {msg_type!r}")
+    return code | RESPONSE_BIT if response else code
+
+
+def encode_frame(type_code, request_id, meta=None, payload=b'', flags=0):
+    """Return the frame as a list of buffers (header + meta, payload)."""
+    meta_bytes = json.dumps(meta or {}).encode('utf-8')
+    header = encode_header(type_code, request_id, flags, len(meta_bytes), len(payload))
+    if len(payload) <= _COALESCE_LIMIT:
+        return [header + meta_bytes + bytes(payload)]
+    return [header + meta_bytes, payload]
+
+
+def sendmsg_all(sock, buffers):
+    """Write `buffers` with scatter-gather sendmsg calls (no joining copy) until all are sent."""
+    views = [memoryview(buffer).cast('B') for buffer in buffers if len(buffer)]
+    while views:
+        sent = sock.sendmsg(views)
+        while views and sent >= views[0].nbytes:
+            sent -= views.pop(0).nbytes
+        if sent:
+            views[0] = views[0][sent:]
+
+
+def send_frame(sock, type_code, request_id, meta=None, payload=b'', flags=0):
+    """Write one frame: header and metadata, then the payload straight from its buffer."""
+    meta_bytes = json.dumps(meta or {}).encode('utf-8')
+    head = encode_header(type_code, request_id, flags, len(meta_bytes), len(payload)) + meta_bytes
+    if hasattr(sock, 'sendmsg'):
+        sendmsg_all(sock, (head, payload))
+    else:
+        for part in encode_frame(type_code, request_id, meta, payload, flags):
+            sock.sendall(part)
+
+
+def recv_into_exactly(sock, view):
+    """Fill the writable buffer `view` from the socket."""
+    view = memoryview(view).cast('B')
+    pos, n = 0, view.nbytes
+    while pos < n:
+        got = sock.recv_into(view[pos:], n - pos)
+        if not got:
+            raise FrameError(f"connection closed after {pos} of {n} bytes")
+        pos += got
+
+
+def recv_exactly(sock, n, buffer_type=bytearray):
+    """Read exactly n bytes into a single preallocated buffer."""
+    buf = buffer_type(n)
+    recv_into_exactly(sock, buf)
+    return buf
+
+
+def read_frame(sock, max_size=MAX_FRAME_SIZE):
+    """
+    Read one frame from a blocking socket.
+
+    Each section is received straight into its final buffer; the payload is
+    a FrameBuffer. Returns None on a clean EOF before any header byte;
+    raises FrameError on truncation or when the frame exceeds `max_size`.
+    """
+    header = bytearray(HEADER_SIZE)
+    got = sock.recv_into(header)
+    if not got:
+        return None
+    if got < HEADER_SIZE:
+        recv_into_exactly(sock, memoryview(header)[got:])
+    type_code, request_id, flags, meta_len, payload_len = decode_header(header, max_size)
+    meta = json.loads(recv_exactly(sock, meta_len)) if meta_len else {}
+    payload = recv_exactly(sock, payload_len, FrameBuffer) if payload_len else FrameBuffer()
+    return Frame(type_code, request_id, flags, meta, payload)
+
+
+async def read_frame_async(reader, max_size=MAX_FRAME_SIZE):
+    """asyncio counterpart of read_frame for an asyncio.StreamReader."""
+    try:
+        header = await reader.readexactly(HEADER_SIZE)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise FrameError(f"connection closed after {len(e.partial)} of {HEADER_SIZE} header bytes")
+    type_code, request_id, flags, meta_len, payload_len = decode_header(header, max_size)
+    try:
+        meta = json.loads((await reader.readexactly(meta_len)).decode('utf-8')) if meta_len else {}
+        payload = await reader.readexactly(payload_len) if payload_len else b''
+    except asyncio.IncompleteReadError as e:
+        raise FrameError(f"connection closed mid-frame: {e}")
+    return Frame(type_code, request_id, flags, meta, payload)
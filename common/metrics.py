@@ -0,0 +1,173 @@
+"""
+Metrics
+
+Thread-safe counters, gauges and latency histograms shared by enclave/app.py
+and the host worker, so neither needs a metrics library (the enclave image
+ships only its requirements.txt).
+
+A Registry's snapshot() is plain JSON, which is how the enclave returns its
+metrics to the host (`metrics` message); render_prometheus() turns one or
+more snapshots into the Prometheus text exposition format.
+"""
+
+import bisect
+import contextlib
+import threading
+import time
+
+# Seconds; covers a cached-key process (sub-millisecond) up to a slow KMS call
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _samples(self):
+        with self._lock:
+            return [(dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+    def snapshot(self):
+        return {'name': self.name, 'type': self.kind, 'help': self.help,
+                'samples': [{'labels': labels, 'value': value} for labels, value in self._samples()]}
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket plus +Inf, then sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the duration of the `with` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        samples = []
+        for labels, counts in self._samples():
+            samples.append({'labels': labels, 'counts': counts[:-1], 'sum': counts[-1], 'count': sum(counts[:-1])})
+        return {'name': self.name, 'type': self.kind, 'help': self.help, 'buckets': list(self.buckets),
+                'samples': samples}
+
+
+class Registry:
+    """A set of metrics, created once at import time by the module that records them."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def snapshot(self):
+        return [metric.snapshot() for metric in self._metrics]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(sources):
+    """
+    Render snapshots as Prometheus text format.
+
+    `sources` is a list of (snapshot, extra labels) pairs, e.g. the host's
+    own registry and each enclave's metrics labelled with its address.
+    Samples of the same metric from several sources share one HELP/TYPE.
+    """
+    families = {}
+    for snapshot, extra in sources:
+        for metric in snapshot:
+            family = families.setdefault(metric['name'], {'metric': metric, 'samples': []})
+            family['samples'] += [(dict(extra or {}, **sample['labels']), sample, metric.get('buckets'))
+                                  for sample in metric['samples']]
+
+    lines = []
+    for name, family in families.items():
+        metric = family['metric']
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, sample, buckets in family['samples']:
+            if metric['type'] != 'histogram':
+                lines.append(f"{name}{_labels(labels)} {_number(sample['value'])}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + [float('inf')], sample['counts']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(dict(labels, le=_number(float(bound))))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(float(sample['sum']))}")
+            lines.append(f"{name}_count{_labels(labels)} {sample['count']}")
+    return '\n'.join(lines) + '\n'
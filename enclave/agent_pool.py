@@ -0,0 +1,189 @@
+"""
+Agent Process Pool
+
+Runs CPU-bound agent logic on several cores. The enclave server is one
+Python process, so however many request threads it has, agent code and
+protobuf work share one core under the GIL. AgentPool forks worker
+processes (one per enclave vCPU by default) that run named tasks:
+
+- the request thread takes an idle worker, copies the task's input
+  buffers (serialized, already decrypted AgentStates) into that worker's
+  shared-memory inbox and sends the task name, request metadata and
+  buffer lengths over a pipe;
+- the worker runs the task on the buffers and writes its output to its
+  shared-memory outbox, replying with the length;
+- the request thread copies the output back and the worker is idle again.
+
+Buffers larger than a worker's shared memory are sent over the pipe
+instead. The shared memory is an anonymous shared mapping created before
+the fork, so it needs no /dev/shm and is never visible to other processes.
+
+Keys never reach the workers: decryption and encryption stay in the
+server process, and the pool is started before the enclave is configured,
+so no TSK, data key or attestation key exists in memory when the workers
+are forked. For the same reason a worker that dies is not replaced (a
+process forked later would inherit the configured keys): its task fails
+with AgentPoolError, and once no worker is left, tasks run in the server
+process as they would without a pool. An exception raised by a task is
+re-raised in the caller as AgentPoolError with the worker's message.
+"""
+
+import contextlib
+import mmap
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+
+# Worker processes (`auto` = one per vCPU, 0 on a single vCPU; 0 = run agent logic in-process)
+PROCESSES = os.environ.get('ENCLAVE_AGENT_PROCESSES', 'auto')
+# Shared memory per worker and direction; larger buffers go over the pipe
+SHM_BYTES = int(os.environ.get('ENCLAVE_AGENT_SHM_BYTES', str(8 * 1024 * 1024)))
+
+
+class AgentPoolError(Exception):
+    """A task failed in, or lost, its worker process."""
+
+
+def default_processes(setting=PROCESSES):
+    """Number of worker processes for an ENCLAVE_AGENT_PROCESSES setting."""
+    if setting == 'auto':
+        cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+        return cpus if cpus > 1 else 0
+    return int(setting)
+
+
+def _worker_main(tasks, conn, inbox, outbox):
+    """Worker loop: run tasks until told to stop or the pipe closes."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        name, meta, lengths, inline = message
+        try:
+            if inline is None:
+                buffers, offset = [], 0
+                for length in lengths:
+                    buffers.append(inbox[offset:offset + length])
+                    offset += length
+            else:
+                buffers = inline
+            output = tasks[name](meta, buffers)
+            if len(output) <= len(outbox):
+                outbox[:len(output)] = output
+                reply = ('ok', len(output), None)
+            else:
+                reply = ('ok', len(output), bytes(output))
+        except Exception as e:
+            reply = ('error', f'{type(e).__name__}: {e}', None)
+        conn.send(reply)
+
+
+class _Worker:
+    def __init__(self, context, tasks, shm_bytes):
+        self.inbox = mmap.mmap(-1, shm_bytes)
+        self.outbox = mmap.mmap(-1, shm_bytes)
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(tasks, child_conn, self.inbox, self.outbox),
+                                       name='enclave-agent', daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def run(self, name, meta, buffers):
+        lengths = [len(buffer) for buffer in buffers]
+        if sum(lengths) <= len(self.inbox):
+            offset = 0
+            for buffer, length in zip(buffers, lengths):
+                self.inbox[offset:offset + length] = buffer
+                offset += length
+            self.conn.send((name, meta, lengths, None))
+        else:
+            self.conn.send((name, meta, lengths, [bytes(buffer) for buffer in buffers]))
+        status, length, inline = self.conn.recv()
+        if status != 'ok':
+            raise AgentPoolError(length)
+        return inline if inline is not None else self.outbox[:length]
+
+    def close(self):
+        # Workers forked later hold copies of this pipe, so closing it
+        # alone would not end the worker
+        with contextlib.suppress(OSError):
+            self.conn.send(None)
+        self.conn.close()
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.inbox.close()
+        self.outbox.close()
+
+
+class AgentPool:
+    """
+    Worker processes running the functions in `tasks`, each called as
+    `task(meta, buffers) -> bytes` with `meta` a picklable dict and
+    `buffers` a list of bytes. Tasks must be module-level functions
+    defined before start(); the workers are forked and inherit them.
+    """
+
+    def __init__(self, tasks, processes, shm_bytes=SHM_BYTES):
+        self.tasks = dict(tasks)
+        self.processes = processes
+        self.shm_bytes = shm_bytes
+        self._context = multiprocessing.get_context('fork')
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        for _ in range(self.processes):
+            worker = _Worker(self._context, self.tasks, self.shm_bytes)
+            self._workers.append(worker)
+            self._idle.put(worker)
+        return self
+
+    def run(self, name, meta, *buffers):
+        """Run task `name` on a worker; blocks until one is idle and the task completes."""
+        worker = self._idle.get()
+        if worker is None:
+            # No workers left: pass the marker on and run here
+            self._idle.put(None)
+            return self.tasks[name](meta, [bytes(buffer) for buffer in buffers])
+        try:
+            output = worker.run(name, meta, buffers)
+        except (EOFError, OSError):
+            self._retire(worker)
+            raise AgentPoolError(f"Agent worker exited running {name}")
+        except BaseException:
+            self._idle.put(worker)
+            raise
+        self._idle.put(worker)
+        return output
+
+    def _retire(self, worker):
+        with self._lock:
+            worker.close()
+            self._workers.remove(worker)
+            if not self._workers:
+                self._idle.put(None)
+
+    @property
+    def alive(self):
+        return len(self._workers)
+
+    def close(self):
+        with self._lock:
+            for worker in self._workers:
+                worker.close()
+            self._workers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,17 +1,63 @@
 import json
 import os
+import queue
 import socket
-import subprocess
 import base64
+import contextlib
 import sys
-import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
-# Standard IO buffering
-# We use explicit flush=True in prints
+# common/ and the proto/ bindings sit next to app.py in the image; locally
+# they are in the repository root
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path[:0] = [_ROOT, os.path.join(_ROOT, 'proto')]
+from common import framing, metrics
+import state_pb2
+import state_crypto
+import state_codec
+import state_delta
+import enclave_log
+import agent_pool
+import kms_client
+import nsm_util
+from google.protobuf.message import DecodeError
 
-print("[ENCLAVE] Starting Full Logic App (Debian)...", flush=True)
+# Logging goes through a ring buffer drained to the console by a background
+# thread (see enclave_log.py); `get_logs` returns the buffered records
+LOG = enclave_log.EnclaveLog()
+LOG.info("Starting Full Logic App (Debian)")
+
+# Server Settings
+VSOCK_PORT = int(os.environ.get('ENCLAVE_PORT', '5000'))
+# Listen address: vsock on VSOCK_PORT, or `tcp:<host>:<port>` / `unix:<path>`
+# to run the server off-Nitro (see tests/simulator.py)
+LISTEN_ADDRESS = os.environ.get('ENCLAVE_LISTEN', '')
+# Requests executed concurrently (across all connections)
+MAX_WORKERS = int(os.environ.get('ENCLAVE_MAX_WORKERS', '8'))
+# Open connections; further accepts wait for a free slot
+MAX_CONNECTIONS = int(os.environ.get('ENCLAVE_MAX_CONNECTIONS', '64'))
+# Kernel accept queue; sized so bursts from several workers are not refused
+LISTEN_BACKLOG = int(os.environ.get('ENCLAVE_LISTEN_BACKLOG', '128'))
+# Chunks of a streamed request buffered ahead of processing; the reader
+# stops reading the connection (pushing back on the host) when full
+STREAM_QUEUE_DEPTH = int(os.environ.get('ENCLAVE_STREAM_QUEUE_DEPTH', '2'))
+# Streamed requests open at once (across all connections), each on its own
+# thread rather than a request worker; further streams are refused (`busy`)
+MAX_STREAMS = int(os.environ.get('ENCLAVE_MAX_STREAMS', '8'))
+
+# Key Lifecycle
+# The decrypted TSK is cached until it expires or its use budget is spent;
+# the host then reconfigures (one KMS round trip) instead of on every request.
+KEY_TTL_SECONDS = int(os.environ.get('ENCLAVE_KEY_TTL_SECONDS', '3600'))  # 0 = no expiry
+KEY_MAX_USES = int(os.environ.get('ENCLAVE_KEY_MAX_USES', '0'))  # 0 = unlimited
+# States are encrypted under data keys derived from the TSK (see
+# state_crypto.DataKeys): one per workflow, per workflow and agent, or
+# 'none' to use the TSK directly
+DATA_KEY_SCOPE = os.environ.get('ENCLAVE_DATA_KEY_SCOPE', 'workflow')
+DATA_KEY_CACHE_SIZE = int(os.environ.get('ENCLAVE_DATA_KEY_CACHE', '1024'))
 
 # Global State
 CREDENTIALS = {
@@ -19,152 +65,1166 @@ CREDENTIALS = {
     'sk': None,
     'token': None
 }
-ENCRYPTION_KEY = None # 32-byte TSK
 
-def kms_decrypt(ciphertext_b64):
-    print(f"[ENCLAVE] Decrypting ciphertext len={len(ciphertext_b64)}", flush=True)
+# Guards CREDENTIALS. Never held across the KMS call.
+STATE_LOCK = threading.Lock()
+# Serialises configure requests so concurrent callers don't race KMS
+CONFIGURE_LOCK = threading.Lock()
+
+# Metrics, returned to the host by the `metrics` message
+METRICS = metrics.Registry()
+REQUESTS = METRICS.counter('enclave_requests_total', 'Requests handled, by message type and status', ('type', 'status'))
+REQUEST_SECONDS = METRICS.histogram('enclave_request_seconds', 'Time spent handling a request, by message type', ('type',))
+PHASE_SECONDS = METRICS.histogram(
+    'enclave_phase_seconds',
+    'Time per phase: queue (waiting for a worker), kms_decrypt, attestation, decrypt, decompress, rebuild, agent, '
+    'delta, compress, encrypt, send',
+    ('phase',))
+IN_FLIGHT = METRICS.gauge('enclave_requests_in_flight', 'Requests being handled')
+CONNECTIONS = METRICS.gauge('enclave_connections', 'Open host connections')
+
+# Phase durations of the request being handled on this thread, when the
+# host asked for them (see dispatch)
+_timings = threading.local()
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Time one phase of request handling into PHASE_SECONDS (and the request's timings, if traced)."""
+    start = time.perf_counter()
     try:
-        cmd = [
-            '/usr/bin/kmstool_enclave_cli', 'decrypt',
-            '--region', 'ap-southeast-1',
-            '--proxy-port', '8000',
-            '--aws-access-key-id', CREDENTIALS['ak'],
-            '--aws-secret-access-key', CREDENTIALS['sk'],
-            '--aws-session-token', CREDENTIALS['token'],
-            '--ciphertext', ciphertext_b64
-        ]
-        
-        # Enable Trace logging to potentially capture attestation doc
-        env = os.environ.copy()
-        env['AWS_COMMON_RUNTIME_LOG_LEVEL'] = 'Trace'
-        
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, check=True, env=env
-        )
-        
-        stdout = result.stdout.strip()
-        
-        # Parse PLAINTEXT: <base64>
-        marker = "PLAINTEXT:"
-        if marker in stdout:
-            payload = stdout.split(marker, 1)[1].strip()
-            return (base64.b64decode(payload), None)
-        return (base64.b64decode(stdout), None)
-
-
-    except subprocess.CalledProcessError as e:
-        err_msg = e.stderr.strip()
-        print(f"[ERROR] KMS Tool Failed: {err_msg}", flush=True)
-        return (None, err_msg, "")
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        PHASE_SECONDS.observe(elapsed, phase=name)
+        timings = getattr(_timings, 'current', None)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+class KeyCache:
+    """
+    Thread-safe holder for the decrypted TSK (32 bytes).
+
+    The key is dropped once `ttl_seconds` have passed since it was stored or
+    after `max_uses` acquisitions, whichever comes first. A dropped key
+    reports `key_expired` (rather than `not_configured`) so the host knows a
+    reconfigure is due.
+    """
+
+    def __init__(self, ttl_seconds=KEY_TTL_SECONDS, max_uses=KEY_MAX_USES):
+        self.ttl_seconds = ttl_seconds
+        self.max_uses = max_uses
+        self._lock = threading.Lock()
+        self._key = None
+        self._stored_at = None
+        self._uses = 0
+        self._expired = False
+
+    def store(self, key):
+        with self._lock:
+            self._key = key
+            self._stored_at = time.monotonic()
+            self._uses = 0
+            self._expired = False
+
+    def clear(self):
+        with self._lock:
+            self._key = None
+            self._stored_at = None
+            self._expired = False
+
+    def _status_locked(self):
+        if self._key is not None:
+            if self.ttl_seconds and time.monotonic() - self._stored_at >= self.ttl_seconds:
+                self._key = None
+                self._expired = True
+            elif self.max_uses and self._uses >= self.max_uses:
+                self._key = None
+                self._expired = True
+        if self._key is not None:
+            return 'ok'
+        return 'key_expired' if self._expired else 'not_configured'
+
+    def acquire(self):
+        """Return (key, status), consuming one use of the budget when status is 'ok'."""
+        with self._lock:
+            status = self._status_locked()
+            if status != 'ok':
+                return None, status
+            self._uses += 1
+            return self._key, status
+
+    def peek(self):
+        """Return the key without consuming a use, or None."""
+        with self._lock:
+            return self._key if self._status_locked() == 'ok' else None
+
+    def describe(self):
+        with self._lock:
+            status = self._status_locked()
+            info = {"key_status": status}
+            if status == 'ok':
+                if self.ttl_seconds:
+                    info["key_expires_in"] = round(self.ttl_seconds - (time.monotonic() - self._stored_at), 3)
+                if self.max_uses:
+                    info["key_uses_remaining"] = self.max_uses - self._uses
+            return info
+
+
+KEY_CACHE = KeyCache()
+DATA_KEYS = state_crypto.DataKeys(DATA_KEY_SCOPE, DATA_KEY_CACHE_SIZE)
+# Optional compression and padding of states before encryption (see state_codec.py)
+STATE_CODEC = state_codec.StateCodec()
+if state_codec.STATE_COMPRESSION not in ('', 'none', STATE_CODEC.compression):
+    LOG.warning("State compressor not installed, using zlib", requested=state_codec.STATE_COMPRESSION)
+# Bases of the delta states sealed here (see state_delta.py)
+CONTEXT_CACHE = state_delta.ContextCache()
+
+
+def get_encryption_key():
+    return KEY_CACHE.peek()
+
+
+_kms_backend = None
+_kms_backend_lock = threading.Lock()
+
+
+def get_kms_backend():
+    """The process-wide KMS backend (ENCLAVE_KMS_BACKEND), created on first use."""
+    global _kms_backend
+    with _kms_backend_lock:
+        if _kms_backend is None:
+            _kms_backend = kms_client.make_backend()
+        return _kms_backend
+
+
+def kms_decrypt(ciphertext_b64, credentials=None, region=kms_client.DEFAULT_REGION):
+    LOG.debug("Decrypting ciphertext", length=len(ciphertext_b64))
+    if credentials is None:
+        with STATE_LOCK:
+            credentials = dict(CREDENTIALS)
+    try:
+        with phase('kms_decrypt'):
+            return (get_kms_backend().decrypt(ciphertext_b64, credentials, region), None)
+    except kms_client.KmsError as e:
+        err_msg = str(e)
+        LOG.error("KMS decrypt failed", error=err_msg)
+        return (None, err_msg)
     except Exception as e:
         err_msg = str(e)
-        print(f"[ERROR] KMS Decrypt Exception: {err_msg}", flush=True)
-        return (None, err_msg, "")
+        LOG.error("KMS decrypt exception", error=err_msg)
+        return (None, err_msg)
+
+
+# Handlers take the request metadata and raw payload bytes and return a
+# (response, payload) pair.
+
+def handle_ping(req, payload):
+    return {"status": "ok", "msg": "pong"}, b''
+
+
+def handle_configure(req, payload):
+    # Validate required fields
+    required_fields = ['aws_access_key_id', 'aws_secret_access_key', 'aws_session_token', 'encrypted_tsk']
+    missing = [f for f in required_fields if not req.get(f)]
+
+    if missing:
+        LOG.warning("Configure missing required fields", missing=missing)
+        return {"status": "error", "msg": "missing_fields", "details": f"Required: {missing}"}, b''
+
+    with CONFIGURE_LOCK:
+        credentials = {
+            'ak': req.get('aws_access_key_id'),
+            'sk': req.get('aws_secret_access_key'),
+            'token': req.get('aws_session_token'),
+        }
+        with STATE_LOCK:
+            CREDENTIALS.update(credentials)
+        tsk_b64 = req.get('encrypted_tsk')
+
+        LOG.info("Configuring: decrypting TSK with KMS attestation", ak=credentials['ak'][:10] + '...',
+                 tsk_length=len(tsk_b64))
+
+        # Attestation provided implicitly via KMS Decryption success
+        # (KMS only decrypts if PCR0 matches)
+        tsk_bytes, err_details = kms_decrypt(tsk_b64, credentials, req.get('region') or kms_client.DEFAULT_REGION)
+        if not tsk_bytes:
+            return {"status": "error", "msg": "kms_decrypt_failed", "details": err_details}, b''
+
+        KEY_CACHE.store(tsk_bytes)
+        if req.get('data_key_generation'):
+            DATA_KEYS.advance(int(req['data_key_generation']), int(req.get('data_key_min_generation') or 0))
+
+    LOG.info("Enclave configured", key_length=len(tsk_bytes))
+
+    with phase('attestation'):
+        attestation_doc, attestation_err = nsm_util.get_attestation_doc_b64()
+    return {
+        "status": "ok",
+        "msg": "configured",
+        "timestamp": datetime.utcnow().isoformat(),
+        "attestation_document": attestation_doc,
+        "attestation_error": attestation_err,
+        **KEY_CACHE.describe()
+    }, b''
+
+
+def run_agent_step(state, req):
+    """
+    Agent logic, run on a decrypted AgentState. Returns the new AgentState.
+
+    The POC agent passes `data` through unchanged and advances the iteration.
+    """
+    return state_pb2.AgentState(
+        agent_id=req.get('agent_id') or state.agent_id,
+        iteration=state.iteration + 1,
+        data=state.data,
+        timestamp=int(time.time() * 1000),
+    )
+
+
+def run_agent_merge(states, req):
+    """
+    Agent logic for a pipeline join: combine the decrypted AgentStates of
+    several upstream agents into the joining agent's new AgentState.
+
+    The POC agent concatenates their data in input order and continues from
+    the furthest iteration.
+    """
+    return state_pb2.AgentState(
+        agent_id=req.get('agent_id', ''),
+        iteration=max(state.iteration for state in states) + 1,
+        data=b''.join(state.data for state in states),
+        timestamp=int(time.time() * 1000),
+    )
+
+
+def run_agent_chunk(chunk, req):
+    """
+    Agent logic for streamed states, run on one decrypted chunk of AgentState.data.
+
+    Streamed agents only see one chunk at a time and must return output of
+    the same length. The POC agent passes data through unchanged.
+    """
+    return chunk
+
+
+def _agent_step_task(req, buffers):
+    return run_agent_step(state_pb2.AgentState.FromString(buffers[0]), req).SerializeToString()
+
+
+def _agent_merge_task(req, buffers):
+    return run_agent_merge([state_pb2.AgentState.FromString(buffer) for buffer in buffers], req).SerializeToString()
+
+
+# Agent logic run in the worker processes of AGENT_POOL (see agent_pool.py),
+# on decrypted, serialized AgentStates
+AGENT_TASKS = {'step': _agent_step_task, 'merge': _agent_merge_task}
+# Set by start_agent_pool(); None runs agent logic on the request thread
+AGENT_POOL = None
+
+
+def start_agent_pool(processes=None):
+    """Fork the agent worker processes; call before the enclave is configured so they hold no keys."""
+    global AGENT_POOL
+    processes = agent_pool.default_processes() if processes is None else processes
+    if processes:
+        AGENT_POOL = agent_pool.AgentPool(AGENT_TASKS, processes).start()
+        LOG.info("Agent processes started", processes=processes)
+    return AGENT_POOL
+
+
+def agent_step(state, req):
+    """run_agent_step, on an agent worker process when the pool is running."""
+    if AGENT_POOL is None:
+        return run_agent_step(state, req)
+    return state_pb2.AgentState.FromString(AGENT_POOL.run('step', req, state.SerializeToString()))
+
+
+def agent_merge(states, req):
+    """run_agent_merge, on an agent worker process when the pool is running."""
+    if AGENT_POOL is None:
+        return run_agent_merge(states, req)
+    return state_pb2.AgentState.FromString(
+        AGENT_POOL.run('merge', req, *(state.SerializeToString() for state in states)))
+
+
+# Serialized EncryptedStates are built and read in place, in the layout
+# SerializeToString produces: ciphertext (field 1), nonce (2) and tag (3)
+# first, then the remaining fields
+_NONCE_FIELD = bytes([2 << 3 | 2, state_crypto.NONCE_SIZE])
+_TAG_FIELD = bytes([3 << 3 | 2, state_crypto.TAG_SIZE])
+_SEALED_TRAILER = len(_NONCE_FIELD) + state_crypto.NONCE_SIZE + len(_TAG_FIELD) + state_crypto.TAG_SIZE
+
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _locate_sealed(buffer):
+    """
+    Offsets (ciphertext start, ciphertext end) of a serialized EncryptedState
+    in the canonical layout, or None if it is laid out differently.
+    """
+    if len(buffer) < 2 or buffer[0] != 1 << 3 | 2:
+        return None
+    length, shift, pos = 0, 0, 1
+    while pos < len(buffer) and shift < 64:
+        length |= (buffer[pos] & 0x7f) << shift
+        shift += 7
+        pos += 1
+        if not buffer[pos - 1] & 0x80:
+            break
+    else:
+        return None
+    end = pos + length
+    if end + _SEALED_TRAILER > len(buffer):
+        return None
+    if buffer[end:end + 2] != _NONCE_FIELD or buffer[end + 14:end + 16] != _TAG_FIELD:
+        return None
+    return pos, end
+
+
+def state_encoding(compression, padded, base_iteration=0):
+    """Associated data suffix for a state's encoding (see state_codec.encoding) and delta base, if any."""
+    encoding = state_codec.encoding(compression, padded)
+    return f"{encoding}|delta:{base_iteration}" if base_iteration else encoding
+
+
+def seal_state_buffer(key, state, workflow_id, delta=None, base_iteration=0):
+    """
+    Encrypt an AgentState into a serialized EncryptedState bound to
+    workflow_id and state.iteration, in a single new buffer.
+
+    The state is sealed under the current data key derived from the TSK
+    `key`, whose id is stored with it, after STATE_CODEC compresses and
+    pads it. With `delta` (a ContextDelta of `state` against its data at
+    base_iteration) the delta is sealed instead of the full state. The
+    ciphertext is written straight into the returned buffer rather than
+    copied into a message and serialized again; the bytes are those
+    SerializeToString would produce.
+    """
+    key_id = DATA_KEYS.new_key_id(state.agent_id)
+    with phase('compress'):
+        plaintext, compression, padded = STATE_CODEC.encode((delta or state).SerializeToString())
+    encoding = state_encoding(compression, padded, base_iteration)
+    rest = state_pb2.EncryptedState(workflow_id=workflow_id, iteration=state.iteration, key_id=key_id,
+                                    compression=compression, padded=padded, base_iteration=base_iteration)
+    rest = rest.SerializeToString()
+    prefix = bytes([1 << 3 | 2]) + _varint(len(plaintext))
+    end = len(prefix) + len(plaintext)
+
+    buffer = bytearray(end + _SEALED_TRAILER + len(rest))
+    buffer[:len(prefix)] = prefix
+    with phase('encrypt'):
+        aead = DATA_KEYS.aead(key, workflow_id, key_id)
+        with memoryview(buffer) as view:
+            # Encrypt as ciphertext || tag, then move the tag past the nonce
+            nonce = state_crypto.encrypt_into(aead, plaintext, workflow_id, state.iteration,
+                                              view[len(prefix):end + state_crypto.TAG_SIZE], encoding)
+            view[end + 16:end + 32] = view[end:end + 16]
+    buffer[end:end + 16] = _NONCE_FIELD + nonce + _TAG_FIELD
+    buffer[end + _SEALED_TRAILER:] = rest
+    return buffer
+
+
+def seal_state(key, state, workflow_id):
+    """Like seal_state_buffer, but return the EncryptedState message."""
+    return state_pb2.EncryptedState.FromString(seal_state_buffer(key, state, workflow_id))
+
+
+def _agent_state(plaintext, encrypted, legacy):
+    if encrypted.compression or encrypted.padded:
+        with phase('decompress'):
+            plaintext = STATE_CODEC.decode(plaintext, encrypted.compression, encrypted.padded)
+    if encrypted.base_iteration:
+        return state_pb2.ContextDelta.FromString(plaintext)
+    if legacy:
+        return state_pb2.AgentState(iteration=encrypted.iteration, data=bytes(plaintext))
+    return state_pb2.AgentState.FromString(plaintext)
+
+
+def open_state(key, encrypted, legacy=False):
+    """
+    Decrypt an EncryptedState into an AgentState (a ContextDelta for a
+    delta, see rebuild_state); raises InvalidTag, KeyRetired, DecodeError
+    or StateCodecError.
+
+    `legacy` states (converted by the host from the earlier JSON format)
+    hold raw data rather than a serialized AgentState.
+    """
+    with phase('decrypt'):
+        aead = DATA_KEYS.aead(key, encrypted.workflow_id, encrypted.key_id)
+        plaintext = state_crypto.decrypt_parts(
+            aead, encrypted.nonce, encrypted.ciphertext, encrypted.tag, encrypted.workflow_id, encrypted.iteration,
+            state_encoding(encrypted.compression, encrypted.padded, encrypted.base_iteration))
+    return _agent_state(plaintext, encrypted, legacy)
+
+
+def parse_state_buffer(payload):
+    """
+    Parse a serialized EncryptedState; returns (EncryptedState, offsets).
+
+    When `payload` is a bytearray (a received frame) in the canonical
+    layout, the message holds every field but ciphertext, nonce and tag,
+    and `offsets` locates them for open_state_buffer, so the ciphertext is
+    never copied. Otherwise the whole message is parsed and offsets is None.
+    Raises DecodeError.
+    """
+    offsets = _locate_sealed(payload) if isinstance(payload, bytearray) else None
+    if offsets:
+        with memoryview(payload) as view:
+            encrypted = state_pb2.EncryptedState.FromString(view[offsets[1] + _SEALED_TRAILER:])
+        # Any repeated field would override the ones located
+        if not (encrypted.ciphertext or encrypted.nonce or encrypted.tag):
+            return encrypted, offsets
+    return state_pb2.EncryptedState.FromString(payload), None
+
+
+def open_state_buffer(key, payload, encrypted, offsets, legacy=False):
+    """
+    Decrypt the state parsed by parse_state_buffer into an AgentState.
+
+    With offsets, the ciphertext is decrypted where it lies in `payload`:
+    the tag is moved next to the ciphertext for the call and put back
+    afterwards, so the buffer is unchanged. A received frame's payload
+    (framing.FrameBuffer) is emptied instead, releasing its memory before
+    the next state is built.
+    """
+    if offsets is None:
+        return open_state(key, encrypted, legacy)
+    start, end = offsets
+    with phase('decrypt'):
+        aead = DATA_KEYS.aead(key, encrypted.workflow_id, encrypted.key_id)
+        with memoryview(payload) as view:
+            nonce_field = bytes(view[end:end + 16])
+            view[end:end + 16] = view[end + 16:end + 32]
+            try:
+                plaintext = state_crypto.decrypt_view(
+                    aead, nonce_field[2:14], view[start:end + 16], encrypted.workflow_id, encrypted.iteration,
+                    state_encoding(encrypted.compression, encrypted.padded, encrypted.base_iteration))
+            finally:
+                view[end + 16:end + 32] = view[end:end + 16]
+                view[end:end + 16] = nonce_field
+        if isinstance(payload, framing.FrameBuffer):
+            del payload[:]
+    return _agent_state(plaintext, encrypted, legacy)
+
+
+class DeltaBaseMissing(Exception):
+    """A delta's base is not cached and the state carries no chain to rebuild it from."""
+
+
+def _apply_delta(base, delta):
+    with phase('rebuild'):
+        state = state_pb2.AgentState()
+        state.CopyFrom(delta.state)
+        state.data = state_delta.apply_patch(base, delta.patch)
+    return state
+
+
+def _replay_chain(key, encrypted):
+    """Data of a delta's base, rebuilt from its chain: a full state, then the deltas after it."""
+    state = None
+    for link in encrypted.chain:
+        if link.workflow_id != encrypted.workflow_id or link.chain or link.chunk_size:
+            raise state_delta.DeltaError("Chain holds a state of another workflow, or a streamed or nested one")
+        opened = open_state(key, link)
+        if state is None:
+            if link.base_iteration:
+                raise state_delta.DeltaError("Chain does not start with a full state")
+            state = opened
+        elif link.base_iteration != state.iteration or opened.base_sha256 != state_delta.context_digest(state.data):
+            raise state_delta.DeltaError("Chain is out of order")
+        else:
+            state = _apply_delta(state.data, opened)
+    if state is None or state.iteration != encrypted.base_iteration:
+        raise state_delta.DeltaError("Chain does not end at the delta's base")
+    return state.data
+
+
+def rebuild_state(key, encrypted, opened):
+    """
+    AgentState of a state opened by open_state: `opened` itself, or for a
+    delta its patch applied to the base, from CONTEXT_CACHE or else rebuilt
+    from the state's chain. Raises DeltaBaseMissing, DeltaError, or what
+    open_state raises for a state of the chain.
+    """
+    if not encrypted.base_iteration:
+        return opened
+    base = CONTEXT_CACHE.get(encrypted.workflow_id, encrypted.base_iteration, opened.base_sha256)
+    if base is None:
+        if not encrypted.chain:
+            raise DeltaBaseMissing()
+        base = _replay_chain(key, encrypted)
+        if state_delta.context_digest(base) != opened.base_sha256:
+            raise state_delta.DeltaError("Chain does not end at the delta's base")
+    return _apply_delta(base, opened)
+
+
+def seal_next_state(key, req, workflow_id, previous, state):
+    """
+    Seal the agent's new state, as a delta against `previous` when the
+    host asked for deltas (`delta`) and state_delta.use_delta() favours one
+    given the deltas it holds (`delta_chain`, `delta_chain_bytes`).
+    """
+    if not (req.get('delta') and previous.iteration and CONTEXT_CACHE.max_bytes):
+        return seal_state_buffer(key, state, workflow_id)
+    with phase('delta'):
+        patch = state_delta.make_patch(previous.data, state.data)
+    chain_length, chain_bytes = int(req.get('delta_chain') or 0), int(req.get('delta_chain_bytes') or 0)
+    if not state_delta.use_delta(len(patch), len(state.data), chain_length, chain_bytes):
+        return seal_state_buffer(key, state, workflow_id)
+    digest = CONTEXT_CACHE.put(workflow_id, previous.iteration, previous.data)
+    if digest is None:
+        return seal_state_buffer(key, state, workflow_id)
+    delta = state_pb2.ContextDelta(
+        state=state_pb2.AgentState(agent_id=state.agent_id, iteration=state.iteration, timestamp=state.timestamp),
+        base_sha256=digest,
+        patch=patch,
+    )
+    return seal_state_buffer(key, state, workflow_id, delta, base_iteration=previous.iteration)
+
+
+def process_state(key, req, payload):
+    """
+    Decrypt one incoming state, run the agent step and re-encrypt the result.
+
+    With `encrypted: true` the payload is a serialized EncryptedState from a
+    previous step (possibly a delta, see rebuild_state); otherwise it is
+    initial plaintext input, which starts a new AgentState for
+    `workflow_id`. Returns (response, payload) where the payload is the
+    serialized EncryptedState of the next iteration, under a fresh nonce
+    (see seal_next_state).
+    """
+    if req.get('encrypted'):
+        try:
+            encrypted, offsets = parse_state_buffer(payload)
+            workflow_id = encrypted.workflow_id
+            if encrypted.chunk_size:
+                return {"status": "error", "msg": "stream_required", "details": "Streamed state; use process_stream"}, b''
+            state = open_state_buffer(key, payload, encrypted, offsets, legacy=bool(req.get('legacy')))
+            state = rebuild_state(key, encrypted, state)
+        except DecodeError:
+            LOG.warning("Malformed encrypted state")
+            return {"status": "error", "msg": "invalid_state", "details": "Payload is not an EncryptedState"}, b''
+        except DeltaBaseMissing:
+            return {"status": "error", "msg": "delta_base_missing",
+                    "details": f"Base iteration {encrypted.base_iteration} is not cached; send the state's chain"}, b''
+        except (state_codec.StateCodecError, state_delta.DeltaError) as e:
+            LOG.warning("State decoding failed", workflow_id=workflow_id, error=e)
+            return {"status": "error", "msg": "invalid_state", "details": str(e)}, b''
+        except state_crypto.InvalidTag:
+            LOG.warning("State authentication failed", workflow_id=workflow_id)
+            return {"status": "error", "msg": "decrypt_failed", "details": "Ciphertext, workflow or iteration mismatch"}, b''
+        except state_crypto.KeyRetired:
+            return {"status": "error", "msg": "key_retired", "details": f"Key {encrypted.key_id} was retired"}, b''
+    else:
+        workflow_id = str(req.get('workflow_id', ''))
+        state = state_pb2.AgentState(agent_id=req.get('agent_id', ''), iteration=0, data=bytes(payload))
+
+    previous = state
+    with phase('agent'):
+        state = agent_step(state, req)
+    result = seal_next_state(key, req, workflow_id, previous, state)
+
+    return {
+        "status": "ok",
+        "msg": "processed",
+        "workflow_id": workflow_id,
+        "iteration": state.iteration,
+        "timestamp": datetime.utcnow().isoformat()
+    }, result
+
+
+def handle_process(req, payload):
+    key, key_status = KEY_CACHE.acquire()
+    if not key:
+        LOG.warning("Cannot process", status=key_status)
+        return {"status": "error", "msg": key_status, "details": "Call configure first"}, b''
+
+    response, body = process_state(key, req, payload)
+    if response["status"] == "ok":
+        LOG.debug("Processing complete", workflow_id=response["workflow_id"], iteration=response["iteration"])
+    return response, body
+
+
+def handle_process_batch(req, payload):
+    """
+    Process every item of a serialized ProcessBatch in one visit.
+
+    The key is acquired once for the whole batch (one use of its budget).
+    Items succeed or fail independently; the response payload is a
+    ProcessBatchResult with one result per item, in request order.
+    """
+    key, key_status = KEY_CACHE.acquire()
+    if not key:
+        LOG.warning("Cannot process batch", status=key_status)
+        return {"status": "error", "msg": key_status, "details": "Call configure first"}, b''
 
-def run_server():
-    global ENCRYPTION_KEY
-    cid = socket.VMADDR_CID_ANY
-    port = 5000
-    
     try:
-        s = socket.socket(socket.AF_VSOCK, socket.SOCK_STREAM)
-        s.bind((cid, port))
-        s.listen(5)
-        print(f"[ENCLAVE] Listening on {cid}:{port}", flush=True)
-    except Exception as e:
-        print(f"[FATAL] Bind failed: {e}", flush=True)
+        batch = state_pb2.ProcessBatch.FromString(bytes(payload))
+    except DecodeError:
+        LOG.warning("Malformed batch")
+        return {"status": "error", "msg": "invalid_batch", "details": "Payload is not a ProcessBatch"}, b''
+
+    results = state_pb2.ProcessBatchResult()
+    failed = 0
+    for item in batch.items:
+        item_req = {
+            "encrypted": item.encrypted,
+            "legacy": item.legacy,
+            "workflow_id": item.workflow_id,
+            "agent_id": item.agent_id,
+        }
+        try:
+            response, body = process_state(key, item_req, item.payload)
+        except Exception as e:
+            LOG.error("Batch item failed", error=e)
+            response, body = {"status": "error", "msg": "internal_error"}, b''
+        if response["status"] != "ok":
+            failed += 1
+        results.results.add(
+            status=response["status"],
+            msg=response["msg"],
+            details=response.get("details", ""),
+            payload=bytes(body),
+            iteration=response.get("iteration", 0),
+        )
+
+    LOG.debug("Batch processed", items=len(batch.items), failed=failed)
+    return {
+        "status": "ok",
+        "msg": "processed",
+        "items": len(batch.items),
+        "failed": failed,
+        "timestamp": datetime.utcnow().isoformat()
+    }, results.SerializeToString()
+
+
+def handle_merge(req, payload):
+    """
+    Fan-in for pipelines: merge the encrypted outputs of several agents into one state.
+
+    The payload is a ProcessBatch of EncryptedStates of one workflow; the
+    response payload is the EncryptedState produced by the joining agent
+    (`agent_id`) from all of them.
+    """
+    key, key_status = KEY_CACHE.acquire()
+    if not key:
+        LOG.warning("Cannot merge", status=key_status)
+        return {"status": "error", "msg": key_status, "details": "Call configure first"}, b''
+
+    try:
+        batch = state_pb2.ProcessBatch.FromString(bytes(payload))
+        encrypted = [state_pb2.EncryptedState.FromString(item.payload) for item in batch.items]
+    except DecodeError:
+        LOG.warning("Malformed merge request")
+        return {"status": "error", "msg": "invalid_state", "details": "Payload is not a ProcessBatch of EncryptedStates"}, b''
+    if not encrypted or not all(item.encrypted for item in batch.items):
+        return {"status": "error", "msg": "invalid_state", "details": "Merge needs one or more encrypted states"}, b''
+    workflow_ids = {state.workflow_id for state in encrypted}
+    if len(workflow_ids) != 1:
+        return {"status": "error", "msg": "workflow_mismatch", "details": "States belong to different workflows"}, b''
+    if any(state.chunk_size for state in encrypted):
+        return {"status": "error", "msg": "unsupported_state", "details": "Streamed states cannot be merged"}, b''
+    if any(state.base_iteration for state in encrypted):
+        return {"status": "error", "msg": "unsupported_state", "details": "Delta states cannot be merged"}, b''
+
+    try:
+        states = [open_state(key, state, legacy=item.legacy) for item, state in zip(batch.items, encrypted)]
+    except DecodeError:
+        return {"status": "error", "msg": "invalid_state", "details": "Payload is not an EncryptedState"}, b''
+    except state_codec.StateCodecError as e:
+        return {"status": "error", "msg": "invalid_state", "details": str(e)}, b''
+    except state_crypto.InvalidTag:
+        LOG.warning("State authentication failed", workflow_id=next(iter(workflow_ids)))
+        return {"status": "error", "msg": "decrypt_failed", "details": "Ciphertext, workflow or iteration mismatch"}, b''
+    except state_crypto.KeyRetired as e:
+        return {"status": "error", "msg": "key_retired", "details": f"Key {e} was retired"}, b''
+
+    workflow_id = workflow_ids.pop()
+    with phase('agent'):
+        merged = agent_merge(states, req)
+    result = seal_state_buffer(key, merged, workflow_id)
+    LOG.debug("Merged states", workflow_id=workflow_id, states=len(states))
+    return {
+        "status": "ok",
+        "msg": "merged",
+        "workflow_id": workflow_id,
+        "iteration": merged.iteration,
+        "timestamp": datetime.utcnow().isoformat()
+    }, result
+
+
+class StreamError(Exception):
+    def __init__(self, msg, details):
+        super().__init__(f"{msg}: {details}")
+        self.msg = msg
+        self.details = details
+
+
+def stream_frames(frames):
+    """Yield frames from a session queue up to and including the FLAG_END frame (None aborts)."""
+    while True:
+        frame = frames.get()
+        if frame is None:
+            return
+        yield frame
+        if frame.flags & framing.FLAG_END:
+            return
+
+
+def process_stream(frames, respond):
+    """
+    Decrypt, process and re-encrypt a streamed state one segment at a time.
+
+    `frames` yields the request frames in order: the first carries the
+    metadata (`chunk_size`, plus `workflow_id`/`iteration`/`nonce_prefix`
+    for an encrypted state) and every frame carries one segment, the last
+    with FLAG_END. `respond(meta, payload, end)` sends a response frame.
+    Each output segment goes out as soon as its input is processed, so
+    memory is bounded by the chunk size rather than the state size.
+    """
+    try:
+        _process_stream(frames, respond)
+    except StreamError as e:
+        LOG.warning("Stream failed", error=e)
+        respond({"status": "error", "msg": e.msg, "details": e.details}, b'', True)
+        for _ in frames:
+            pass
+
+
+def _process_stream(frames, respond):
+    frame = next(frames, None)
+    if frame is None:
         return
+    req = frame.meta
+
+    key, key_status = KEY_CACHE.acquire()
+    if not key:
+        raise StreamError(key_status, "Call configure first")
+
+    chunk_size = int(req.get('chunk_size') or 0)
+    if not 0 < chunk_size <= framing.MAX_FRAME_SIZE:
+        raise StreamError("invalid_stream", f"chunk_size {chunk_size} out of range")
+    workflow_id = str(req.get('workflow_id', ''))
+    decryptor = None
+    iteration = 0
+    segment_size = chunk_size
+    if req.get('encrypted'):
+        iteration = int(req.get('iteration', 0))
+        try:
+            aead = DATA_KEYS.aead(key, workflow_id, str(req.get('key_id', '')))
+            decryptor = state_crypto.StreamDecryptor(aead, workflow_id, iteration, bytes.fromhex(req.get('nonce_prefix', '')))
+        except state_crypto.InvalidTag:
+            raise StreamError("decrypt_failed", "Bad key_id")
+        except state_crypto.KeyRetired:
+            raise StreamError("key_retired", f"Key {req.get('key_id')} was retired")
+        except ValueError:
+            raise StreamError("invalid_stream", "Bad nonce_prefix")
+        segment_size += state_crypto.TAG_SIZE
+    key_id = DATA_KEYS.new_key_id(str(req.get('agent_id', '')))
+    encryptor = state_crypto.StreamEncryptor(DATA_KEYS.aead(key, workflow_id, key_id), workflow_id, iteration + 1)
+
+    LOG.debug("Streaming state", workflow_id=workflow_id or '-', chunk_size=chunk_size)
+    respond({
+        "workflow_id": workflow_id,
+        "iteration": iteration + 1,
+        "nonce_prefix": encryptor.prefix.hex(),
+        "key_id": key_id,
+        "chunk_size": chunk_size,
+    }, b'', False)
 
+    processed = 0
     while True:
+        last = bool(frame.flags & framing.FLAG_END)
+        if len(frame.payload) > segment_size or (not last and len(frame.payload) != segment_size):
+            raise StreamError("invalid_chunk", f"Segment {encryptor.counter} is {len(frame.payload)} bytes")
+        if decryptor:
+            try:
+                chunk = decryptor.decrypt_chunk(frame.payload, last)
+            except state_crypto.InvalidTag:
+                raise StreamError("decrypt_failed", f"Segment {encryptor.counter} failed authentication")
+        else:
+            chunk = frame.payload
+        segment = encryptor.encrypt_chunk(run_agent_chunk(chunk, req), last)
+        processed += len(chunk)
+        if last:
+            break
+        respond({}, segment, False)
+        frame = next(frames, None)
+        if frame is None:
+            LOG.warning("Stream aborted by peer", workflow_id=workflow_id or '-')
+            return
+
+    respond({
+        "status": "ok",
+        "msg": "processed",
+        "workflow_id": workflow_id,
+        "iteration": iteration + 1,
+        "chunks": encryptor.counter,
+        "bytes": processed,
+        "timestamp": datetime.utcnow().isoformat()
+    }, segment, True)
+    LOG.debug("Streamed state", workflow_id=workflow_id or '-', bytes=processed, chunks=encryptor.counter)
+
+
+def handle_health(req, payload):
+    return {
+        "status": "healthy",
+        "configured": bool(get_encryption_key()),
+        "timestamp": datetime.utcnow().isoformat(),
+        **KEY_CACHE.describe(),
+        **DATA_KEYS.describe(),
+        **STATE_CODEC.describe(),
+        **CONTEXT_CACHE.describe(),
+        "agent_processes": AGENT_POOL.alive if AGENT_POOL else 0
+    }, b''
+
+
+def handle_rotate_keys(req, payload):
+    """Start a new data key generation for new states; with `retire`, older states are rejected."""
+    retire = bool(req.get('retire'))
+    generation = DATA_KEYS.rotate(retire=retire)
+    LOG.info("Rotated data keys", generation=generation, retired=retire)
+    return {"status": "ok", "msg": "rotated", **DATA_KEYS.describe()}, b''
+
+
+def handle_metrics(req, payload):
+    """Counters and latency histograms (see common/metrics.py) for the host's metrics endpoint."""
+    return {"status": "ok", "metrics": METRICS.snapshot()}, b''
+
+
+def handle_get_logs(req, payload):
+    """
+    Buffered log records (see enclave_log.py), oldest first.
+
+    `since` returns only records after that sequence number (the previous
+    response's `next`), `level` filters by minimum level and `limit` keeps
+    the newest records (default 50).
+    """
+    level = enclave_log.LEVELS.get(str(req.get('level', 'DEBUG')).upper(), enclave_log.DEBUG)
+    records = LOG.records(since=int(req.get('since') or 0), level=level, limit=int(req.get('limit') or 50))
+    logs = [dict(record, fields={name: value if isinstance(value, (int, float, bool, type(None))) else str(value)
+                                 for name, value in record['fields'].items()})
+            for record in records]
+    return {"status": "ok", "logs": logs, "next": logs[-1]['seq'] if logs else int(req.get('since') or 0)}, b''
+
+
+HANDLERS = {
+    'ping': handle_ping,
+    'configure': handle_configure,
+    'process': handle_process,
+    'health': handle_health,
+    'process_batch': handle_process_batch,
+    'merge': handle_merge,
+    'metrics': handle_metrics,
+    'get_logs': handle_get_logs,
+    'rotate_keys': handle_rotate_keys,
+}
+# process_stream spans several frames and is served by process_stream()
+
+
+def dispatch(msg_type, req, payload):
+    """
+    Run the handler for one request and record its metrics.
+
+    A request carrying a `trace_id` (the host's tracing span) gets its phase
+    durations back in the response's `timings`, in milliseconds.
+    """
+    handler = HANDLERS.get(msg_type)
+    if not handler:
+        REQUESTS.inc(type='unknown', status='error')
+        return {"status": "error", "msg": "unknown_type"}, b''
+    _timings.current = {} if req.get('trace_id') else None
+    IN_FLIGHT.inc()
+    start = time.perf_counter()
+    try:
+        response, body = handler(req, payload)
+    except Exception as e:
+        LOG.error("Handler failed", type=msg_type, error=e)
+        response, body = {"status": "error", "msg": "internal_error"}, b''
+    finally:
+        IN_FLIGHT.dec()
+        REQUEST_SECONDS.observe(time.perf_counter() - start, type=msg_type)
+        timings, _timings.current = _timings.current, None
+    REQUESTS.inc(type=msg_type, status=response.get('status', 'ok'))
+    if timings is not None:
+        response['timings'] = {name: round(seconds * 1000, 3) for name, seconds in timings.items()}
+    return response, body
+
+
+def serve_frames(conn, executor, slots, stream_slots=None):
+    """
+    Serve length-prefixed frames until the peer closes the connection.
+
+    Each frame runs on `executor`, so requests multiplexed on one connection
+    proceed concurrently; responses carry the request id and may be written
+    out of order. `slots` bounds the requests in flight across the server.
+
+    `process_stream` frames are queued to a per-request session on its own
+    thread, which holds one of `stream_slots` (default: MAX_STREAMS for
+    this connection) until the stream ends. A session waits for frames that
+    only this reader delivers, so the reader never waits for a session to
+    end: with no stream slot free, the stream is refused with `busy` and
+    its remaining frames are dropped.
+    """
+    write_lock = threading.Lock()
+    in_flight = set()
+    streams = {}
+    refused = set()
+    sessions = []
+    if stream_slots is None:
+        stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+    def run(frame, received):
+        try:
+            PHASE_SECONDS.observe(time.perf_counter() - received, phase='queue')
+            response, body = dispatch(frame.name, frame.meta, frame.payload)
+            with phase('send'), write_lock:
+                framing.send_frame(conn, frame.type_code | framing.RESPONSE_BIT, frame.request_id, response, body)
+        except OSError as e:
+            LOG.error("Response send failed", error=e)
+        finally:
+            slots.release()
+
+    def run_stream(frame, session):
+        def respond(meta, body, end):
+            with write_lock:
+                framing.send_frame(conn, frame.type_code | framing.RESPONSE_BIT, frame.request_id, meta, body,
+                                   flags=framing.FLAG_END if end else 0)
+
+        frames = stream_frames(session)
+        results = []
+
+        def respond_and_record(meta, body, end):
+            if end:
+                results.append(meta.get('status', 'error'))
+            respond(meta, body, end)
+
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
         try:
-            conn, addr = s.accept()
-            print(f"[ENCLAVE] Connect from {addr}", flush=True)
-            
-            # Read data
-            data = conn.recv(16384) # 16KB buffer
-            if not data:
-                conn.close()
+            process_stream(frames, respond_and_record)
+        except OSError as e:
+            LOG.error("Stream send failed", error=e)
+        except Exception as e:
+            LOG.error("Stream failed", error=e)
+        finally:
+            # Keep consuming so the reader never blocks on a dead session
+            for _ in frames:
+                pass
+            IN_FLIGHT.dec()
+            REQUEST_SECONDS.observe(time.perf_counter() - start, type='process_stream')
+            REQUESTS.inc(type='process_stream', status=results[0] if results else 'error')
+            stream_slots.release()
+
+    def refuse_stream(frame):
+        LOG.warning("Stream refused, too many open streams")
+        REQUESTS.inc(type='process_stream', status='error')
+        try:
+            with write_lock:
+                framing.send_frame(conn, frame.type_code | framing.RESPONSE_BIT, frame.request_id,
+                                   {"status": "error", "msg": "busy", "details": "Too many open streams; retry later"},
+                                   b'', flags=framing.FLAG_END)
+        except OSError as e:
+            LOG.error("Response send failed", error=e)
+
+    try:
+        while True:
+            try:
+                frame = framing.read_frame(conn)
+            except framing.FrameError as e:
+                LOG.error("Bad frame", error=e)
+                return
+            if frame is None:
+                return
+
+            if frame.name == 'process_stream':
+                end = frame.flags & framing.FLAG_END
+                if frame.request_id in refused:
+                    if end:
+                        refused.discard(frame.request_id)
+                    continue
+                session = streams.get(frame.request_id)
+                if session is None:
+                    if not stream_slots.acquire(blocking=False):
+                        refuse_stream(frame)
+                        if not end:
+                            refused.add(frame.request_id)
+                        continue
+                    session = streams[frame.request_id] = queue.Queue(STREAM_QUEUE_DEPTH)
+                    thread = threading.Thread(target=run_stream, args=(frame, session), name='enclave-stream',
+                                              daemon=True)
+                    thread.start()
+                    sessions.append(thread)
+                session.put(frame)
+                if end:
+                    del streams[frame.request_id]
                 continue
-            
+
+            received = time.perf_counter()
+            slots.acquire()
+            future = executor.submit(run, frame, received)
+            in_flight.add(future)
+            future.add_done_callback(in_flight.discard)
+    finally:
+        for session in streams.values():
+            session.put(None)
+        # Let outstanding responses go out before the connection is closed
+        wait(list(in_flight))
+        for thread in sessions:
+            thread.join()
+
+
+def serve_legacy_json(conn, slots):
+    """Serve a single unframed JSON request (pre-framing clients)."""
+    # Requests have no length prefix: read until the object parses
+    data = bytearray()
+    req = None
+    while req is None:
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+        if len(data) > framing.MAX_FRAME_SIZE:
+            conn.sendall(b'{"status": "error", "msg": "too_large"}')
+            return
+        if chunk.rstrip().endswith(b'}'):
             try:
-                msg = data.decode('utf-8')
-                req = json.loads(msg)
-                msg_type = req.get('type')
-                
-                response = {"status": "error", "msg": "unknown_type"}
-                
-                if msg_type == 'ping':
-                    response = {"status": "ok", "msg": "pong"}
-                    
-                elif msg_type == 'configure':
-                    # Validate required fields
-                    required_fields = ['aws_access_key_id', 'aws_secret_access_key', 'aws_session_token', 'encrypted_tsk']
-                    missing = [f for f in required_fields if not req.get(f)]
-                    
-                    if missing:
-                        print(f"[ENCLAVE] ERROR: Missing required fields: {missing}", flush=True)
-                        response = {"status": "error", "msg": "missing_fields", "details": f"Required: {missing}"}
-                    else:
-                        CREDENTIALS['ak'] = req.get('aws_access_key_id')
-                        CREDENTIALS['sk'] = req.get('aws_secret_access_key')
-                        CREDENTIALS['token'] = req.get('aws_session_token')
-                        tsk_b64 = req.get('encrypted_tsk')
-                        
-                        print(f"[ENCLAVE] Configuring with credentials (ak={CREDENTIALS['ak'][:10]}...)", flush=True)
-                        print(f"[ENCLAVE] TSK length: {len(tsk_b64)} bytes", flush=True)
-                        print("[ENCLAVE] Decrypting TSK with KMS attestation...", flush=True)
-                        
-                        # Attestation provided implicitly via KMS Decryption success
-                        # (KMS only decrypts if PCR0 matches)
-                        print("[ENCLAVE] Requesting decryption from KMS...", flush=True)
-
-                        tsk_bytes, err_details = kms_decrypt(tsk_b64)
-                        if tsk_bytes:
-                            ENCRYPTION_KEY = tsk_bytes
-                            print(f"[ENCLAVE] ✅ TSK decrypted successfully! (len={len(ENCRYPTION_KEY)})", flush=True)
-                            print(f"[ENCLAVE] ✅ Enclave configured at {datetime.utcnow().isoformat()}", flush=True)
-                            
-                            response = {
-                                "status": "ok", 
-                                "msg": "configured", 
-                                "timestamp": datetime.utcnow().isoformat(),
-                                "attestation_document": None,
-                                "attestation_error": "NSM library build failed - Attestation doc not available. See logs."
-                            }
-                        else:
-                            print(f"[ENCLAVE] ❌ KMS decrypt failed: {err_details}", flush=True)
-                            response = {"status": "error", "msg": "kms_decrypt_failed", "details": err_details}
-
-                elif msg_type == 'process':
-                     if not ENCRYPTION_KEY:
-                         print("[ENCLAVE] ❌ Cannot process: enclave not configured", flush=True)
-                         response = {"status": "error", "msg": "not_configured", "details": "Call configure first"}
-                     else:
-                         print(f"[ENCLAVE] Processing message at {datetime.utcnow().isoformat()}...", flush=True)
-                         # Logic for process would go here
-                         # For now just return echo
-                         response = {"status": "ok", "msg": "processed", "echo": req, "timestamp": datetime.utcnow().isoformat()}
-                         print("[ENCLAVE] ✅ Processing complete", flush=True)
-                
-                elif msg_type == 'health':
-                    response = {
-                        "status": "healthy",
-                        "configured": bool(ENCRYPTION_KEY),
-                        "timestamp": datetime.utcnow().isoformat()
-                    }
-
-                conn.sendall(json.dumps(response).encode('utf-8'))
-                
-            except json.JSONDecodeError:
-                conn.sendall(b'{"status": "error", "msg": "invalid_json"}')
-            except Exception as e:
-                print(f"[ERROR] Handler failed: {e}", flush=True)
-                conn.sendall(b'{"status": "error", "msg": "internal_error"}')
-                
-            conn.close()
-            
-        except Exception as e:
-            print(f"[FATAL] Loop error: {e}", flush=True)
+                req = json.loads(data.decode('utf-8'))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                pass
+    if not data:
+        return
+    if req is None:
+        conn.sendall(b'{"status": "error", "msg": "invalid_json"}')
+        return
+
+    payload = req.get('payload', '')
+    if not isinstance(payload, str):
+        payload = b''
+    elif req.get('encrypted'):
+        payload = base64.b64decode(payload)
+    else:
+        payload = payload.encode('utf-8')
+    with slots:
+        response, body = dispatch(req.get('type'), req, payload)
+    if body:
+        response['payload'] = base64.b64encode(body).decode('utf-8')
+    conn.sendall(json.dumps(response).encode('utf-8'))
+
+
+def handle_connection(conn, addr, executor, slots, stream_slots=None):
+    """Serve an accepted connection (framed, or a single legacy JSON request), then close it."""
+    CONNECTIONS.inc()
+    try:
+        LOG.debug("Connect", peer=addr)
+        if conn.family in (socket.AF_INET, socket.AF_INET6):
+            # Frames go out in several writes; don't let Nagle hold them back
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        first = conn.recv(1, socket.MSG_PEEK)
+        if first == framing.MAGIC[:1]:
+            serve_frames(conn, executor, slots, stream_slots)
+        elif first:
+            serve_legacy_json(conn, slots)
+    except Exception as e:
+        LOG.error("Connection failed", peer=addr, error=e)
+    finally:
+        CONNECTIONS.dec()
+        conn.close()
+
+
+def create_listener(address=LISTEN_ADDRESS, backlog=LISTEN_BACKLOG):
+    """Bind the server socket: `vsock:<cid>:<port>`, `tcp:<host>:<port>` or `unix:<path>` (default vsock, any CID)."""
+    scheme, _, rest = (address or f'vsock:{socket.VMADDR_CID_ANY}:{VSOCK_PORT}').partition(':')
+    if scheme == 'vsock':
+        cid, _, port = rest.partition(':')
+        s = socket.socket(socket.AF_VSOCK, socket.SOCK_STREAM)
+        s.bind((int(cid), int(port)))
+    elif scheme == 'tcp':
+        host, _, port = rest.rpartition(':')
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind((host, int(port)))
+    elif scheme == 'unix':
+        if os.path.exists(rest):
+            os.unlink(rest)
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.bind(rest)
+    else:
+        raise ValueError(f"Unsupported listen address: {address!r}")
+    s.listen(backlog)
+    LOG.info("Listening", address=address or f'vsock:{VSOCK_PORT}', backlog=backlog)
+    return s
+
+
+def serve(listener, max_workers=MAX_WORKERS, stop_event=None, max_connections=MAX_CONNECTIONS,
+          max_streams=MAX_STREAMS):
+    """
+    Accept connections on `listener` and run their requests on a bounded thread pool.
+
+    Each connection gets a lightweight reader thread; at most `max_workers`
+    requests execute at once, plus up to `max_streams` streamed requests on
+    their own threads. While all `max_connections` are open the
+    accept loop waits and new clients queue in the listen backlog instead of
+    being refused. Returns once `stop_event` is set and the listener has been
+    closed.
+    """
+    slots = threading.BoundedSemaphore(max_workers)
+    stream_slots = threading.BoundedSemaphore(max_streams)
+    conn_slots = threading.BoundedSemaphore(max_connections)
+
+    def run(conn, addr, executor):
+        try:
+            handle_connection(conn, addr, executor, slots, stream_slots)
+        finally:
+            conn_slots.release()
+
+    LOG.info("Serving", workers=max_workers, streams=max_streams, connections=max_connections)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='enclave-req') as executor:
+        while not (stop_event and stop_event.is_set()):
+            conn_slots.acquire()
+            try:
+                conn, addr = listener.accept()
+            except OSError as e:
+                conn_slots.release()
+                if stop_event and stop_event.is_set():
+                    break
+                LOG.error("Accept failed", error=e)
+                continue
+            threading.Thread(target=run, args=(conn, addr, executor), daemon=True).start()
+
+
+def run_server():
+    # Fork the agent workers first, while the process holds no keys or sockets
+    try:
+        start_agent_pool()
+    except Exception as e:
+        LOG.error("Agent processes failed to start", error=e)
+
+    try:
+        s = create_listener()
+    except Exception as e:
+        LOG.error("Bind failed", error=e)
+        LOG.flush()
+        return
+
+    # Generate the attestation key pair before the first configure arrives
+    try:
+        get_kms_backend()
+    except Exception as e:
+        LOG.error("KMS backend init failed", error=e)
+
+    serve(s)
 
 if __name__ == "__main__":
     run_server()
@@ -0,0 +1,150 @@
+"""
+Enclave Logging
+
+A leveled, structured logger that keeps console writes off the request
+path. The Nitro console is slow, so a flushed print() per log line stalls
+the thread handling the request. Here a log call appends a record
+(timestamp, level, message, fields) to two bounded deques and returns:
+
+- a ring buffer of the last ENCLAVE_LOG_BUFFER records, served to the
+  host by the `get_logs` message;
+- a console queue drained by a background thread, which formats the
+  records and writes them in one flushed write per wake-up. At most
+  ENCLAVE_LOG_RATE_PER_SECOND lines reach the console each second; the
+  rest are dropped with a summary line. Records are also dropped if the
+  queue fills faster than the console drains it.
+
+A call below ENCLAVE_LOG_LEVEL costs one comparison. Pass values as
+keyword fields rather than formatting them into the message, so that cost
+is paid only when the record is kept.
+"""
+
+import collections
+import itertools
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+LOG_LEVEL = LEVELS.get(os.environ.get('ENCLAVE_LOG_LEVEL', 'INFO').upper(), INFO)
+# Records kept for get_logs
+BUFFER_SIZE = int(os.environ.get('ENCLAVE_LOG_BUFFER', '1000'))
+# Console lines per second (0 = unlimited)
+RATE_PER_SECOND = int(os.environ.get('ENCLAVE_LOG_RATE_PER_SECOND', '200'))
+# How often the background thread writes queued lines to the console
+FLUSH_INTERVAL = float(os.environ.get('ENCLAVE_LOG_FLUSH_MS', '100')) / 1000
+
+
+def format_record(record):
+    """One console line: `[ENCLAVE] <UTC time> <LEVEL> <message> key=value...`."""
+    timestamp = datetime.fromtimestamp(record['ts'], timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+    fields = ''.join(f' {name}={value}' for name, value in record['fields'].items())
+    return f"[ENCLAVE] {timestamp}Z {record['level']} {record['msg']}{fields}"
+
+
+class EnclaveLog:
+    def __init__(self, level=LOG_LEVEL, buffer_size=BUFFER_SIZE, rate_per_second=RATE_PER_SECOND,
+                 flush_interval=FLUSH_INTERVAL, stream=None):
+        self.level = level
+        self.rate_per_second = rate_per_second
+        self.flush_interval = flush_interval
+        self.stream = stream
+        # deque appends and pops are atomic, so logging threads take no lock
+        # (`dropped` may undercount under contention; it is only reported)
+        self._records = collections.deque(maxlen=buffer_size)
+        self._console = collections.deque(maxlen=max(buffer_size, rate_per_second))
+        self._seq = itertools.count(1)
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._window = (0, 0)  # (second, lines written in it)
+        self.dropped = 0
+
+    def debug(self, msg, **fields):
+        if self.level <= DEBUG:
+            self._emit(DEBUG, msg, fields)
+
+    def info(self, msg, **fields):
+        if self.level <= INFO:
+            self._emit(INFO, msg, fields)
+
+    def warning(self, msg, **fields):
+        if self.level <= WARNING:
+            self._emit(WARNING, msg, fields)
+
+    def error(self, msg, **fields):
+        if self.level <= ERROR:
+            self._emit(ERROR, msg, fields)
+
+    def enabled(self, level):
+        return self.level <= level
+
+    def _emit(self, level, msg, fields):
+        record = {'seq': next(self._seq), 'ts': time.time(), 'level': LEVEL_NAMES[level], 'msg': msg,
+                  'fields': fields}
+        self._records.append(record)
+        if len(self._console) == self._console.maxlen:
+            self.dropped += 1
+        self._console.append(record)
+        if self._thread is None:
+            self.start()
+        if level >= ERROR:
+            self._wake.set()
+
+    def records(self, since=0, level=DEBUG, limit=None):
+        """Buffered records with a sequence number above `since` and at least `level`, oldest first."""
+        selected = [r for r in list(self._records) if r['seq'] > since and LEVELS[r['level']] >= level]
+        return selected[-limit:] if limit else selected
+
+    def start(self):
+        """Start the console drain thread (done on first use)."""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._drain, name='enclave-log', daemon=True)
+                self._thread.start()
+
+    def _drain(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write queued records to the console, subject to the rate limit."""
+        with self._flush_lock:
+            lines = []
+            while self._console:
+                record = self._console.popleft()
+                if self._allow():
+                    lines.append(format_record(record))
+                else:
+                    self.dropped += 1
+            if self.dropped and self._allow():
+                lines.append(f"[ENCLAVE] {self.dropped} log lines dropped")
+                self.dropped = 0
+            if lines:
+                stream = self.stream or sys.stdout
+                try:
+                    stream.write('\n'.join(lines) + '\n')
+                    stream.flush()
+                except (OSError, ValueError):
+                    pass
+
+    def _allow(self):
+        if not self.rate_per_second:
+            return True
+        second = int(time.monotonic())
+        window, written = self._window
+        if window != second:
+            window, written = second, 0
+        if written >= self.rate_per_second:
+            self._window = (window, written)
+            return False
+        self._window = (window, written + 1)
+        return True
@@ -0,0 +1,319 @@
+"""
+KMS Client
+
+In-process KMS Decrypt for the enclave, replacing a `kmstool_enclave_cli`
+fork per configure.
+
+The enclave has no network of its own: requests go over vsock to the
+parent's vsock-proxy (CID 3, port 8000), which forwards them to
+kms.<region>.amazonaws.com:443. TLS is terminated inside the enclave, so
+the parent only sees ciphertext.
+
+KMS only releases the plaintext to an attested enclave: each Decrypt
+carries a `Recipient` with an NSM attestation document embedding the
+enclave's RSA public key. KMS checks the document against the key policy
+(PCR0) and returns the plaintext as `CiphertextForRecipient`, a CMS
+EnvelopedData that only that key pair can open.
+
+NitroKmsBackend keeps the RSA key pair, the attestation document (up to
+ATTESTATION_DOC_MAX_AGE seconds) and a keep-alive HTTPS connection
+through the proxy across calls. The endpoint and attestation source are
+pluggable so the same code runs against a local fake KMS:
+
+    vsock:3:8000             vsock-proxy on the parent (default)
+    https://host:port        KMS-compatible endpoint over TLS
+    http://host:port         local fake KMS (tests/fake_kms.py)
+
+KmstoolBackend keeps the previous subprocess path available.
+"""
+
+import base64
+import http.client
+import json
+import os
+import socket
+import ssl
+import subprocess
+import threading
+import time
+from urllib.parse import urlsplit
+
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import Credentials
+from cryptography.hazmat.primitives import hashes, padding, serialization
+from cryptography.hazmat.primitives.asymmetric import padding as asym_padding
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+import nsm_util
+
+KMS_BACKEND = os.environ.get('ENCLAVE_KMS_BACKEND', 'native')
+KMS_ENDPOINT = os.environ.get('ENCLAVE_KMS_ENDPOINT', 'vsock:3:8000')
+KMS_TIMEOUT = float(os.environ.get('ENCLAVE_KMS_TIMEOUT', '10'))
+# `nsm`, or `static` off-Nitro without a (mock) libnsm (see StaticAttestation)
+ATTESTATION = os.environ.get('ENCLAVE_ATTESTATION', 'nsm')
+DEFAULT_REGION = os.environ.get('AWS_REGION', 'ap-southeast-1')
+
+# KMS rejects stale attestation documents; refresh well before that
+ATTESTATION_DOC_MAX_AGE = 240
+
+
+class KmsError(Exception):
+    """KMS Decrypt failed (transport, KMS error response, or undecryptable result)."""
+
+
+class NsmAttestation:
+    """Attestation documents from the Nitro Security Module."""
+
+    def get_document(self, public_key_der):
+        doc, err = nsm_util.get_attestation_doc(public_key=public_key_der)
+        if doc is None:
+            raise KmsError(f"attestation failed: {err}")
+        return doc
+
+
+class StaticAttestation:
+    """
+    Off-Nitro stand-in: the "document" is the DER public key itself.
+
+    Only a fake KMS accepts it (tests/fake_kms.py); real KMS rejects it.
+    """
+
+    def get_document(self, public_key_der):
+        return public_key_der
+
+
+class VsockHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPS to `host` through a vsock-proxy at (cid, port); TLS ends in the enclave."""
+
+    def __init__(self, host, cid, port, timeout=KMS_TIMEOUT):
+        super().__init__(host, timeout=timeout, context=ssl.create_default_context())
+        self.vsock_address = (cid, port)
+
+    def connect(self):
+        sock = socket.socket(socket.AF_VSOCK, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.vsock_address)
+            self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+        except BaseException:
+            sock.close()
+            raise
+
+
+# --- CMS EnvelopedData (RFC 5652), as returned in CiphertextForRecipient ---
+
+def _ber_parse(data, pos=0):
+    """Parse one BER element at `pos`; returns ((tag, value), next_pos).
+
+    `value` is bytes for primitive elements and a list of children for
+    constructed ones. Indefinite lengths (used by KMS) are supported.
+    """
+    tag = data[pos]
+    length = data[pos + 1]
+    pos += 2
+    constructed = bool(tag & 0x20)
+    if length == 0x80:
+        children = []
+        while data[pos:pos + 2] != b'\x00\x00':
+            child, pos = _ber_parse(data, pos)
+            children.append(child)
+        return (tag, children), pos + 2
+    if length & 0x80:
+        n = length & 0x7F
+        length = int.from_bytes(data[pos:pos + n], 'big')
+        pos += n
+    end = pos + length
+    if end > len(data):
+        raise KmsError("truncated CMS structure")
+    if not constructed:
+        return (tag, bytes(data[pos:end])), end
+    children = []
+    while pos < end:
+        child, pos = _ber_parse(data, pos)
+        children.append(child)
+    return (tag, children), end
+
+
+def _octets(node):
+    """Content of a (possibly constructed) OCTET STRING."""
+    tag, value = node
+    if isinstance(value, bytes):
+        return value
+    return b''.join(_octets(child) for child in value)
+
+
+def _child(node, tag):
+    return next(c for c in node[1] if c[0] == tag)
+
+
+def open_enveloped_data(blob, private_key):
+    """Decrypt a CMS EnvelopedData (RSAES-OAEP-SHA-256 key transport, AES-256-CBC content)."""
+    try:
+        content_info, _ = _ber_parse(blob)
+        enveloped = _child(content_info, 0xA0)[1][0]
+        recipient = _child(enveloped, 0x31)[1][0]
+        encrypted_key = [c for c in recipient[1] if c[0] == 0x04][-1][1]
+        content = [c for c in enveloped[1] if c[0] == 0x30][-1]
+        algorithm = content[1][1]
+        iv = _octets(algorithm[1][1])
+        ciphertext = _octets(next(c for c in content[1] if c[0] in (0x80, 0xA0)))
+    except (IndexError, StopIteration, TypeError) as e:
+        raise KmsError(f"malformed CiphertextForRecipient: {e}")
+
+    try:
+        cek = private_key.decrypt(encrypted_key, asym_padding.OAEP(
+            mgf=asym_padding.MGF1(hashes.SHA256()), algorithm=hashes.SHA256(), label=None))
+        decryptor = Cipher(algorithms.AES(cek), modes.CBC(iv)).decryptor()
+        padded = decryptor.update(ciphertext) + decryptor.finalize()
+        unpadder = padding.PKCS7(128).unpadder()
+        return unpadder.update(padded) + unpadder.finalize()
+    except ValueError as e:
+        raise KmsError(f"cannot open CiphertextForRecipient: {e}")
+
+
+class NitroKmsBackend:
+    """
+    KMS Decrypt with attestation, in-process.
+
+    Thread-safe; calls are serialised so the connection and attestation
+    document can be shared. A dropped keep-alive connection is reopened and
+    the call retried once.
+    """
+
+    def __init__(self, endpoint=KMS_ENDPOINT, attestation=None, timeout=KMS_TIMEOUT):
+        self.endpoint = endpoint
+        self.attestation = attestation or NsmAttestation()
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._public_der = self._private_key.public_key().public_bytes(
+            serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+        self._doc = None
+        self._doc_at = 0
+        self._conn = None
+        self._conn_host = None
+        self.connections_opened = 0
+
+    def _attestation_document(self):
+        if self._doc is None or time.monotonic() - self._doc_at > ATTESTATION_DOC_MAX_AGE:
+            self._doc = self.attestation.get_document(self._public_der)
+            self._doc_at = time.monotonic()
+        return self._doc
+
+    def _target(self, region):
+        """Return (url, host) for `region` on this endpoint."""
+        if self.endpoint.startswith('vsock:'):
+            host = f'kms.{region}.amazonaws.com'
+            return f'https://{host}/', host
+        url = urlsplit(self.endpoint)
+        return f'{url.scheme}://{url.netloc}/', url.netloc
+
+    def _connection(self, host):
+        if self._conn is not None and self._conn_host == host:
+            return self._conn
+        self.close()
+        if self.endpoint.startswith('vsock:'):
+            _, cid, port = self.endpoint.split(':')
+            conn = VsockHTTPSConnection(host, int(cid), int(port), timeout=self.timeout)
+        elif self.endpoint.startswith('https://'):
+            conn = http.client.HTTPSConnection(host, timeout=self.timeout)
+        elif self.endpoint.startswith('http://'):
+            conn = http.client.HTTPConnection(host, timeout=self.timeout)
+        else:
+            raise KmsError(f"Unsupported KMS endpoint: {self.endpoint!r}")
+        self._conn, self._conn_host = conn, host
+        self.connections_opened += 1
+        return conn
+
+    def _post(self, host, body, headers):
+        for attempt in (1, 2):
+            conn = self._connection(host)
+            try:
+                conn.request('POST', '/', body=body, headers=headers)
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError, socket.timeout, ssl.SSLError, OSError) as e:
+                self.close()
+                if attempt == 2:
+                    raise KmsError(f"KMS request failed: {e}")
+
+    def decrypt(self, ciphertext_b64, credentials, region=DEFAULT_REGION):
+        """Decrypt a base64 KMS CiphertextBlob; returns the plaintext bytes."""
+        with self._lock:
+            url, host = self._target(region)
+            body = json.dumps({
+                'CiphertextBlob': ciphertext_b64,
+                'Recipient': {
+                    'KeyEncryptionAlgorithm': 'RSAES_OAEP_SHA_256',
+                    'AttestationDocument': base64.b64encode(self._attestation_document()).decode('ascii'),
+                },
+            }).encode('utf-8')
+            request = AWSRequest(method='POST', url=url, data=body, headers={
+                'Content-Type': 'application/x-amz-json-1.1',
+                'X-Amz-Target': 'TrentService.Decrypt',
+            })
+            SigV4Auth(Credentials(credentials['ak'], credentials['sk'], credentials.get('token')),
+                      'kms', region).add_auth(request)
+            status, raw = self._post(host, body, dict(request.headers.items()))
+
+        try:
+            result = json.loads(raw)
+        except ValueError:
+            raise KmsError(f"KMS returned HTTP {status} with a non-JSON body")
+        if status != 200:
+            raise KmsError(f"{result.get('__type', 'HTTP ' + str(status))}: {result.get('message', result.get('Message', ''))}")
+        if not result.get('CiphertextForRecipient'):
+            raise KmsError("KMS response has no CiphertextForRecipient")
+        return open_enveloped_data(base64.b64decode(result['CiphertextForRecipient']), self._private_key)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = self._conn_host = None
+
+
+class KmstoolBackend:
+    """KMS Decrypt by running kmstool_enclave_cli (one process per call)."""
+
+    def __init__(self, path='/usr/bin/kmstool_enclave_cli', proxy_port=8000, trace=False):
+        self.path = path
+        self.proxy_port = proxy_port
+        self.trace = trace
+
+    def decrypt(self, ciphertext_b64, credentials, region=DEFAULT_REGION):
+        cmd = [
+            self.path, 'decrypt',
+            '--region', region,
+            '--proxy-port', str(self.proxy_port),
+            '--aws-access-key-id', credentials['ak'],
+            '--aws-secret-access-key', credentials['sk'],
+            '--aws-session-token', credentials['token'],
+            '--ciphertext', ciphertext_b64
+        ]
+        env = None
+        if self.trace:
+            env = dict(os.environ, AWS_COMMON_RUNTIME_LOG_LEVEL='Trace')
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, check=True, env=env)
+        except subprocess.CalledProcessError as e:
+            raise KmsError(e.stderr.strip())
+
+        # Parse PLAINTEXT: <base64>
+        stdout = result.stdout.strip()
+        marker = "PLAINTEXT:"
+        if marker in stdout:
+            stdout = stdout.split(marker, 1)[1].strip()
+        return base64.b64decode(stdout)
+
+    def close(self):
+        pass
+
+
+def make_backend(name=KMS_BACKEND):
+    if name == 'native':
+        return NitroKmsBackend(attestation=StaticAttestation() if ATTESTATION == 'static' else None)
+    if name == 'kmstool':
+        return KmstoolBackend(trace=bool(os.environ.get('ENCLAVE_KMSTOOL_TRACE')))
+    raise ValueError(f"Unknown KMS backend: {name!r}")
@@ -1,105 +1,220 @@
-import ctypes
+"""
+NSM Utilities
+
+Attestation documents from the Nitro Security Module via libnsm
+(aws-nitro-enclaves-nsm-api):
+
+    int32_t   nsm_lib_init(void);
+    void      nsm_lib_exit(int32_t fd);
+    ErrorCode nsm_get_attestation_doc(int32_t fd,
+                                      const uint8_t *user_data, uint32_t user_data_len,
+                                      const uint8_t *nonce, uint32_t nonce_len,
+                                      const uint8_t *pub_key, uint32_t pub_key_len,
+                                      uint8_t *att_doc, uint32_t *att_doc_len);
+
+NsmSession loads the library and opens the device once, then serves
+requests from preallocated (per-thread) output buffers. Nonce-less documents can be
+served from a short-TTL cache.
+"""
+
 import base64
+import ctypes
 import os
+import threading
+import time
+
+NSM_LIB_PATHS = [p for p in (os.environ.get('NSM_LIB_PATH'), 'libnsm.so', '/usr/lib64/libnsm.so') if p]
+
+# Seconds a nonce-less document may be reused (0 = always fetch a new one)
+DOC_CACHE_TTL = float(os.environ.get('ENCLAVE_NSM_DOC_TTL', '30'))
+# Nonce-less documents cached at once (one per public key / user data pair)
+DOC_CACHE_SIZE = 64
+
+# Largest document the NSM returns, and its limit on each input field
+MAX_DOC_SIZE = 16 * 1024
+MAX_FIELD_SIZE = 1024
+
+NSM_ERRORS = {
+    1: 'InvalidArgument',
+    2: 'InvalidIndex',
+    3: 'InvalidResponse',
+    4: 'ReadOnlyIndex',
+    5: 'InvalidOperation',
+    6: 'BufferTooSmall',
+    7: 'InputTooLarge',
+    8: 'InternalError',
+}
+
+
+class NsmError(Exception):
+    """libnsm could not be loaded or an NSM request failed."""
 
-# Define Structs
-class NsmAttestationDocRequest(ctypes.Structure):
-    _fields_ = [
-        ("public_key", ctypes.POINTER(ctypes.c_ubyte)),
-        ("public_key_len", ctypes.c_uint32),
-        ("nonce", ctypes.POINTER(ctypes.c_ubyte)),
-        ("nonce_len", ctypes.c_uint32),
-        ("user_data", ctypes.POINTER(ctypes.c_ubyte)),
-        ("user_data_len", ctypes.c_uint32),
+
+def find_libnsm():
+    for path in NSM_LIB_PATHS:
+        if os.path.exists(path):
+            return os.path.abspath(path)
+    raise NsmError("libnsm.so not found in /app or /usr/lib64")
+
+
+def _declare(lib):
+    lib.nsm_lib_init.restype = ctypes.c_int32
+    lib.nsm_lib_init.argtypes = []
+    lib.nsm_lib_exit.restype = None
+    lib.nsm_lib_exit.argtypes = [ctypes.c_int32]
+    lib.nsm_get_attestation_doc.restype = ctypes.c_int
+    lib.nsm_get_attestation_doc.argtypes = [
+        ctypes.c_int32,
+        ctypes.c_char_p, ctypes.c_uint32,
+        ctypes.c_char_p, ctypes.c_uint32,
+        ctypes.c_char_p, ctypes.c_uint32,
+        ctypes.POINTER(ctypes.c_ubyte),
+        ctypes.POINTER(ctypes.c_uint32),
     ]
 
-def get_attestation_doc_b64():
+
+class NsmSession:
     """
-    Get the attestation document from the NSM and return it as a base64 string.
-    Returns: (base64_string, error_message)
+    A long-lived handle on the NSM device, safe for concurrent callers.
+
+    The device fd is shared (the driver serialises requests); each thread
+    gets its own preallocated output buffer. The lock only guards the
+    document cache and the count of requests in flight, never the request
+    itself; close() waits for those requests before releasing the fd.
+
+    `lib` defaults to the system libnsm; tests pass a mock with the same
+    functions (see tests/mock_libnsm.py).
     """
-    
-    # 1. Locate Library
-    lib_path = None
-    if os.path.exists("libnsm.so"):
-        lib_path = os.path.abspath("libnsm.so")
-    elif os.path.exists("/usr/lib64/libnsm.so"):
-        lib_path = "/usr/lib64/libnsm.so"
-    else:
-        return None, "libnsm.so not found in /app or /usr/lib64"
-
-    # 2. Load Library
-    try:
-        libnsm = ctypes.CDLL(lib_path)
-    except Exception as e:
-        return None, f"Failed to load {lib_path}: {e}"
 
-    # 3. Define Signatures
-    try:
-        libnsm.nsm_lib_init.restype = ctypes.c_int
-        libnsm.nsm_lib_init.argtypes = []
-        
-        libnsm.nsm_lib_exit.restype = ctypes.c_int
-        libnsm.nsm_lib_exit.argtypes = []
-        
-        libnsm.nsm_fd_open.restype = ctypes.c_int
-        libnsm.nsm_fd_open.argtypes = []
-        
-        libnsm.nsm_fd_close.restype = None
-        libnsm.nsm_fd_close.argtypes = [ctypes.c_int]
-        
-        libnsm.nsm_get_attestation_doc.restype = ctypes.c_int
-        libnsm.nsm_get_attestation_doc.argtypes = [
-            ctypes.c_int,
-            ctypes.POINTER(NsmAttestationDocRequest),
-            ctypes.c_uint32,
-            ctypes.POINTER(ctypes.c_ubyte),
-            ctypes.POINTER(ctypes.c_uint32)
-        ]
-    except Exception as e:
-         return None, f"Failed to define signatures: {e}"
-
-    # 4. Use Library
-    # Initialize
-    if libnsm.nsm_lib_init() != 0:
-        return None, "nsm_lib_init failed"
-
-    fd = libnsm.nsm_fd_open()
-    if fd < 0:
-        libnsm.nsm_lib_exit()
-        return None, "nsm_fd_open failed (check /dev/nsm permissions)"
+    def __init__(self, lib=None, cache_ttl=DOC_CACHE_TTL):
+        if lib is None:
+            try:
+                lib = ctypes.CDLL(find_libnsm())
+            except OSError as e:
+                raise NsmError(f"Failed to load libnsm: {e}")
+        if isinstance(lib, ctypes.CDLL):
+            try:
+                _declare(lib)
+            except AttributeError as e:
+                raise NsmError(f"libnsm is missing a symbol: {e}")
+        self._lib = lib
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._calls = 0
+        self._local = threading.local()
+        self._cache_ttl = cache_ttl
+        self._cache = {}
+        self._fd = lib.nsm_lib_init()
+        if self._fd < 0:
+            raise NsmError("nsm_lib_init failed (check /dev/nsm permissions)")
 
-    try:
-        # Prepare empty request
-        req = NsmAttestationDocRequest()
-        req.public_key = None
-        req.public_key_len = 0
-        req.nonce = None
-        req.nonce_len = 0
-        req.user_data = None
-        req.user_data_len = 0
-        
-        # Buffer (16KB)
-        buf_len = 16 * 1024
-        buf = (ctypes.c_ubyte * buf_len)()
-        out_len = ctypes.c_uint32(buf_len)
-        
-        res = libnsm.nsm_get_attestation_doc(
-            fd, 
-            ctypes.byref(req), 
-            ctypes.sizeof(req), 
-            buf, 
-            ctypes.byref(out_len)
+    def get_attestation_doc(self, public_key=None, nonce=None, user_data=None):
+        """
+        Return a raw attestation document (COSE_Sign1 bytes).
+
+        `public_key` (DER) is embedded so that services such as KMS can
+        encrypt their response to it. Documents without a nonce are reused
+        for up to `cache_ttl` seconds.
+        """
+        for name, value in (('public_key', public_key), ('nonce', nonce), ('user_data', user_data)):
+            if value is not None and len(value) > MAX_FIELD_SIZE:
+                raise NsmError(f"{name} exceeds {MAX_FIELD_SIZE} bytes")
+
+        key = None
+        if nonce is None and self._cache_ttl > 0:
+            key = (bytes(public_key or b''), bytes(user_data or b''))
+        with self._lock:
+            if key is not None:
+                cached = self._cache.get(key)
+                if cached and time.monotonic() - cached[0] < self._cache_ttl:
+                    return cached[1]
+            if self._fd is None:
+                raise NsmError("NSM session is closed")
+            fd = self._fd
+            self._calls += 1
+        doc = None
+        try:
+            doc = self._request(fd, public_key, nonce, user_data)
+        finally:
+            with self._lock:
+                self._calls -= 1
+                if doc is not None and key is not None and self._fd is not None:
+                    self._cache_put(key, doc)
+                if not self._calls:
+                    self._idle.notify_all()
+        return doc
+
+    def _request(self, fd, public_key, nonce, user_data):
+        buf = getattr(self._local, 'buf', None)
+        if buf is None:
+            buf = self._local.buf = (ctypes.c_ubyte * MAX_DOC_SIZE)()
+            self._local.buf_len = ctypes.c_uint32()
+        buf_len = self._local.buf_len
+        buf_len.value = MAX_DOC_SIZE
+        res = self._lib.nsm_get_attestation_doc(
+            fd,
+            user_data, len(user_data or b''),
+            nonce, len(nonce or b''),
+            public_key, len(public_key or b''),
+            buf, ctypes.byref(buf_len),
         )
-        
         if res != 0:
-             return None, f"nsm_get_attestation_doc failed with code {res}"
-            
-        doc_bytes = bytes(buf[:out_len.value])
-        return base64.b64encode(doc_bytes).decode('utf-8'), None
-
-    except Exception as e:
-        return None, f"Runtime error: {e}"
-    finally:
-        libnsm.nsm_fd_close(fd)
-        libnsm.nsm_lib_exit()
+            raise NsmError(f"nsm_get_attestation_doc failed: {NSM_ERRORS.get(res, res)}")
+        return ctypes.string_at(buf, buf_len.value)
+
+    def _cache_put(self, key, doc):
+        """Cache a document, dropping expired ones and then the oldest (caller holds the lock)."""
+        now = time.monotonic()
+        for cached_key, (fetched, _) in list(self._cache.items()):
+            if now - fetched >= self._cache_ttl:
+                del self._cache[cached_key]
+        self._cache.pop(key, None)
+        while len(self._cache) >= DOC_CACHE_SIZE:
+            del self._cache[next(iter(self._cache))]
+        self._cache[key] = (now, doc)
+
+    def close(self):
+        """Release the device once requests in flight have returned; later requests raise NsmError."""
+        with self._lock:
+            fd, self._fd = self._fd, None
+            while self._calls:
+                self._idle.wait()
+            if fd is not None:
+                self._lib.nsm_lib_exit(fd)
+            self._cache.clear()
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """The process-wide NsmSession, opened on first use. Raises NsmError."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = NsmSession()
+        return _session
+
+
+def get_attestation_doc(public_key=None, nonce=None, user_data=None):
+    """
+    Get a raw attestation document from the NSM.
+
+    Returns: (document_bytes, error_message)
+    """
+    try:
+        return get_session().get_attestation_doc(public_key, nonce, user_data), None
+    except NsmError as e:
+        return None, str(e)
+
+
+def get_attestation_doc_b64():
+    """
+    Get the attestation document from the NSM and return it as a base64 string.
+    Returns: (base64_string, error_message)
+    """
+    doc, err = get_attestation_doc()
+    if doc is None:
+        return None, err
+    return base64.b64encode(doc).decode('utf-8'), None
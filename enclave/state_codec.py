@@ -0,0 +1,147 @@
+"""
+State Compression and Padding
+
+An optional stage between an AgentState's serialization and its
+encryption. Ciphertext does not compress, so agent contexts (mostly text
+and JSON) are compressed here, inside the enclave, or never: with it the
+vsock link, Temporal history and the blob store all carry the smaller
+state.
+
+Compression makes the ciphertext length depend on the contents, and
+lengths are visible outside the enclave. With padding the plaintext is
+extended to the next size bucket before encryption (zero bytes, then the
+number of bytes added as a 4-byte big-endian integer), so states only
+reveal their bucket:
+
+- `padme`: Padmé buckets (Nikitin et al., "Reducing Metadata Leakage from
+  Encrypted Files and Communication with PURBs"), at most 12% larger and
+  revealing O(log log n) bits of the length;
+- `pow2`: the next power of two;
+- a number: the next multiple of that many bytes.
+
+A sealed state records the compression and whether it is padded in its
+EncryptedState, and both are bound into the associated data, so neither
+can be changed or stripped.
+"""
+
+import os
+import struct
+import zlib
+
+# '' / none, zstd, lz4 or zlib; zstd and lz4 need the zstandard / lz4 packages
+STATE_COMPRESSION = os.environ.get('ENCLAVE_STATE_COMPRESSION', 'none')
+# Compressor level (default: the compressor's own)
+STATE_COMPRESSION_LEVEL = os.environ.get('ENCLAVE_STATE_COMPRESSION_LEVEL', '')
+# Serialized states up to this size are not compressed
+STATE_COMPRESSION_THRESHOLD = int(os.environ.get('ENCLAVE_STATE_COMPRESSION_THRESHOLD_BYTES', '512'))
+# none, padme, pow2 or a bucket size in bytes
+STATE_PADDING = os.environ.get('ENCLAVE_STATE_PADDING', 'none')
+
+DEFAULT_LEVELS = {'zstd': 3, 'lz4': 0, 'zlib': 6}
+PAD_TRAILER = struct.Struct('!I')
+
+
+class StateCodecError(ValueError):
+    """A decrypted state's padding or compression is malformed, or its compressor is not installed."""
+
+
+def load_compressor(name, level=None):
+    """Return (compress, decompress) for a compression name."""
+    level = DEFAULT_LEVELS.get(name) if level is None else level
+    if name == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=level).compress, zstandard.ZstdDecompressor().decompress
+    if name == 'lz4':
+        import lz4.frame
+        return (lambda data: lz4.frame.compress(data, compression_level=level)), lz4.frame.decompress
+    if name == 'zlib':
+        return (lambda data: zlib.compress(data, level)), zlib.decompress
+    raise ValueError(f"Unknown state compression: {name!r}")
+
+
+def padme(length):
+    """Padmé bucket for `length`: keep the top log2(log2(length)) + 1 bits, round up the rest."""
+    if length < 2:
+        return length
+    exponent = length.bit_length() - 1
+    low_bits = exponent - exponent.bit_length()
+    mask = (1 << low_bits) - 1
+    return (length + mask) & ~mask
+
+
+def padded_size(length, padding):
+    """Size of a `length`-byte plaintext plus the padding trailer, rounded up to its bucket."""
+    length += PAD_TRAILER.size
+    if padding == 'padme':
+        return padme(length)
+    if padding == 'pow2':
+        return 1 << (length - 1).bit_length()
+    bucket = int(padding)
+    return -(-length // bucket) * bucket
+
+
+def encoding(compression, padded):
+    """Associated data suffix for a state's compression and padding ('' for neither)."""
+    if not (compression or padded):
+        return ''
+    return f"{compression}|{'padded' if padded else ''}"
+
+
+class StateCodec:
+    """Compresses and pads serialized states before encryption, and undoes it after decryption."""
+
+    def __init__(self, compression=STATE_COMPRESSION, level=STATE_COMPRESSION_LEVEL,
+                 threshold=STATE_COMPRESSION_THRESHOLD, padding=STATE_PADDING):
+        compression = '' if compression in ('', 'none') else compression
+        level = int(level) if level not in (None, '') else None
+        self._compress = None
+        if compression:
+            try:
+                self._compress = load_compressor(compression, level)[0]
+            except ImportError:
+                compression = 'zlib'
+                self._compress = load_compressor(compression, level)[0]
+        self.compression = compression
+        self.threshold = threshold
+        self.padding = '' if padding in ('', 'none') else padding
+        if self.padding:
+            padded_size(0, self.padding)  # reject unknown settings now
+        self._decompressors = {}
+
+    def encode(self, plaintext):
+        """Return (buffer to encrypt, compression used, padded)."""
+        compression = ''
+        if self._compress and len(plaintext) > self.threshold:
+            compressed = self._compress(plaintext)
+            if len(compressed) < len(plaintext):
+                plaintext, compression = compressed, self.compression
+        if not self.padding:
+            return plaintext, compression, False
+        buffer = bytearray(padded_size(len(plaintext), self.padding))
+        buffer[:len(plaintext)] = plaintext
+        PAD_TRAILER.pack_into(buffer, len(buffer) - PAD_TRAILER.size, len(buffer) - len(plaintext))
+        return buffer, compression, True
+
+    def decode(self, plaintext, compression, padded):
+        """Undo encode() on a decrypted buffer; raises StateCodecError."""
+        if padded:
+            if len(plaintext) < PAD_TRAILER.size:
+                raise StateCodecError("Bad state padding")
+            (added,) = PAD_TRAILER.unpack_from(plaintext, len(plaintext) - PAD_TRAILER.size)
+            if not PAD_TRAILER.size <= added <= len(plaintext):
+                raise StateCodecError("Bad state padding")
+            plaintext = memoryview(plaintext)[:len(plaintext) - added]
+        if compression:
+            if compression not in self._decompressors:
+                try:
+                    self._decompressors[compression] = load_compressor(compression)[1]
+                except (ImportError, ValueError) as e:
+                    raise StateCodecError(f"Cannot decompress {compression} state: {e}")
+            try:
+                plaintext = self._decompressors[compression](plaintext)
+            except Exception as e:
+                raise StateCodecError(f"Corrupt {compression} state: {e}")
+        return plaintext
+
+    def describe(self):
+        return {"state_compression": self.compression or 'none', "state_padding": self.padding or 'none'}
@@ -0,0 +1,287 @@
+"""
+State Encryption
+
+AES-256-GCM encryption of agent state inside the enclave.
+
+Encrypted state is laid out as
+
+    nonce (12 bytes) || ciphertext || tag (16 bytes)
+
+with a fresh random nonce per encryption. The associated data binds each
+ciphertext to its workflow id and iteration, so state cannot be replayed
+into another workflow or rolled back to an earlier step.
+
+Large states are encrypted as a STREAM (Hoang et al., "Online
+Authenticated-Encryption and its Nonce-Reuse Misuse-Resistance"): a
+sequence of independently sealed segments whose nonces are
+
+    prefix (7 bytes, random per stream) || counter (4 bytes) || last (1 byte)
+
+so segments can be processed one at a time, while reordering, dropping or
+truncating segments still fails authentication.
+
+States are not encrypted under the TSK itself but under data keys derived
+from it with HKDF-SHA256, one per workflow (or per workflow and agent) and
+key generation (DataKeys). The key id stored with a state names its
+generation, so rotating to a new generation is an in-memory counter bump
+rather than a new TSK and a KMS round trip per enclave. States with an
+empty key id were encrypted under the TSK directly and remain readable.
+"""
+
+import collections
+import os
+import struct
+import threading
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+NONCE_SIZE = 12
+TAG_SIZE = 16
+OVERHEAD = NONCE_SIZE + TAG_SIZE
+AAD_PREFIX = b'cse-maw/state/v1'
+DATA_KEY_INFO = b'cse-maw/data-key/v1'
+STREAM_PREFIX_SIZE = 7
+_MAX_SEGMENTS = 2 ** 32
+
+# encrypt_into/decrypt_into (cryptography >= 46) write straight into a
+# caller-provided buffer, avoiding a copy of large contexts
+_HAS_INTO = hasattr(AESGCM, 'encrypt_into')
+
+_aead_lock = threading.Lock()
+_aead_key = None
+_aead = None
+
+__all__ = ['InvalidTag', 'KeyRetired', 'aead_for', 'build_aad', 'derive_key', 'DataKeys', 'encrypt_into',
+           'decrypt_view', 'encrypt_state', 'decrypt_state', 'encrypt_parts', 'decrypt_parts', 'StreamEncryptor',
+           'StreamDecryptor']
+
+
+class KeyRetired(Exception):
+    """The state's key generation was retired by DataKeys.rotate(retire=True)."""
+
+
+def aead_for(key):
+    """Return an AESGCM instance for `key`, reusing the last one built."""
+    global _aead_key, _aead
+    with _aead_lock:
+        if _aead is None or _aead_key != key:
+            _aead = AESGCM(key)
+            _aead_key = key
+        return _aead
+
+
+def derive_key(master, workflow_id, key_id):
+    """The 32-byte data key for `workflow_id` and `key_id`, derived from the TSK with HKDF-SHA256."""
+    workflow_id = workflow_id.encode('utf-8')
+    info = DATA_KEY_INFO + struct.pack('!H', len(workflow_id)) + workflow_id + key_id.encode('utf-8')
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=info).derive(bytes(master))
+
+
+class DataKeys:
+    """
+    Per-workflow data keys derived from the TSK, with an LRU of their AESGCM contexts.
+
+    Key ids are `<generation>`, or `<generation>:<agent_id>` when `scope`
+    is 'agent'; with scope 'none' new states use the TSK directly (empty
+    key id). rotate() starts a new generation for new states; older states
+    stay readable unless their generation is retired. The cache is cleared
+    when the TSK changes.
+    """
+
+    def __init__(self, scope='workflow', cache_size=1024):
+        if scope not in ('workflow', 'agent', 'none'):
+            raise ValueError(f"Unknown data key scope: {scope!r}")
+        self.scope = scope
+        self.cache_size = cache_size
+        self.generation = 1
+        self.min_generation = 1
+        self._lock = threading.Lock()
+        self._master = None
+        self._cache = collections.OrderedDict()
+        self.derived = 0
+
+    def new_key_id(self, agent_id=''):
+        """Key id for a state sealed now."""
+        if self.scope == 'none':
+            return ''
+        if self.scope == 'agent':
+            return f'{self.generation}:{agent_id}'
+        return str(self.generation)
+
+    def aead(self, master, workflow_id, key_id):
+        """AESGCM for a state's key; raises KeyRetired, or InvalidTag for a malformed key id."""
+        if not key_id:
+            # Sealed under the TSK itself, older than any generation
+            if self.scope != 'none' and self.min_generation > 1:
+                raise KeyRetired('(TSK)')
+            return aead_for(master)
+        try:
+            generation = int(key_id.partition(':')[0])
+        except ValueError:
+            raise InvalidTag()
+        if generation < self.min_generation:
+            raise KeyRetired(key_id)
+        cache_key = (workflow_id, key_id)
+        with self._lock:
+            if self._master != master:
+                self._cache.clear()
+                self._master = bytes(master)
+            aead = self._cache.get(cache_key)
+            if aead is not None:
+                self._cache.move_to_end(cache_key)
+                return aead
+        aead = AESGCM(derive_key(master, workflow_id, key_id))
+        with self._lock:
+            self.derived += 1
+            if self._master == master:
+                self._cache[cache_key] = aead
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return aead
+
+    def advance(self, generation, min_generation=0):
+        """Move to at least `generation` (and retire below `min_generation`); never goes back."""
+        with self._lock:
+            self.generation = max(self.generation, generation, min_generation)
+            self.min_generation = max(self.min_generation, min_generation)
+
+    def rotate(self, retire=False):
+        """Start a new key generation; with `retire`, states of older generations can no longer be opened."""
+        with self._lock:
+            self.generation += 1
+            if retire:
+                self.min_generation = self.generation
+                self._cache.clear()
+            return self.generation
+
+    def describe(self):
+        with self._lock:
+            return {"data_key_scope": self.scope, "data_key_generation": self.generation,
+                    "data_key_min_generation": self.min_generation, "data_keys_cached": len(self._cache)}
+
+
+def build_aad(workflow_id, iteration, encoding=''):
+    """
+    Associated data for a state; `encoding` names how the plaintext was
+    transformed before encryption (see state_codec.encoding), if at all.
+    """
+    workflow_id = workflow_id.encode('utf-8')
+    aad = AAD_PREFIX + struct.pack('!H', len(workflow_id)) + workflow_id + struct.pack('!Q', iteration)
+    return aad + b'|' + encoding.encode('utf-8') if encoding else aad
+
+
+def encrypt_into(aead, plaintext, workflow_id, iteration, out, encoding=''):
+    """
+    Encrypt `plaintext` (bytes-like) as ciphertext || tag into `out`, a
+    writable buffer of len(plaintext) + TAG_SIZE bytes. Returns the fresh nonce.
+    """
+    nonce = os.urandom(NONCE_SIZE)
+    aad = build_aad(workflow_id, iteration, encoding)
+    if _HAS_INTO:
+        aead.encrypt_into(nonce, plaintext, aad, out)
+    else:
+        out[:] = aead.encrypt(nonce, bytes(plaintext), aad)
+    return nonce
+
+
+def decrypt_view(aead, nonce, sealed, workflow_id, iteration, encoding=''):
+    """
+    Decrypt `sealed` (a bytes-like ciphertext || tag, e.g. a memoryview into
+    a received frame) into a new buffer, without copying the input.
+    """
+    if len(nonce) != NONCE_SIZE or len(sealed) < TAG_SIZE:
+        raise InvalidTag()
+    aad = build_aad(workflow_id, iteration, encoding)
+    if _HAS_INTO:
+        out = bytearray(len(sealed) - TAG_SIZE)
+        aead.decrypt_into(bytes(nonce), sealed, aad, out)
+        return out
+    return aead.decrypt(bytes(nonce), bytes(sealed), aad)
+
+
+def encrypt_state(aead, plaintext, workflow_id, iteration):
+    """Encrypt `plaintext` (bytes-like) into a new nonce || ciphertext || tag buffer."""
+    out = bytearray(NONCE_SIZE + len(plaintext) + TAG_SIZE)
+    out[:NONCE_SIZE] = encrypt_into(aead, plaintext, workflow_id, iteration, memoryview(out)[NONCE_SIZE:])
+    return out
+
+
+def decrypt_state(aead, blob, workflow_id, iteration):
+    """
+    Decrypt a nonce || ciphertext || tag buffer.
+
+    Raises InvalidTag if the blob was tampered with, or was produced for a
+    different key, workflow or iteration.
+    """
+    if len(blob) < OVERHEAD:
+        raise InvalidTag()
+    view = memoryview(blob)
+    return decrypt_view(aead, view[:NONCE_SIZE], view[NONCE_SIZE:], workflow_id, iteration)
+
+
+def encrypt_parts(aead, plaintext, workflow_id, iteration):
+    """Like encrypt_state, but return (nonce, ciphertext, tag) views of the result."""
+    view = memoryview(encrypt_state(aead, plaintext, workflow_id, iteration))
+    return view[:NONCE_SIZE], view[NONCE_SIZE:-TAG_SIZE], view[-TAG_SIZE:]
+
+
+def decrypt_parts(aead, nonce, ciphertext, tag, workflow_id, iteration, encoding=''):
+    """Decrypt state stored as separate nonce, ciphertext and tag fields."""
+    if len(tag) != TAG_SIZE:
+        raise InvalidTag()
+    sealed = bytearray(len(ciphertext) + TAG_SIZE)
+    sealed[:len(ciphertext)] = ciphertext
+    sealed[len(ciphertext):] = tag
+    return decrypt_view(aead, nonce, sealed, workflow_id, iteration, encoding)
+
+
+def stream_nonce(prefix, counter, last):
+    return prefix + struct.pack('!IB', counter, 1 if last else 0)
+
+
+class _Stream:
+    def __init__(self, aead, workflow_id, iteration, prefix):
+        if len(prefix) != STREAM_PREFIX_SIZE:
+            raise ValueError(f"STREAM nonce prefix must be {STREAM_PREFIX_SIZE} bytes")
+        self.aead = aead
+        self.prefix = bytes(prefix)
+        self.aad = build_aad(workflow_id, iteration)
+        self.counter = 0
+        self.finished = False
+
+    def _next_nonce(self, last):
+        if self.finished:
+            raise ValueError("stream already finished")
+        if self.counter >= _MAX_SEGMENTS:
+            raise ValueError("stream segment counter exhausted")
+        nonce = stream_nonce(self.prefix, self.counter, last)
+        self.counter += 1
+        self.finished = last
+        return nonce
+
+
+class StreamEncryptor(_Stream):
+    """Seal a state segment by segment; each output is ciphertext || tag."""
+
+    def __init__(self, aead, workflow_id, iteration, prefix=None):
+        super().__init__(aead, workflow_id, iteration, prefix or os.urandom(STREAM_PREFIX_SIZE))
+
+    def encrypt_chunk(self, chunk, last=False):
+        return self.aead.encrypt(self._next_nonce(last), bytes(chunk), self.aad)
+
+
+class StreamDecryptor(_Stream):
+    """
+    Open the segments of a StreamEncryptor stream, in order.
+
+    Raises InvalidTag for a tampered, reordered or misplaced segment,
+    including a non-final segment passed with `last=True` (truncation).
+    """
+
+    def decrypt_chunk(self, segment, last=False):
+        if len(segment) < TAG_SIZE:
+            raise InvalidTag()
+        return self.aead.decrypt(self._next_nonce(last), bytes(segment), self.aad)
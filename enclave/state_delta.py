@@ -0,0 +1,160 @@
+"""
+Context Deltas
+
+Agent contexts mostly grow or change a little per iteration (a turn
+appended, a field updated), yet without deltas every step decrypts,
+transfers and re-encrypts the whole context. In delta mode the enclave
+seals only what changed:
+
+- a delta state's plaintext is a ContextDelta: the new AgentState without
+  its data, the SHA-256 of the previous iteration's data (its base) and a
+  patch from that data to the new one;
+- the enclave keeps the bases of the deltas it sealed in a ContextCache,
+  an LRU of plaintext contexts addressed by workflow, iteration and
+  SHA-256, so the next step rebuilds the context from the cached base and
+  the patch;
+- the host keeps the last full state and the deltas since (the state's
+  chain). Whenever the enclave no longer holds a base (evicted, restarted,
+  or another enclave) the host sends the chain and the enclave replays it.
+
+A patch replaces one span of the base: it keeps `prefix` bytes from the
+start and `suffix` bytes from the end (two 8-byte big-endian lengths) and
+puts the bytes that follow them in between. That covers appends, which
+are the common case, in a patch the size of the appended bytes. Whether
+a step seals a delta or a full state is decided by use_delta(): a full
+state is sealed once the host's chain would grow past MAX_CHAIN deltas
+or MAX_RATIO of the context's size, which bounds both the replay on a
+cache miss and what the host holds.
+"""
+
+import collections
+import hashlib
+import os
+import struct
+import threading
+
+# Plaintext contexts cached as delta bases (0 = never seal deltas)
+CACHE_BYTES = int(os.environ.get('ENCLAVE_CONTEXT_CACHE_BYTES', str(64 * 1024 * 1024)))
+# Seal a full state once the host's deltas would exceed this fraction of the context
+MAX_RATIO = float(os.environ.get('ENCLAVE_DELTA_MAX_RATIO', '0.5'))
+# ... or this many deltas
+MAX_CHAIN = int(os.environ.get('ENCLAVE_DELTA_MAX_CHAIN', '16'))
+
+SPLICE = struct.Struct('!QQ')
+_BLOCK = 64 * 1024
+
+
+class DeltaError(ValueError):
+    """A delta's patch is malformed or does not fit its base."""
+
+
+def context_digest(data):
+    return hashlib.sha256(data).digest()
+
+
+def _first_difference(a, b, start, end):
+    """Index of the first difference of a and b in [start, end), which must hold one."""
+    while end - start > 1:
+        middle = (start + end) // 2
+        if a[start:middle] == b[start:middle]:
+            start = middle
+        else:
+            end = middle
+    return start
+
+
+def common_prefix(a, b, limit=None):
+    """Length of the common prefix of bytes a and b (at most `limit`)."""
+    limit = min(len(a), len(b)) if limit is None else limit
+    for start in range(0, limit, _BLOCK):
+        end = min(start + _BLOCK, limit)
+        if a[start:end] != b[start:end]:
+            return _first_difference(a, b, start, end)
+    return limit
+
+
+def common_suffix(a, b, limit=None):
+    """Length of the common suffix of bytes a and b (at most `limit`)."""
+    limit = min(len(a), len(b)) if limit is None else limit
+    # Compare back to front as prefixes of the reversed tails
+    a_tail, b_tail = a[len(a) - limit:][::-1], b[len(b) - limit:][::-1]
+    return common_prefix(a_tail, b_tail, limit)
+
+
+def make_patch(base, data):
+    """Patch turning `base` into `data` (both bytes)."""
+    prefix = common_prefix(base, data)
+    suffix = common_suffix(base, data, min(len(base), len(data)) - prefix)
+    return SPLICE.pack(prefix, suffix) + data[prefix:len(data) - suffix]
+
+
+def apply_patch(base, patch):
+    """Undo make_patch(base, data) given base; raises DeltaError."""
+    if len(patch) < SPLICE.size:
+        raise DeltaError("Truncated patch")
+    prefix, suffix = SPLICE.unpack_from(patch)
+    if prefix + suffix > len(base):
+        raise DeltaError("Patch does not fit its base")
+    return b''.join((base[:prefix], memoryview(patch)[SPLICE.size:], base[len(base) - suffix:]))
+
+
+def use_delta(patch_size, data_size, chain_length, chain_bytes, max_ratio=MAX_RATIO, max_chain=MAX_CHAIN):
+    """
+    Whether to seal a patch of `patch_size` bytes rather than the full
+    `data_size`-byte context, given the deltas the host already holds.
+    """
+    return chain_length < max_chain and chain_bytes + patch_size <= max_ratio * data_size
+
+
+class ContextCache:
+    """
+    LRU of plaintext contexts (AgentState data) by (workflow id, iteration,
+    SHA-256), holding at most `max_bytes` of data.
+    """
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._cache = collections.OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, workflow_id, iteration, data):
+        """Cache `data` (bytes) as a delta base; returns its digest, or None if it is too large to cache."""
+        if len(data) > self.max_bytes:
+            return None
+        digest = context_digest(data)
+        cache_key = (workflow_id, iteration, digest)
+        with self._lock:
+            if cache_key in self._cache:
+                self._cache.move_to_end(cache_key)
+                return digest
+            self._cache[cache_key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._bytes -= len(evicted)
+        return digest
+
+    def get(self, workflow_id, iteration, digest):
+        """The cached context, or None."""
+        cache_key = (workflow_id, iteration, bytes(digest))
+        with self._lock:
+            data = self._cache.get(cache_key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._cache.move_to_end(cache_key)
+            return data
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
+
+    def describe(self):
+        with self._lock:
+            return {"context_cache_entries": len(self._cache), "context_cache_bytes": self._bytes,
+                    "context_cache_hits": self.hits, "context_cache_misses": self.misses}
@@ -4,100 +4,115 @@ Temporal Activities
 Activities that communicate with the enclave via vsock.
 """
 
+import asyncio
+import base64
 import socket
 import os
 import json
 import os
+import random
 import time
 from datetime import datetime
 from temporalio import activity
 import logging
 from functools import wraps
 
+from typing import Union
+
+import blob_store
+from blob_store import offload_state, resolve_state
+from credentials import PROJECT_ROOT, get_credential_provider, get_tsk_file
+from enclave_client import (
+    ENCLAVE_ADDRESS, RECONFIGURE_ERRORS, EnclaveUnavailableError, get_enclave_pool, set_configure_hook,
+)
+from common import framing  # common/, put on sys.path by telemetry
+import state_pb2
+import telemetry
+
 logger = logging.getLogger(__name__)
 
+# Fraction of activities that force a fresh configure (KMS decrypt with
+# attestation, logged to CloudTrail) even while the enclave holds a valid
+# TSK. 1.0 audits every workflow; 0.0 only reconfigures when required.
+ATTESTATION_SAMPLE_RATE = float(os.environ.get('ATTESTATION_SAMPLE_RATE', '0'))
 
-def get_kms_config():
-    """Get KMS configuration from local files and AWS credentials from IMDS"""
-    # Read from project root - handle both running from host/ and project root
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    if os.path.basename(current_dir) == 'host':
-        project_root = os.path.dirname(current_dir)
-    else:
-        project_root = current_dir
-    
-    logger.info(f"Project root: {project_root}")
-    
-    # Get KMS key ID from state or environment
-    kms_key_id = os.environ.get('KMS_KEY_ID', '')
-    
-    # Read encrypted TSK
-    tsk_path = os.path.join(project_root, 'encrypted-tsk.b64')
-    try:
-        with open(tsk_path, 'r') as f:
-            encrypted_tsk = f.read().strip()
-        logger.info(f"Loaded encrypted TSK from {tsk_path}")
-    except FileNotFoundError:
-        logger.error(f"encrypted-tsk.b64 not found at {tsk_path}")
-        encrypted_tsk = ''
-    
-    # Fetch AWS credentials from IMDS (v2)
-    import requests
+# AES-GCM layout of the legacy JSON state format
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+# Plaintext input larger than this is sent with process_stream, in chunks of
+# STREAM_CHUNK_BYTES, so the enclave never holds the whole state at once.
+# States produced that way are always streamed on later steps.
+STREAM_THRESHOLD_BYTES = int(os.environ.get('ENCLAVE_STREAM_THRESHOLD_BYTES', str(8 * 1024 * 1024)))
+STREAM_CHUNK_BYTES = int(os.environ.get('ENCLAVE_STREAM_CHUNK_BYTES', str(1024 * 1024)))
+
+# Let the enclave return states as deltas against their previous iteration
+# (see process_delta_state). Only process_in_enclave asks for them: pipeline
+# states may be merged, and merge takes full states only
+DELTA_STATES = os.environ.get('ENCLAVE_DELTA_STATES', '0').lower() in ('1', 'true', 'yes')
+
+
+async def get_kms_config():
+    """
+    Get the configure settings: KMS key, encrypted TSK and the worker's AWS
+    credentials, all cached between calls (see credentials.py).
+    """
     try:
-        # Get IMDSv2 session token
-        token_response = requests.put(
-            'http://169.254.169.254/latest/api/token',
-            headers={'X-aws-ec2-metadata-token-ttl-seconds': '21600'},
-            timeout=5
-        )
-        token_response.raise_for_status()
-        token = token_response.text
-        
-        # Get IAM role name (with token)
-        role_response = requests.get(
-            'http://169.254.169.254/latest/meta-data/iam/security-credentials/',
-            headers={'X-aws-ec2-metadata-token': token},
-            timeout=5
-        )
-        role_response.raise_for_status()
-        role_name = role_response.text.strip()
-        
-        # Get credentials (with token)
-        creds_response = requests.get(
-            f'http://169.254.169.254/latest/meta-data/iam/security-credentials/{role_name}',
-            headers={'X-aws-ec2-metadata-token': token},
-            timeout=5
-        )
-        creds_response.raise_for_status()
-        creds = creds_response.json()
-        
-        aws_access_key_id = creds['AccessKeyId']
-        aws_secret_access_key = creds['SecretAccessKey']
-        aws_session_token = creds['Token']
-        logger.info("AWS credentials fetched from IMDS")
+        creds = dict(await get_credential_provider().get_credentials())
     except Exception as e:
         logger.error(f"Failed to fetch AWS credentials from IMDS: {e}")
-        aws_access_key_id = None
-        aws_secret_access_key = None
-        aws_session_token = None
+        creds = {'aws_access_key_id': None, 'aws_secret_access_key': None, 'aws_session_token': None}
     
     return {
-        'kms_key_id': kms_key_id,
-        'encrypted_tsk': encrypted_tsk,
+        'kms_key_id': os.environ.get('KMS_KEY_ID', ''),
+        'encrypted_tsk': get_tsk_file().read(),
         'region': os.environ.get('AWS_REGION', 'ap-southeast-1'),
-        'aws_access_key_id': aws_access_key_id,
-        'aws_secret_access_key': aws_secret_access_key,
-        'aws_session_token': aws_session_token
+        # Data key generation the enclaves start from (survives enclave restarts)
+        'data_key_generation': int(os.environ.get('DATA_KEY_GENERATION', '0')),
+        'data_key_min_generation': int(os.environ.get('DATA_KEY_MIN_GENERATION', '0')),
+        **creds,
     }
 
 
 # Global flag to track if enclave is configured
 _enclave_configured = False
+# In-flight configure shared by concurrent activities
+_configure_task = None
+
+
+async def request_enclave(msg_type, meta=None, payload=b'', timeout=10):
+    """
+    Send one framed request over the worker's enclave connection pool.
+    
+    Returns (response_meta, response_payload).
+    """
+    return await get_enclave_pool().request(msg_type, meta, payload, timeout)
 
 
 def retry_on_failure(max_retries=3, delay=1, backoff=2):
     """Decorator to retry function on failure with exponential backoff"""
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                retries = 0
+                current_delay = delay
+                
+                while retries < max_retries:
+                    try:
+                        return await func(*args, **kwargs)
+                    except Exception as e:
+                        retries += 1
+                        if retries >= max_retries:
+                            logger.error(f"{func.__name__} failed after {max_retries} retries: {e}")
+                            raise
+                        
+                        logger.warning(f"{func.__name__} failed (attempt {retries}/{max_retries}): {e}. Retrying in {current_delay}s...")
+                        await asyncio.sleep(current_delay)
+                        current_delay *= backoff
+            
+            return async_wrapper
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
             retries = 0
@@ -120,143 +135,418 @@ def retry_on_failure(max_retries=3, delay=1, backoff=2):
     return decorator
 
 
-@retry_on_failure(max_retries=3, delay=2)
-def configure_enclave():
-    """Send configuration to enclave with retry logic
+async def send_configure(enclave=None):
+    """Send one configure request to `enclave` (an EnclaveMember), or to whichever enclave the dispatcher picks
     
-    Always calls configure to ensure KMS decrypt is triggered,
-    guaranteeing CloudTrail logs every workflow's attestation.
+    Each call triggers a KMS decrypt in the enclave, which logs an
+    attestation event to CloudTrail and resets the enclave's TSK lifetime.
+    The dispatcher also calls this for each enclave it routes to before
+    that enclave is configured.
     """
     global _enclave_configured
     
-    logger.info("Configuring enclave with KMS settings...")
-    
-    config = get_kms_config()
+    with telemetry.PHASE_SECONDS.time(phase='credentials'):
+        config = await get_kms_config()
     
-    sock = None
-    try:
-        sock = socket.socket(socket.AF_VSOCK, socket.SOCK_STREAM)
-        sock.settimeout(10)
-        
-        logger.debug("Connecting to enclave at CID 16, port 5000...")
-        sock.connect((16, 5000))
-        
-        # Send configuration
-        config_request = {
-            'type': 'configure',
-            **config
-        }
-        sock.sendall(json.dumps(config_request).encode())
-        
-        # Wait for confirmation (read until valid JSON)
-        data = b""
-        start_time = time.time()
-        while time.time() - start_time < 10: # 10s timeout
-            try:
-                chunk = sock.recv(65536) # Read larger chunks
-                if not chunk:
-                    break
-                data += chunk
-                result = json.loads(data.decode())
-                break # Valid JSON received
-            except json.JSONDecodeError:
-                continue # Keep reading
+    with telemetry.PHASE_SECONDS.time(phase='configure'):
+        if enclave is None:
+            result, _ = await request_enclave('configure', config)
         else:
-            # If we exit loop without breaking, check if we have data that failed to parse
-             if data:
-                 try: 
-                     result = json.loads(data.decode())
-                 except:
-                     raise Exception(f"Timeout waiting for valid JSON response. Received {len(data)} bytes.")
-             else:
-                 raise Exception("Timeout waiting for valid JSON response (no data)")
+            logger.debug(f"Configuring enclave at {enclave.address}...")
+            with telemetry.span('enclave.configure', **{'enclave.address': enclave.address}) as current:
+                trace_id = telemetry.trace_id(current)
+                result, _ = await enclave.pool.request('configure', dict(config, trace_id=trace_id) if trace_id else config)
+                telemetry.record_enclave_timings(current, result)
+    
+    if result.get('status') == 'ok':
+        logger.info("Enclave configured successfully")
+        # AUTOMATIC PROOF: Save attestation document if returned
+        att_doc = result.get('attestation_document')
+        if att_doc:
+            doc_path = os.path.join(PROJECT_ROOT, 'attestation_doc.b64')
+            with open(doc_path, 'w') as f:
+                f.write(att_doc)
+            logger.info(f"✅ SAVED ATTESTATION EVIDENCE TO: {doc_path}")
         
-        if result.get('status') == 'ok':
-            logger.info("Enclave configured successfully")
-            # AUTOMATIC PROOF: Save attestation document if returned
-            att_doc = result.get('attestation_document')
-            if att_doc:
-                doc_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'attestation_doc.b64')
-                # If running in host/ subdir, go up one level
-                if os.path.basename(os.path.dirname(doc_path)) == 'host':
-                    doc_path = os.path.join(os.path.dirname(os.path.dirname(doc_path)), 'attestation_doc.b64')
-                
-                with open(doc_path, 'w') as f:
-                    f.write(att_doc)
-                logger.info(f"✅ SAVED ATTESTATION EVIDENCE TO: {doc_path}")
-            
-            att_err = result.get('attestation_error')
-            if att_err:
-                logger.error(f"⚠️ Enclave reported attestation error: {att_err}")
+        att_err = result.get('attestation_error')
+        if att_err:
+            logger.error(f"⚠️ Enclave reported attestation error: {att_err}")
 
-            _enclave_configured = True
-        else:
-            error_msg = result.get('msg', 'unknown error')
-            error_details = result.get('details', '')
-            raise Exception(f"Configuration failed: {error_msg}. Details: {error_details}")
-    except socket.timeout:
+        _enclave_configured = True
+    else:
+        error_msg = result.get('msg', 'unknown error')
+        error_details = result.get('details', '')
+        raise Exception(f"Configuration failed: {error_msg}. Details: {error_details}")
+
+
+set_configure_hook(send_configure)
+
+
+@retry_on_failure(max_retries=3, delay=2)
+async def configure_enclave():
+    """Send configuration to an enclave with retry logic (see send_configure)"""
+    logger.info("Configuring enclave with KMS settings...")
+    
+    try:
+        await send_configure()
+    except (socket.timeout, asyncio.TimeoutError):
         raise Exception("Timeout connecting to enclave. Is the enclave running? Check with 'nitro-cli describe-enclaves'")
-    except ConnectionRefusedError:
-        raise Exception("Connection refused by enclave. Ensure enclave is running and listening on port 5000")
-    except Exception as e:
-        # The retry decorator will log and re-raise, so we just re-raise here.
-        # If this is the last retry, the decorator will log the final error.
-        raise
-    finally:
-        if sock:
-            sock.close()
+    except EnclaveUnavailableError as e:
+        raise Exception(f"Cannot connect to any enclave ({e}). Ensure the enclave is running and listening on {ENCLAVE_ADDRESS}")
+
+
+async def ensure_configured():
+    """Run configure_enclave, joining a configure already in flight instead of starting another."""
+    global _configure_task
+    task = _configure_task
+    if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+        task = _configure_task = asyncio.ensure_future(configure_enclave())
+    await asyncio.shield(task)
 
 
 @activity.defn
+@telemetry.traced_activity
 async def health_check() -> dict:
     """Health check activity to verify worker and enclave status"""
     return {
         "status": "healthy",
         "enclave_configured": _enclave_configured,
+        "enclaves": await get_enclave_pool().check(),
         "timestamp": datetime.utcnow().isoformat(),
         "worker": "running"
     }
 
 
+def current_workflow_id():
+    """Workflow id of the running activity, or '' outside an activity."""
+    try:
+        return activity.info().workflow_id
+    except RuntimeError:
+        return ''
+
+
+def parse_state(request_data: Union[str, bytes]):
+    """
+    Split activity input into (process meta, payload bytes).
+    
+    bytes are a serialized EncryptedState from a previous process_in_enclave
+    call. A str is either the legacy JSON result (base64 nonce || ciphertext
+    || tag), converted to an EncryptedState, or initial plaintext input.
+    """
+    if isinstance(request_data, (bytes, bytearray)):
+        return {'encrypted': True}, bytes(request_data)
+    
+    try:
+        legacy = json.loads(request_data)
+    except ValueError:
+        legacy = None
+    if isinstance(legacy, dict) and 'ciphertext' in legacy:
+        blob = base64.b64decode(legacy['ciphertext'])
+        encrypted = state_pb2.EncryptedState(
+            nonce=blob[:NONCE_SIZE],
+            ciphertext=blob[NONCE_SIZE:-TAG_SIZE],
+            tag=blob[-TAG_SIZE:],
+            workflow_id=legacy.get('workflow_id', ''),
+            iteration=legacy.get('iteration', 0),
+        )
+        return {'encrypted': True, 'legacy': True}, encrypted.SerializeToString()
+    
+    return {'workflow_id': current_workflow_id()}, request_data.encode('utf-8')
+
+
+def batch_item(request_data: Union[str, bytes], workflow_id=''):
+    """Build a ProcessItem from process_in_enclave-style input (see parse_state)."""
+    meta, payload = parse_state(request_data)
+    return state_pb2.ProcessItem(
+        payload=payload,
+        encrypted=bool(meta.get('encrypted')),
+        legacy=bool(meta.get('legacy')),
+        workflow_id=meta.get('workflow_id') or workflow_id,
+    )
+
+
+async def load_state(payload):
+    """
+    Return a serialized EncryptedState with claim-checked ciphertext (its
+    own and its chain's) fetched back (see blob_store.py).
+    """
+    encrypted = state_pb2.EncryptedState.FromString(payload)
+    states = [encrypted, *encrypted.chain]
+    if not any(state.HasField('blob') for state in states):
+        return bytes(payload)
+    for state in states:
+        await resolve_state(state)
+    return encrypted.SerializeToString()
+
+
+async def store_state(payload, workflow_id):
+    """Claim-check the large ciphertexts of a serialized EncryptedState and its chain; returns what to hand to Temporal."""
+    if not blob_store.CLAIM_CHECK_THRESHOLD or len(payload) <= blob_store.CLAIM_CHECK_THRESHOLD:
+        return bytes(payload)
+    encrypted = state_pb2.EncryptedState.FromString(payload)
+    offloaded = [await offload_state(state, workflow_id) for state in (encrypted, *encrypted.chain)]
+    if not any(offloaded):
+        return bytes(payload)
+    return encrypted.SerializeToString()
+
+
+async def send_process_request(meta, payload, msg_type='process', with_chain=None):
+    """
+    Send one process request to the enclave; returns (response_meta, payload).
+    
+    The enclave dispatcher reconfigures and retries once if the enclave has
+    lost its TSK. If the payload is a delta whose base the enclave no longer
+    holds, retries once with the payload returned by `with_chain` (a
+    coroutine function), the delta with its chain.
+    """
+    result, body = await request_enclave(msg_type, meta, payload)
+    if result.get('msg') == 'delta_base_missing' and with_chain is not None:
+        logger.info("Enclave does not hold the delta's base, sending its chain...")
+        result, body = await request_enclave(msg_type, meta, await with_chain())
+    
+    if 'error' in result or result.get('status') == 'error':
+        raise Exception(result.get('error') or result.get('msg'))
+    return result, body
+
+
+def stream_request(meta, payload):
+    """
+    Return (stream meta, data, segment size) if this state must be streamed, else None.
+    
+    Streamed EncryptedStates (chunk_size set) always are; plaintext input is
+    once it exceeds STREAM_THRESHOLD_BYTES.
+    """
+    if meta.get('legacy'):
+        return None
+    if meta.get('encrypted'):
+        encrypted = state_pb2.EncryptedState.FromString(payload)
+        if not encrypted.chunk_size:
+            return None
+        return {
+            'encrypted': True,
+            'workflow_id': encrypted.workflow_id,
+            'iteration': encrypted.iteration,
+            'nonce_prefix': encrypted.nonce.hex(),
+            'key_id': encrypted.key_id,
+            'chunk_size': encrypted.chunk_size,
+        }, encrypted.ciphertext, encrypted.chunk_size + TAG_SIZE
+    if len(payload) > STREAM_THRESHOLD_BYTES:
+        return dict(meta, chunk_size=STREAM_CHUNK_BYTES), payload, STREAM_CHUNK_BYTES
+    return None
+
+
+async def send_stream_request(meta, data, segment_size):
+    """
+    Stream one state through the enclave segment by segment.
+    
+    Returns (final response meta, serialized EncryptedState with chunk_size
+    set); reconfigures and retries once if the enclave has lost its TSK.
+    """
+    view = memoryview(data)
+    for attempt in (1, 2):
+        chunks = (view[i:i + segment_size] for i in range(0, len(view), segment_size))
+        header, segments, result = None, [], {}
+        async for frame in get_enclave_pool().stream('process_stream', meta, chunks, timeout=60):
+            if frame.flags & framing.FLAG_END:
+                result = frame.meta
+            elif header is None:
+                header = frame.meta
+                continue
+            segments.append(frame.payload)
+        
+        if attempt == 1 and result.get('msg') in RECONFIGURE_ERRORS:
+            logger.info(f"Enclave reported {result['msg']}, reconfiguring...")
+            await ensure_configured()
+            continue
+        if result.get('status') != 'ok':
+            raise Exception(result.get('msg', 'stream ended without a result'))
+        break
+    
+    encrypted = state_pb2.EncryptedState(
+        ciphertext=b''.join(segments),
+        nonce=bytes.fromhex(header['nonce_prefix']),
+        workflow_id=header['workflow_id'],
+        iteration=header['iteration'],
+        chunk_size=header['chunk_size'],
+        key_id=header.get('key_id', ''),
+    )
+    return result, encrypted.SerializeToString()
+
+
 @activity.defn
-async def process_in_enclave(request_data: str) -> str:
+@telemetry.traced_activity
+async def process_in_enclave(request_data: Union[str, bytes]) -> bytes:
     """
     Send data to enclave for confidential processing via vsock.
     
-    Returns encrypted blob as JSON string.
+    `request_data` is either plaintext input or the result of a previous
+    call, whose state the enclave decrypts, processes and re-encrypts.
+    
+    The enclave caches the TSK, so configure (and its KMS round trip) only
+    runs when the enclave reports it is unconfigured or its key expired, or
+    when this activity is picked by ATTESTATION_SAMPLE_RATE for an audit.
+    
+    Large states are streamed through the enclave in chunks (see
+    stream_request), and large results are claim-checked: their ciphertext
+    goes to the blob store and only a hashed reference goes into workflow
+    history (see blob_store.py). With ENCLAVE_DELTA_STATES the new state may
+    be a delta against this one, carrying the states it builds on (see
+    process_delta_state).
+    
+    Returns the serialized EncryptedState (protobuf) of the new state.
     """
-    # CRITICAL: Always configure enclave to ensure KMS decrypt happens
-    # This generates a new attestation event in CloudTrail for every workflow
-    configure_enclave()
+    if not _enclave_configured or random.random() < ATTESTATION_SAMPLE_RATE:
+        await ensure_configured()
     
-    logger.info(f"Sending to enclave: {request_data[:50]}...")
+    meta, payload = parse_state(request_data)
+    return await process_state(meta, payload, delta=DELTA_STATES)
+
+
+async def process_state(meta, payload, delta=False):
+    """
+    Process one state (see parse_state) in the enclave, streamed if
+    required, or as a delta with `delta` (see process_delta_state); returns
+    the new EncryptedState.
+    """
+    if meta.get('encrypted') and not meta.get('legacy'):
+        if delta:
+            encrypted = state_pb2.EncryptedState.FromString(payload)
+            if not encrypted.chunk_size:
+                return await process_delta_state(meta, encrypted)
+        payload = await load_state(payload)
+    stream = stream_request(meta, payload)
+    logger.info(f"Sending {len(payload)} bytes to enclave (encrypted={bool(meta.get('encrypted'))}, streamed={bool(stream)})")
     
     try:
-        # Connect to enclave
-        sock = socket.socket(socket.AF_VSOCK, socket.SOCK_STREAM)
-        sock.settimeout(10)
-        sock.connect((16, 5000))
-        
-        # Send processing request
-        request = {
-            'type': 'process',
-            'payload': request_data
-        }
-        sock.sendall(json.dumps(request).encode())
-        
-        # Receive encrypted response
-        response_data = sock.recv(8192)
-        encrypted_result = json.loads(response_data.decode())
-        
-        sock.close()
-        
-        if 'error' in encrypted_result:
-            raise Exception(encrypted_result['error'])
-        
+        if stream:
+            _, ciphertext = await send_stream_request(*stream)
+        else:
+            _, ciphertext = await send_process_request(meta, payload)
         logger.info("Received encrypted result from enclave")
+        return await store_state(ciphertext, current_workflow_id())
         
-        # Return encrypted blob as JSON string
-        return json.dumps(encrypted_result)
+    except Exception as e:
+        logger.error(f"Failed to communicate with enclave: {e}")
+        raise
+
+
+def ciphertext_size(states):
+    return sum(state.blob.size if state.HasField('blob') else len(state.ciphertext) for state in states)
+
+
+async def process_delta_state(meta, encrypted):
+    """
+    Process an EncryptedState letting the enclave return a delta against it.
+    
+    Only the state itself goes to the enclave, with the number and size of
+    the deltas its chain (the last full state and the deltas since) would
+    carry; the chain follows only if the enclave no longer holds the
+    state's base. A delta result takes over the chain plus this state, so
+    the enclave can always rebuild it; a full result starts afresh.
+    Returns the new EncryptedState, claim-checked like process_state's.
+    """
+    chain = list(encrypted.chain)
+    state = state_pb2.EncryptedState()
+    state.CopyFrom(encrypted)
+    state.ClearField('chain')
+    deltas = chain[1:] + [state] if state.base_iteration else []
+    meta = dict(meta, delta=True, delta_chain=len(deltas), delta_chain_bytes=ciphertext_size(deltas))
+    payload = await load_state(state.SerializeToString())
+    logger.info(f"Sending {len(payload)} bytes to enclave (encrypted=True, delta={bool(state.base_iteration)})")
+    
+    async def with_chain():
+        return await load_state(encrypted.SerializeToString())
+    
+    try:
+        _, body = await send_process_request(meta, payload, with_chain=with_chain)
+        result = state_pb2.EncryptedState.FromString(body)
+        logger.info(f"Received encrypted {'delta' if result.base_iteration else 'state'} from enclave")
+        if result.base_iteration:
+            result.chain.extend(chain + [state])
+            body = result.SerializeToString()
+        return await store_state(body, current_workflow_id())
+        
+    except Exception as e:
+        logger.error(f"Failed to communicate with enclave: {e}")
+        raise
+
+
+@activity.defn
+@telemetry.traced_activity
+async def run_agent_in_enclave(step: bytes) -> bytes:
+    """
+    Run one agent of a multi-agent pipeline in the enclave.
+    
+    `step` is a serialized AgentStep. A single input (the pipeline's
+    plaintext input or one upstream agent's state) is processed like
+    process_in_enclave; the states of several upstream agents are merged by
+    the enclave into the agent's new state. Only ciphertext leaves the
+    enclave either way.
+    
+    Returns the serialized EncryptedState of the agent's output.
+    """
+    if not _enclave_configured or random.random() < ATTESTATION_SAMPLE_RATE:
+        await ensure_configured()
+    
+    request = state_pb2.AgentStep.FromString(step)
+    if not request.inputs:
+        raise ValueError(f"Agent {request.agent_id!r} has no inputs")
+    
+    if len(request.inputs) == 1:
+        item = request.inputs[0]
+        meta = {'encrypted': item.encrypted, 'legacy': item.legacy, 'agent_id': request.agent_id}
+        if not item.encrypted:
+            meta['workflow_id'] = item.workflow_id or current_workflow_id()
+        return await process_state(meta, item.payload)
+    
+    for item in request.inputs:
+        if item.encrypted and not item.legacy:
+            item.payload = await load_state(item.payload)
+    payload = state_pb2.ProcessBatch(items=request.inputs).SerializeToString()
+    logger.info(f"Merging {len(request.inputs)} states in enclave for agent {request.agent_id}")
+    try:
+        _, body = await send_process_request({'agent_id': request.agent_id}, payload, msg_type='merge')
+        return await store_state(body, current_workflow_id())
+    except Exception as e:
+        logger.error(f"Failed to communicate with enclave: {e}")
+        raise
+
+
+@activity.defn
+@telemetry.traced_activity
+async def process_batch_in_enclave(batch: bytes) -> bytes:
+    """
+    Process many states in a single enclave round trip.
+    
+    `batch` is a serialized ProcessBatch (see batch_item); plaintext items
+    without a workflow id get the calling workflow's. Returns a serialized
+    ProcessBatchResult with one result per item, in order. Failed items are
+    reported in their result (status 'error') rather than failing the
+    activity; only enclave-level failures raise.
+    """
+    if not _enclave_configured or random.random() < ATTESTATION_SAMPLE_RATE:
+        await ensure_configured()
+    
+    request = state_pb2.ProcessBatch.FromString(batch)
+    workflow_id = current_workflow_id()
+    for item in request.items:
+        if not item.encrypted and not item.workflow_id:
+            item.workflow_id = workflow_id
+        elif item.encrypted and not item.legacy:
+            item.payload = await load_state(item.payload)
+    payload = request.SerializeToString()
+    logger.info(f"Sending batch of {len(request.items)} states ({len(payload)} bytes) to enclave")
+    
+    try:
+        result, body = await send_process_request({}, payload, msg_type='process_batch')
+        logger.info(f"Received batch result from enclave ({result.get('failed', 0)} failed)")
+        if not blob_store.CLAIM_CHECK_THRESHOLD or len(body) <= blob_store.CLAIM_CHECK_THRESHOLD:
+            return bytes(body)
+        results = state_pb2.ProcessBatchResult.FromString(body)
+        for item in results.results:
+            if item.status == 'ok':
+                item.payload = await store_state(item.payload, workflow_id)
+        return results.SerializeToString()
         
     except Exception as e:
         logger.error(f"Failed to communicate with enclave: {e}")
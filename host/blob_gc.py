@@ -0,0 +1,64 @@
+"""
+Blob Store Garbage Collector
+
+Drops the claim-check references of workflows that closed more than
+BLOB_RETENTION_SECONDS ago (or that Temporal no longer knows about) and
+deletes blobs nothing references any more (see blob_store.py).
+
+Usage:
+    python3 blob_gc.py                  # one pass
+    python3 blob_gc.py --interval 3600  # keep running, one pass per hour
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+
+from temporalio.client import Client, WorkflowExecutionStatus
+from temporalio.service import RPCError, RPCStatusCode
+
+from blob_store import BLOB_RETENTION_SECONDS, collect_garbage
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TEMPORAL_HOST = os.environ.get("TEMPORAL_HOST", "localhost:7233")
+TEMPORAL_NAMESPACE = os.environ.get("TEMPORAL_NAMESPACE", "confidential-workflow-poc")
+
+
+def workflow_expiry(client, retention_seconds=BLOB_RETENTION_SECONDS):
+    """Build the `workflow_expired` callback for collect_garbage from a Temporal client."""
+    async def workflow_expired(workflow_id):
+        try:
+            description = await client.get_workflow_handle(workflow_id).describe()
+        except RPCError as e:
+            if e.status == RPCStatusCode.NOT_FOUND:
+                return True
+            raise
+        if description.status == WorkflowExecutionStatus.RUNNING or description.close_time is None:
+            return False
+        age = (datetime.now(timezone.utc) - description.close_time).total_seconds()
+        return age > retention_seconds
+    return workflow_expired
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--interval', type=float, default=0, help='seconds between passes (default: one pass)')
+    args = parser.parse_args()
+
+    logger.info(f"Connecting to Temporal at {TEMPORAL_HOST}")
+    client = await Client.connect(TEMPORAL_HOST, namespace=TEMPORAL_NAMESPACE)
+    workflow_expired = workflow_expiry(client)
+
+    while True:
+        await collect_garbage(workflow_expired)
+        if not args.interval:
+            break
+        await asyncio.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
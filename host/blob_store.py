@@ -0,0 +1,306 @@
+"""
+Blob Store
+
+Claim-check storage that keeps large ciphertexts out of Temporal history.
+
+When an activity's EncryptedState has more than CLAIM_CHECK_THRESHOLD_BYTES
+of ciphertext, the ciphertext is written to a content-addressed blob store
+and the state carries only a BlobRef (its SHA-256 and size). The next
+activity fetches it back, and checks the hash, before the state goes to
+the enclave. Blobs are ciphertext only; the store never sees plaintext.
+
+    file:///var/lib/cse-maw/blobs   local directory (default: <project root>/blob-store)
+    s3://bucket/prefix              S3, or an S3-compatible store via BLOB_STORE_ENDPOINT
+
+Each put also records which workflow referenced the blob. collect_garbage()
+drops the references of workflows that closed more than
+BLOB_RETENTION_SECONDS ago and deletes blobs nothing references any more
+(see blob_gc.py).
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from urllib.parse import quote, unquote, urlsplit
+
+from credentials import PROJECT_ROOT
+
+logger = logging.getLogger(__name__)
+
+# Ciphertexts larger than this are claim-checked (0 disables offloading)
+CLAIM_CHECK_THRESHOLD = int(os.environ.get('CLAIM_CHECK_THRESHOLD_BYTES', str(128 * 1024)))
+BLOB_STORE_URL = os.environ.get('BLOB_STORE_URL', 'file://' + os.path.join(PROJECT_ROOT, 'blob-store'))
+BLOB_STORE_ENDPOINT = os.environ.get('BLOB_STORE_ENDPOINT') or None
+# Blobs stay readable this long after the workflows referencing them close
+BLOB_RETENTION_SECONDS = float(os.environ.get('BLOB_RETENTION_SECONDS', str(24 * 3600)))
+# Unreferenced blobs younger than this are kept (a put may be in progress)
+GC_GRACE_SECONDS = 3600
+
+
+class BlobNotFoundError(Exception):
+    """The blob store has no blob for a reference."""
+
+
+class BlobIntegrityError(Exception):
+    """A fetched blob does not match the hash in its reference."""
+
+
+def blob_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class FileBlobStore:
+    """
+    Blobs in a local directory:
+
+        blobs/<sha256[:2]>/<sha256>
+        refs/<quoted workflow id>/<sha256>   (empty marker files)
+
+    Files are written to a temporary name and renamed, so readers never see
+    a partial blob.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(os.path.join(root, 'blobs'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'refs'), exist_ok=True)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.root, 'blobs', digest[:2], digest)
+
+    def _refs_dir(self, workflow_id):
+        return os.path.join(self.root, 'refs', quote(workflow_id, safe='') or '%00')
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def put(self, data, workflow_id):
+        """Store `data` (deduplicated by hash) for `workflow_id`; returns its SHA-256."""
+        digest = blob_digest(data)
+        # Reference, then touch (or write) the blob: GC reads blob ages before
+        # references and re-reads the age before deleting, so it either sees
+        # this reference or the fresh mtime
+        self._write(os.path.join(self._refs_dir(workflow_id), digest), b'')
+        path = self._blob_path(digest)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self._write(path, data)
+        return digest
+
+    def get(self, digest):
+        try:
+            with open(self._blob_path(digest), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise BlobNotFoundError(digest)
+
+    def workflows(self):
+        """Workflow ids that hold references."""
+        return [unquote(name) if name != '%00' else '' for name in os.listdir(os.path.join(self.root, 'refs'))]
+
+    def drop_workflow(self, workflow_id):
+        refs = self._refs_dir(workflow_id)
+        for name in os.listdir(refs):
+            os.unlink(os.path.join(refs, name))
+        os.rmdir(refs)
+
+    def referenced(self):
+        refs = os.path.join(self.root, 'refs')
+        return {name for workflow in os.listdir(refs) for name in os.listdir(os.path.join(refs, workflow))
+                if not name.startswith('.tmp-')}
+
+    def blobs(self):
+        """Yield (sha256, age in seconds) for every stored blob."""
+        now = time.time()
+        blobs = os.path.join(self.root, 'blobs')
+        for shard in os.listdir(blobs):
+            for name in os.listdir(os.path.join(blobs, shard)):
+                if not name.startswith('.tmp-'):
+                    yield name, now - os.stat(os.path.join(blobs, shard, name)).st_mtime
+
+    def age(self, digest):
+        """Seconds since the blob was last written or touched, or None if it is gone."""
+        try:
+            return time.time() - os.stat(self._blob_path(digest)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def delete(self, digest):
+        try:
+            os.unlink(self._blob_path(digest))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobStore:
+    """
+    Blobs in an S3 bucket (or S3-compatible store such as MinIO), laid out
+    like FileBlobStore under `prefix`. Needs boto3.
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=BLOB_STORE_ENDPOINT):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("The S3 blob store needs boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self._s3 = boto3.client('s3', endpoint_url=endpoint_url)
+
+    def _ref_prefix(self, workflow_id=None):
+        base = f'{self.prefix}refs/'
+        return base if workflow_id is None else f"{base}{quote(workflow_id, safe='') or '%00'}/"
+
+    def _list(self, prefix, delimiter=None):
+        kwargs = {'Bucket': self.bucket, 'Prefix': prefix}
+        if delimiter:
+            kwargs['Delimiter'] = delimiter
+        for page in self._s3.get_paginator('list_objects_v2').paginate(**kwargs):
+            yield page
+
+    def put(self, data, workflow_id):
+        digest = blob_digest(data)
+        self._s3.put_object(Bucket=self.bucket, Key=self._ref_prefix(workflow_id) + digest, Body=b'')
+        self._s3.put_object(Bucket=self.bucket, Key=f'{self.prefix}blobs/{digest}', Body=data)
+        return digest
+
+    def get(self, digest):
+        try:
+            return self._s3.get_object(Bucket=self.bucket, Key=f'{self.prefix}blobs/{digest}')['Body'].read()
+        except self._s3.exceptions.NoSuchKey:
+            raise BlobNotFoundError(digest)
+
+    def workflows(self):
+        base = self._ref_prefix()
+        names = [p['Prefix'][len(base):-1] for page in self._list(base, '/') for p in page.get('CommonPrefixes', [])]
+        return ['' if name == '%00' else unquote(name) for name in names]
+
+    def drop_workflow(self, workflow_id):
+        for page in self._list(self._ref_prefix(workflow_id)):
+            keys = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+            if keys:
+                self._s3.delete_objects(Bucket=self.bucket, Delete={'Objects': keys})
+
+    def referenced(self):
+        return {obj['Key'].rsplit('/', 1)[1] for page in self._list(self._ref_prefix())
+                for obj in page.get('Contents', [])}
+
+    def blobs(self):
+        now = time.time()
+        for page in self._list(f'{self.prefix}blobs/'):
+            for obj in page.get('Contents', []):
+                yield obj['Key'].rsplit('/', 1)[1], now - obj['LastModified'].timestamp()
+
+    def age(self, digest):
+        try:
+            head = self._s3.head_object(Bucket=self.bucket, Key=f'{self.prefix}blobs/{digest}')
+        except self._s3.exceptions.ClientError:
+            return None
+        return time.time() - head['LastModified'].timestamp()
+
+    def delete(self, digest):
+        self._s3.delete_object(Bucket=self.bucket, Key=f'{self.prefix}blobs/{digest}')
+
+
+def open_store(url=BLOB_STORE_URL):
+    """Build a blob store from a URL (see module docstring)."""
+    parts = urlsplit(url)
+    if parts.scheme == 'file':
+        return FileBlobStore(parts.path)
+    if parts.scheme == 's3':
+        return S3BlobStore(parts.netloc, parts.path)
+    raise ValueError(f"Unsupported blob store URL: {url!r}")
+
+
+_store = None
+
+
+def get_blob_store():
+    """Return this process's blob store for BLOB_STORE_URL."""
+    global _store
+    if _store is None:
+        _store = open_store()
+    return _store
+
+
+async def offload_state(encrypted, workflow_id, store=None, threshold=None):
+    """
+    Move a large ciphertext out of `encrypted` (an EncryptedState) into the blob store.
+
+    States at or under `threshold` bytes (default CLAIM_CHECK_THRESHOLD) are
+    left as they are. Returns True if the state now carries a BlobRef.
+    """
+    threshold = CLAIM_CHECK_THRESHOLD if threshold is None else threshold
+    if not threshold or len(encrypted.ciphertext) <= threshold:
+        return False
+    store = store or get_blob_store()
+    ciphertext = encrypted.ciphertext
+    digest = await asyncio.to_thread(store.put, ciphertext, workflow_id)
+    encrypted.blob.sha256 = digest
+    encrypted.blob.size = len(ciphertext)
+    encrypted.ciphertext = b''
+    logger.info(f"Claim-checked {len(ciphertext)} bytes of ciphertext as {digest[:12]}")
+    return True
+
+
+async def resolve_state(encrypted, store=None):
+    """Fetch the ciphertext of a claim-checked EncryptedState back into it, checking its hash."""
+    if not encrypted.HasField('blob'):
+        return
+    store = store or get_blob_store()
+    ref = encrypted.blob
+    data = await asyncio.to_thread(store.get, ref.sha256)
+    if len(data) != ref.size or blob_digest(data) != ref.sha256:
+        raise BlobIntegrityError(f"Blob {ref.sha256} does not match its reference")
+    encrypted.ciphertext = data
+    encrypted.ClearField('blob')
+
+
+async def collect_garbage(workflow_expired, store=None, grace_seconds=GC_GRACE_SECONDS):
+    """
+    Drop references of expired workflows and delete blobs nothing references.
+
+    `workflow_expired` is an async callable taking a workflow id and
+    returning True once that workflow's blobs may go (e.g. closed more than
+    BLOB_RETENTION_SECONDS ago). Returns counts of dropped workflows and
+    deleted blobs.
+    """
+    store = store or get_blob_store()
+    dropped = 0
+    for workflow_id in await asyncio.to_thread(store.workflows):
+        if await workflow_expired(workflow_id):
+            await asyncio.to_thread(store.drop_workflow, workflow_id)
+            dropped += 1
+
+    def sweep():
+        # Ages before references: a put references a blob before touching it,
+        # so one that lands after this snapshot is either in `referenced` or
+        # shows up as a fresh age when re-read just before the delete
+        old = [digest for digest, age in store.blobs() if age > grace_seconds]
+        referenced = store.referenced()
+        deleted = 0
+        for digest in old:
+            if digest in referenced:
+                continue
+            age = store.age(digest)
+            if age is None or age <= grace_seconds:
+                continue
+            store.delete(digest)
+            deleted += 1
+        return deleted
+
+    deleted = await asyncio.to_thread(sweep)
+    logger.info(f"Blob GC: dropped references of {dropped} workflows, deleted {deleted} blobs")
+    return {'workflows': dropped, 'blobs': deleted}
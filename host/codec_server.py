@@ -0,0 +1,96 @@
+"""
+Codec Server
+
+Serves the payload codec (payload_codec.py) over HTTP so the Temporal Web UI
+and CLI can show decoded workflow inputs and results. Implements Temporal's
+codec server protocol: POST /decode and /encode with a JSON `Payloads`
+body, with CORS for the UI's origin.
+
+Anyone who can reach the codec server can decrypt payloads, so it binds to
+localhost by default; point the UI at it from the same machine (or through
+an SSH tunnel) with Settings -> Codec Server -> http://localhost:8081.
+
+Usage:
+    python3 codec_server.py [--host 127.0.0.1] [--port 8081]
+"""
+
+import argparse
+import logging
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google.protobuf import json_format
+from temporalio.api.common.v1 import Payloads
+
+from payload_codec import get_payload_codec
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CODEC_SERVER_PORT = int(os.environ.get('CODEC_SERVER_PORT', '8081'))
+# Comma-separated origins allowed to call the codec server (the Temporal Web UI)
+CODEC_SERVER_ORIGINS = os.environ.get('CODEC_SERVER_ORIGINS', 'http://localhost:8080,https://cloud.temporal.io')
+
+
+def make_handler(codec, origins):
+    class CodecHandler(BaseHTTPRequestHandler):
+        def _cors(self):
+            origin = self.headers.get('Origin')
+            if origin in origins:
+                self.send_header('Access-Control-Allow-Origin', origin)
+                self.send_header('Access-Control-Allow-Methods', 'POST')
+                self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Namespace, Authorization')
+                self.send_header('Vary', 'Origin')
+
+        def _reply(self, status, body=b'', content_type='application/json'):
+            self.send_response(status)
+            self._cors()
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_OPTIONS(self):
+            self._reply(200)
+
+        def do_POST(self):
+            transform = {'/encode': codec.encode_all, '/decode': codec.decode_all}.get(self.path.rstrip('/'))
+            if transform is None:
+                self._reply(404, b'not found', 'text/plain')
+                return
+            try:
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                payloads = json_format.Parse(body, Payloads())
+                result = Payloads(payloads=transform(payloads.payloads))
+            except Exception as e:
+                logger.warning(f"{self.path} failed: {e}")
+                self._reply(400, str(e).encode(), 'text/plain')
+                return
+            self._reply(200, json_format.MessageToJson(result).encode())
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return CodecHandler
+
+
+def make_server(codec, host='127.0.0.1', port=CODEC_SERVER_PORT, origins=CODEC_SERVER_ORIGINS):
+    return ThreadingHTTPServer((host, port), make_handler(codec, set(filter(None, origins.split(',')))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=CODEC_SERVER_PORT)
+    args = parser.parse_args()
+
+    codec = get_payload_codec()
+    if codec is None:
+        raise SystemExit("PAYLOAD_CODEC=none: there are no encrypted payloads to decode")
+    server = make_server(codec, args.host, args.port)
+    logger.info(f"Codec server listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Host Credentials
+
+The inputs to the enclave's `configure`: the worker's role credentials from
+the instance metadata service (IMDSv2) and the encrypted TSK file.
+
+ImdsCredentialProvider caches the IMDS session token and the role
+credentials, and refreshes the credentials in the background ahead of their
+`Expiration`, so configure normally never waits on IMDS. Concurrent callers
+that do need a fetch share a single one.
+
+TskFile caches the encrypted TSK and only re-reads it when the file changes
+on disk.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Instance metadata service (IMDSv2)
+IMDS_ENDPOINT = os.environ.get('IMDS_ENDPOINT', 'http://169.254.169.254')
+IMDS_TIMEOUT = 5
+IMDS_TOKEN_TTL = 21600
+CREDENTIALS_PATH = '/latest/meta-data/iam/security-credentials/'
+
+# Credentials are refreshed this many seconds before their Expiration
+REFRESH_MARGIN = float(os.environ.get('IMDS_REFRESH_MARGIN_SECONDS', '300'))
+# Wait between attempts while a background refresh keeps failing
+REFRESH_RETRY_SECONDS = 10
+# Lifetime assumed for credentials without an Expiration (IMDS stand-ins)
+DEFAULT_CREDENTIAL_TTL = 900
+
+# Project root - handle both running from host/ and project root
+_here = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(_here) if os.path.basename(_here) == 'host' else _here
+
+TSK_PATH = os.environ.get('ENCRYPTED_TSK_PATH', os.path.join(PROJECT_ROOT, 'encrypted-tsk.b64'))
+
+
+class ImdsError(Exception):
+    """An IMDS call failed; `status` is the HTTP status, or None if there was no response."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+async def imds_request(method, path, headers=None, timeout=IMDS_TIMEOUT, endpoint=None):
+    """
+    Minimal non-blocking HTTP/1.1 request to IMDS.
+
+    Returns the response body as text; raises ImdsError for non-200
+    responses and on connection errors and timeouts.
+    """
+    url = urlsplit(endpoint or IMDS_ENDPOINT)
+    host, port = url.hostname, url.port or 80
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {host}", "Connection: close", "Content-Length: 0"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('ascii'))
+        await writer.drain()
+        raw = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+
+    head, _, body = raw.partition(b"\r\n\r\n")
+    status_line = head.split(b"\r\n", 1)[0].decode('ascii', 'replace')
+    parts = status_line.split(" ", 2)
+    if len(parts) < 2 or parts[1] != "200":
+        status = int(parts[1]) if len(parts) >= 2 and parts[1].isdigit() else None
+        raise ImdsError(f"IMDS {method} {path} failed: {status_line or 'no response'}", status)
+    return body.decode('utf-8')
+
+
+def seconds_until(expiration):
+    """Seconds from now until an IMDS `Expiration` timestamp (e.g. 2026-01-01T00:00:00Z)."""
+    expires = datetime.strptime(expiration, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+    return (expires - datetime.now(timezone.utc)).total_seconds()
+
+
+class ImdsCredentialProvider:
+    """
+    Role credentials from IMDS, cached until shortly before they expire.
+
+    After each fetch a background task refreshes the credentials
+    `refresh_margin` seconds (at most half their lifetime) before their
+    Expiration. If that refresh fails the cached credentials keep being
+    served, and retried, until they actually expire.
+    """
+
+    def __init__(self, endpoint=None, refresh_margin=REFRESH_MARGIN):
+        self.endpoint = endpoint
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self._token_expires = 0.0
+        self._role = None
+        self._credentials = None
+        self._refresh_at = 0.0
+        self._expires = 0.0
+        self._fetch = None
+        self._refresher = None
+        self.fetches = 0
+
+    async def get_credentials(self):
+        """
+        Return the role credentials as a dict with `aws_access_key_id`,
+        `aws_secret_access_key` and `aws_session_token`.
+
+        Only waits on IMDS if there are no unexpired credentials cached;
+        raises ImdsError (or OSError/TimeoutError) if that fetch fails.
+        """
+        now = time.monotonic()
+        if self._credentials is not None and now < self._expires:
+            if now >= self._refresh_at:
+                self._start_refresher()
+            return self._credentials
+        return await self.refresh()
+
+    async def refresh(self):
+        """Fetch new credentials now, joining a fetch already in flight."""
+        task = self._fetch
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = self._fetch = asyncio.ensure_future(self._fetch_credentials())
+        return await asyncio.shield(task)
+
+    def close(self):
+        """Stop background refreshes."""
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+
+    async def _session_token(self):
+        if self._token is None or time.monotonic() >= self._token_expires:
+            self._token = await imds_request(
+                'PUT', '/latest/api/token',
+                headers={'X-aws-ec2-metadata-token-ttl-seconds': str(IMDS_TOKEN_TTL)},
+                endpoint=self.endpoint,
+            )
+            self._token_expires = time.monotonic() + IMDS_TOKEN_TTL - self.refresh_margin
+        return self._token
+
+    async def _fetch_credentials(self):
+        for attempt in (1, 2):
+            try:
+                headers = {'X-aws-ec2-metadata-token': await self._session_token()}
+                if self._role is None:
+                    self._role = (await imds_request('GET', CREDENTIALS_PATH, headers, endpoint=self.endpoint)).strip()
+                creds = json.loads(await imds_request('GET', CREDENTIALS_PATH + self._role, headers,
+                                                      endpoint=self.endpoint))
+                break
+            except ImdsError as e:
+                # 401: the session token was revoked early; 404: the instance role changed
+                if attempt == 2 or e.status not in (401, 404):
+                    raise
+                if e.status == 401:
+                    self._token = None
+                else:
+                    self._role = None
+
+        lifetime = seconds_until(creds['Expiration']) if creds.get('Expiration') else DEFAULT_CREDENTIAL_TTL
+        now = time.monotonic()
+        self._credentials = {
+            'aws_access_key_id': creds['AccessKeyId'],
+            'aws_secret_access_key': creds['SecretAccessKey'],
+            'aws_session_token': creds['Token'],
+        }
+        self._expires = now + lifetime
+        self._refresh_at = now + max(lifetime - self.refresh_margin, lifetime / 2)
+        self.fetches += 1
+        logger.info(f"AWS credentials fetched from IMDS (role {self._role}, expire in {lifetime:.0f}s)")
+        self._start_refresher()
+        return self._credentials
+
+    def _start_refresher(self):
+        task = self._refresher
+        loop = asyncio.get_running_loop()
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._refresher = loop.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(max(0.0, self._refresh_at - time.monotonic()))
+            try:
+                await self.refresh()
+            except Exception as e:
+                remaining = self._expires - time.monotonic()
+                logger.warning(f"Background IMDS refresh failed ({remaining:.0f}s of credential lifetime left): {e}")
+                await asyncio.sleep(REFRESH_RETRY_SECONDS)
+
+
+class TskFile:
+    """
+    The encrypted TSK file, cached in memory.
+
+    Each read stats the file and only re-reads it when its inode, size or
+    mtime changed (e.g. after ./scripts/deploy-tsk.sh rotates it).
+    """
+
+    def __init__(self, path=TSK_PATH):
+        self.path = path
+        self._version = None
+        self._value = ''
+        self.loads = 0
+
+    def read(self):
+        """Return the base64 encrypted TSK, or '' if the file is missing."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            logger.error(f"encrypted-tsk.b64 not found at {self.path}")
+            self._version, self._value = None, ''
+            return ''
+        version = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if version != self._version:
+            with open(self.path, 'r') as f:
+                self._value = f.read().strip()
+            self._version = version
+            self.loads += 1
+            logger.info(f"Loaded encrypted TSK from {self.path}")
+        return self._value
+
+
+_provider = None
+_tsk_file = None
+
+
+def get_credential_provider():
+    """Return this process's ImdsCredentialProvider (IMDS_ENDPOINT)."""
+    global _provider
+    if _provider is None:
+        _provider = ImdsCredentialProvider()
+    return _provider
+
+
+def get_tsk_file():
+    """Return this process's TskFile (TSK_PATH)."""
+    global _tsk_file
+    if _tsk_file is None:
+        _tsk_file = TskFile()
+    return _tsk_file
@@ -0,0 +1,680 @@
+"""
+Enclave Client
+
+Persistent, multiplexed connections from the host worker to the enclave.
+
+A worker keeps a small pool of long-lived connections; each connection
+carries many in-flight requests, matched to responses by frame request id.
+Idle connections are health-checked with `ping` and broken ones are replaced
+transparently (e.g. after an enclave restart).
+
+The transport is pluggable so the same client can run off-Nitro:
+
+    vsock:16:5000            AF_VSOCK CID 16, port 5000 (default)
+    tcp:127.0.0.1:5000       TCP stand-in
+    unix:/tmp/enclave.sock   UNIX socket stand-in
+
+A worker can drive several enclaves: EnclaveDispatcher keeps one pool per
+enclave (ENCLAVE_ADDRESSES, or a discovery hook such as `nitro-cli`), routes
+each request to a lightly loaded one, tracks which enclaves are healthy and
+configured, and fails over when an enclave goes away.
+"""
+
+import asyncio
+import importlib
+import inspect
+import itertools
+import json
+import logging
+import os
+import random
+import socket
+import time
+
+import telemetry  # puts common/ and proto/ on sys.path
+from common import framing
+
+logger = logging.getLogger(__name__)
+
+ENCLAVE_CID = int(os.environ.get('ENCLAVE_CID', '16'))
+ENCLAVE_PORT = int(os.environ.get('ENCLAVE_PORT', '5000'))
+ENCLAVE_ADDRESS = os.environ.get('ENCLAVE_ADDRESS', f'vsock:{ENCLAVE_CID}:{ENCLAVE_PORT}')
+
+# Long-lived connections per worker process
+POOL_SIZE = int(os.environ.get('ENCLAVE_POOL_SIZE', '4'))
+# Connections idle for longer than this are pinged before reuse
+IDLE_CHECK_SECONDS = float(os.environ.get('ENCLAVE_IDLE_CHECK_SECONDS', '30'))
+CONNECT_TIMEOUT = float(os.environ.get('ENCLAVE_CONNECT_TIMEOUT', '10'))
+
+# Several enclaves: a comma-separated list of addresses, or a discovery hook
+# ('nitro-cli', or 'module:function' returning a list of addresses)
+ENCLAVE_ADDRESSES = [a.strip() for a in os.environ.get('ENCLAVE_ADDRESSES', '').split(',') if a.strip()]
+ENCLAVE_DISCOVERY = os.environ.get('ENCLAVE_DISCOVERY', '')
+DISCOVERY_INTERVAL = float(os.environ.get('ENCLAVE_DISCOVERY_INTERVAL', '30'))
+# 'p2c' (power of two choices) or 'least' (least outstanding requests)
+DISPATCH_POLICY = os.environ.get('ENCLAVE_DISPATCH_POLICY', 'p2c')
+# A failed enclave gets no traffic for this long, then is tried again
+DOWN_SECONDS = float(os.environ.get('ENCLAVE_DOWN_SECONDS', '5'))
+
+# Enclave errors that mean its cached TSK is gone and configure must run
+RECONFIGURE_ERRORS = ('not_configured', 'key_expired')
+
+
+class EnclaveConnectionError(ConnectionError):
+    """The connection to the enclave failed or was closed mid-request."""
+
+
+class EnclaveUnavailableError(EnclaveConnectionError):
+    """No connection to the enclave could be opened."""
+
+
+class VsockTransport:
+    def __init__(self, cid, port):
+        self.cid = cid
+        self.port = port
+
+    async def open(self):
+        sock = socket.socket(socket.AF_VSOCK, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            await asyncio.get_running_loop().sock_connect(sock, (self.cid, self.port))
+        except BaseException:
+            sock.close()
+            raise
+        return await asyncio.open_connection(sock=sock)
+
+    def __str__(self):
+        return f"vsock:{self.cid}:{self.port}"
+
+
+class TcpTransport:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    async def open(self):
+        return await asyncio.open_connection(self.host, self.port)
+
+    def __str__(self):
+        return f"tcp:{self.host}:{self.port}"
+
+
+class UnixTransport:
+    def __init__(self, path):
+        self.path = path
+
+    async def open(self):
+        return await asyncio.open_unix_connection(self.path)
+
+    def __str__(self):
+        return f"unix:{self.path}"
+
+
+def parse_address(spec):
+    """Build a transport from an address string (see module docstring)."""
+    scheme, _, rest = spec.partition(':')
+    if scheme == 'vsock':
+        cid, _, port = rest.partition(':')
+        return VsockTransport(int(cid), int(port))
+    if scheme == 'tcp':
+        host, _, port = rest.rpartition(':')
+        return TcpTransport(host, int(port))
+    if scheme == 'unix':
+        return UnixTransport(rest)
+    raise ValueError(f"Unsupported enclave address: {spec!r}")
+
+
+class EnclaveConnection:
+    """One stream to the enclave, multiplexing requests by request id."""
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._write_lock = asyncio.Lock()
+        self._read_task = asyncio.create_task(self._read_loop())
+        self.closed = False
+        self.last_used = time.monotonic()
+
+    @classmethod
+    async def open(cls, transport, timeout=CONNECT_TIMEOUT):
+        reader, writer = await asyncio.wait_for(transport.open(), timeout)
+        return cls(reader, writer)
+
+    @property
+    def in_flight(self):
+        return len(self._pending)
+
+    def _next_id(self):
+        request_id = next(self._ids) & 0xFFFFFFFF
+        while request_id == 0 or request_id in self._pending:
+            request_id = next(self._ids) & 0xFFFFFFFF
+        return request_id
+
+    async def request(self, msg_type, meta=None, payload=b'', timeout=None):
+        """Send a request and wait for its response frame."""
+        if self.closed:
+            raise EnclaveConnectionError("connection is closed")
+
+        request_id = self._next_id()
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self.last_used = time.monotonic()
+        try:
+            async with self._write_lock:
+                for part in framing.encode_frame(framing.type_code_for(msg_type), request_id, meta, payload):
+                    self._writer.write(part)
+                await self._writer.drain()
+        except (ConnectionError, OSError) as e:
+            self._pending.pop(request_id, None)
+            if future.done():
+                # Already failed by a concurrent request's send error
+                future.exception()
+            self._fail(EnclaveConnectionError(f"send failed: {e}"))
+            raise EnclaveConnectionError(f"send failed: {e}") from e
+
+        try:
+            frame = await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+            self.last_used = time.monotonic()
+        return frame.meta, frame.payload
+
+    async def stream(self, msg_type, meta, chunks, timeout=None):
+        """
+        Send `chunks` as one streamed request and yield the response frames.
+
+        The request frames share one request id; the first carries `meta`
+        and the last sets FLAG_END. Responses are yielded as they arrive,
+        while later chunks are still being sent, up to the enclave's
+        FLAG_END frame. `timeout` bounds the wait for each response frame.
+        """
+        if self.closed:
+            raise EnclaveConnectionError("connection is closed")
+
+        request_id = self._next_id()
+        responses = asyncio.Queue()
+        self._pending[request_id] = responses
+        self.last_used = time.monotonic()
+        type_code = framing.type_code_for(msg_type)
+        done = asyncio.Event()
+
+        async def send():
+            frame_meta, pending = meta, None
+            for chunk in chunks:
+                if pending is not None:
+                    await self._send(type_code, request_id, frame_meta, pending, 0)
+                    frame_meta = None
+                    if done.is_set():
+                        # The enclave already ended the stream; terminate our side
+                        pending = b''
+                        break
+                pending = chunk
+            await self._send(type_code, request_id, frame_meta, pending if pending is not None else b'',
+                             framing.FLAG_END)
+
+        sender = asyncio.create_task(send())
+        try:
+            while True:
+                frame = await asyncio.wait_for(responses.get(), timeout)
+                if isinstance(frame, Exception):
+                    raise frame
+                if frame.flags & framing.FLAG_END:
+                    done.set()
+                yield frame
+                if done.is_set():
+                    break
+            await sender
+        finally:
+            # If we stop early the sender still finishes the request with a
+            # FLAG_END frame, so the enclave can release its session
+            done.set()
+            self._pending.pop(request_id, None)
+            self.last_used = time.monotonic()
+            sender.add_done_callback(_consume_exception)
+
+    async def _send(self, type_code, request_id, meta, payload, flags):
+        try:
+            async with self._write_lock:
+                for part in framing.encode_frame(type_code, request_id, meta, payload, flags):
+                    self._writer.write(part)
+                await self._writer.drain()
+        except (ConnectionError, OSError) as e:
+            self._fail(EnclaveConnectionError(f"send failed: {e}"))
+            raise EnclaveConnectionError(f"send failed: {e}") from e
+
+    async def _read_loop(self):
+        try:
+            while True:
+                frame = await framing.read_frame_async(self._reader)
+                if frame is None:
+                    raise EnclaveConnectionError("enclave closed the connection")
+                waiter = self._pending.get(frame.request_id)
+                if isinstance(waiter, asyncio.Queue):
+                    waiter.put_nowait(frame)
+                elif waiter and not waiter.done():
+                    waiter.set_result(frame)
+        except asyncio.CancelledError:
+            self._fail(EnclaveConnectionError("connection closed"))
+        except (framing.FrameError, ConnectionError, OSError) as e:
+            self._fail(e if isinstance(e, EnclaveConnectionError) else EnclaveConnectionError(str(e)))
+
+    def _fail(self, exc):
+        self.closed = True
+        for waiter in self._pending.values():
+            if isinstance(waiter, asyncio.Queue):
+                waiter.put_nowait(exc)
+            elif not waiter.done():
+                waiter.set_exception(exc)
+        self._pending.clear()
+        self._writer.close()
+
+    async def close(self):
+        if not self._read_task.done():
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except asyncio.CancelledError:
+                pass
+        self._fail(EnclaveConnectionError("connection closed"))
+
+
+def _consume_exception(task):
+    if not task.cancelled():
+        task.exception()
+
+
+class EnclavePool:
+    """
+    Per-worker pool of long-lived enclave connections.
+
+    Requests go to the least-loaded open connection; new connections are
+    opened up to `size` while every existing one is busy. A request that
+    fails because its connection broke is retried once on a fresh connection,
+    so an enclave restart is invisible to callers.
+    """
+
+    def __init__(self, transport, size=POOL_SIZE, idle_check_seconds=IDLE_CHECK_SECONDS):
+        self.transport = transport
+        self.size = size
+        self.idle_check_seconds = idle_check_seconds
+        self._connections = []
+        self._connect_lock = asyncio.Lock()
+
+    async def _acquire(self):
+        self._connections = [c for c in self._connections if not c.closed]
+        idle = [c for c in self._connections if c.in_flight == 0]
+        if idle:
+            conn = idle[0]
+            if self.idle_check_seconds and time.monotonic() - conn.last_used > self.idle_check_seconds:
+                if not await self._healthy(conn):
+                    return await self._acquire()
+            return conn
+        if len(self._connections) < self.size:
+            async with self._connect_lock:
+                if len(self._connections) < self.size:
+                    try:
+                        with telemetry.PHASE_SECONDS.time(phase='connect'):
+                            conn = await EnclaveConnection.open(self.transport)
+                    except (OSError, asyncio.TimeoutError) as e:
+                        raise EnclaveUnavailableError(f"cannot connect to {self.transport}: {e!r}") from e
+                    self._connections.append(conn)
+                    logger.debug(f"Opened enclave connection {len(self._connections)}/{self.size} to {self.transport}")
+                    return conn
+        return min(self._connections, key=lambda c: c.in_flight)
+
+    async def _healthy(self, conn):
+        try:
+            meta, _ = await conn.request('ping', timeout=CONNECT_TIMEOUT)
+            return meta.get('status') == 'ok'
+        except (EnclaveConnectionError, asyncio.TimeoutError):
+            logger.info(f"Dropping stale enclave connection to {self.transport}")
+            await conn.close()
+            return False
+
+    async def request(self, msg_type, meta=None, payload=b'', timeout=None):
+        """Send one request; returns (response_meta, response_payload)."""
+        for attempt in (1, 2):
+            conn = await self._acquire()
+            try:
+                return await conn.request(msg_type, meta, payload, timeout)
+            except EnclaveConnectionError as e:
+                if attempt == 2:
+                    raise
+                logger.warning(f"Enclave connection lost ({e}), reconnecting...")
+
+    async def stream(self, msg_type, meta, chunks, timeout=None):
+        """Streamed request on one pooled connection (see EnclaveConnection.stream); not retried."""
+        conn = await self._acquire()
+        async for frame in conn.stream(msg_type, meta, chunks, timeout):
+            yield frame
+
+    async def close(self):
+        connections, self._connections = self._connections, []
+        for conn in connections:
+            await conn.close()
+
+
+class EnclaveMember:
+    """One enclave behind an EnclaveDispatcher: its connection pool and routing state."""
+
+    def __init__(self, address, pool_size=POOL_SIZE, idle_check_seconds=IDLE_CHECK_SECONDS):
+        self.address = address
+        self.pool = EnclavePool(parse_address(address), pool_size, idle_check_seconds)
+        self.outstanding = 0
+        self.healthy = True
+        self.down_until = 0.0
+        self.configured = False
+        self.requests = 0
+        self.failures = 0
+        self._configure_task = None
+
+    def status(self):
+        return {
+            'address': self.address,
+            'healthy': self.healthy,
+            'configured': self.configured,
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'failures': self.failures,
+        }
+
+
+async def nitro_cli_discovery():
+    """Addresses of the running enclaves on this instance, from `nitro-cli describe-enclaves`."""
+    proc = await asyncio.create_subprocess_exec(
+        'nitro-cli', 'describe-enclaves', stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"nitro-cli describe-enclaves failed: {stderr.decode().strip()}")
+    return [f"vsock:{e['EnclaveCID']}:{ENCLAVE_PORT}" for e in json.loads(stdout)
+            if e.get('State') == 'RUNNING']
+
+
+def load_discovery(spec):
+    """Resolve an ENCLAVE_DISCOVERY value to a callable, or None."""
+    if not spec:
+        return None
+    if spec == 'nitro-cli':
+        return nitro_cli_discovery
+    module, _, name = spec.partition(':')
+    return getattr(importlib.import_module(module), name)
+
+
+class EnclaveDispatcher:
+    """
+    Spreads requests across several enclaves.
+
+    Each request goes to a healthy enclave picked by `policy`: 'p2c' samples
+    two enclaves and takes the one with fewer outstanding requests, 'least'
+    takes the least loaded of all. If an enclave cannot be reached, or its
+    connection breaks mid-request, it is marked down for `down_seconds` and
+    the request fails over to another one.
+
+    `configure` is an optional coroutine function taking an EnclaveMember.
+    When given, an enclave is configured before its first request, and again
+    (then retried once) when it reports one of RECONFIGURE_ERRORS, so every
+    enclave holds its own TSK. A successful `configure` request sent through
+    the dispatcher also marks its enclave configured.
+
+    `discover` is an optional callable (sync or async) returning the current
+    list of addresses; it is re-run every `discovery_interval` seconds.
+    """
+
+    def __init__(self, addresses=(), discover=None, configure=None, policy=DISPATCH_POLICY,
+                 pool_size=POOL_SIZE, idle_check_seconds=IDLE_CHECK_SECONDS, down_seconds=DOWN_SECONDS,
+                 discovery_interval=DISCOVERY_INTERVAL):
+        if policy not in ('p2c', 'least'):
+            raise ValueError(f"Unknown dispatch policy: {policy!r}")
+        self.discover = discover
+        self.configure = configure
+        self.policy = policy
+        self.pool_size = pool_size
+        self.idle_check_seconds = idle_check_seconds
+        self.down_seconds = down_seconds
+        self.discovery_interval = discovery_interval
+        self._members = {}
+        self._discovered_at = None
+        self._discovery_task = None
+        self._set_addresses(addresses)
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def status(self):
+        """Routing state of every enclave, e.g. for health checks."""
+        return [member.status() for member in self._members.values()]
+
+    def _set_addresses(self, addresses):
+        current = self._members
+        self._members = {address: current.pop(address, None)
+                         or EnclaveMember(address, self.pool_size, self.idle_check_seconds)
+                         for address in dict.fromkeys(addresses)}
+        for member in current.values():
+            logger.info(f"Enclave {member.address} left the registry")
+            # In-flight requests on it fail over to the remaining enclaves
+            asyncio.ensure_future(member.pool.close())
+
+    async def refresh(self):
+        """Re-run discovery now, joining a discovery already in flight."""
+        task = self._discovery_task
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = self._discovery_task = asyncio.ensure_future(self._discover())
+        await asyncio.shield(task)
+
+    async def _discover(self):
+        try:
+            addresses = self.discover()
+            if inspect.isawaitable(addresses):
+                addresses = await addresses
+        except Exception as e:
+            if not self._members:
+                raise EnclaveUnavailableError(f"enclave discovery failed: {e}") from e
+            logger.warning(f"Enclave discovery failed, keeping {len(self._members)} known enclaves: {e}")
+        else:
+            self._set_addresses(addresses)
+        finally:
+            self._discovered_at = time.monotonic()
+
+    def _choose(self, exclude=()):
+        now = time.monotonic()
+        candidates = [m for m in self._members.values() if m not in exclude]
+        if not candidates:
+            raise EnclaveUnavailableError("no enclaves available")
+        available = [m for m in candidates if m.healthy or now >= m.down_until]
+        # With every enclave down, keep trying them rather than failing outright
+        candidates = available or candidates
+        if self.policy == 'p2c' and len(candidates) > 2:
+            candidates = random.sample(candidates, 2)
+        else:
+            random.shuffle(candidates)
+        return min(candidates, key=lambda m: m.outstanding)
+
+    def _mark_down(self, member, exc):
+        member.failures += 1
+        member.configured = False
+        if member.healthy:
+            logger.warning(f"Enclave {member.address} is unavailable ({exc}), routing around it")
+        member.healthy = False
+        member.down_until = time.monotonic() + self.down_seconds
+
+    def _mark_up(self, member):
+        if not member.healthy:
+            logger.info(f"Enclave {member.address} is back")
+        member.healthy = True
+
+    def _observe(self, member, msg_type, result):
+        if result.get('msg') in RECONFIGURE_ERRORS:
+            member.configured = False
+        elif msg_type == 'configure' and result.get('status') == 'ok':
+            member.configured = True
+
+    async def _ensure_configured(self, member, force=False):
+        if self.configure is None or (member.configured and not force):
+            return
+        task = member._configure_task
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = member._configure_task = asyncio.ensure_future(self.configure(member))
+        await asyncio.shield(task)
+        member.configured = True
+
+    async def _member_request(self, member, msg_type, meta, payload, timeout):
+        if msg_type not in ('configure', 'ping', 'health'):
+            await self._ensure_configured(member)
+        result, body = await member.pool.request(msg_type, meta, payload, timeout)
+        self._observe(member, msg_type, result)
+        if result.get('msg') in RECONFIGURE_ERRORS and self.configure is not None and msg_type != 'configure':
+            logger.info(f"Enclave {member.address} reported {result['msg']}, reconfiguring...")
+            await self._ensure_configured(member, force=True)
+            result, body = await member.pool.request(msg_type, meta, payload, timeout)
+            self._observe(member, msg_type, result)
+        return result, body
+
+    async def _maybe_discover(self):
+        if self.discover is None:
+            return
+        if self._discovered_at is None or time.monotonic() - self._discovered_at > self.discovery_interval:
+            await self.refresh()
+
+    async def request(self, msg_type, meta=None, payload=b'', timeout=None):
+        """
+        Send one request to some enclave; returns (response_meta, response_payload).
+
+        The request is timed, counted and traced (see telemetry.py); a traced
+        request asks the enclave for its phase timings.
+        """
+        start = time.perf_counter()
+        status = 'error'
+        with telemetry.span(f'enclave.{msg_type}', **{'enclave.message_type': msg_type}) as current:
+            trace_id = telemetry.trace_id(current)
+            if trace_id:
+                meta = dict(meta or {}, trace_id=trace_id)
+            try:
+                result, body = await self._request(msg_type, meta, payload, timeout, current)
+                status = result.get('status', 'ok')
+                telemetry.record_enclave_timings(current, result)
+                return result, body
+            finally:
+                telemetry.ENCLAVE_REQUEST_SECONDS.observe(time.perf_counter() - start, type=msg_type)
+                telemetry.ENCLAVE_REQUESTS.inc(type=msg_type, status=status)
+
+    async def _request(self, msg_type, meta, payload, timeout, current=None):
+        await self._maybe_discover()
+        tried = []
+        while True:
+            member = self._choose(tried)
+            if current is not None:
+                current.set_attribute('enclave.address', member.address)
+            member.outstanding += 1
+            member.requests += 1
+            try:
+                result = await self._member_request(member, msg_type, meta, payload, timeout)
+            except EnclaveConnectionError as e:
+                self._mark_down(member, e)
+                tried.append(member)
+                if len(tried) >= len(self._members):
+                    raise
+                telemetry.ENCLAVE_FAILOVERS.inc(enclave=member.address)
+                continue
+            finally:
+                member.outstanding -= 1
+            self._mark_up(member)
+            return result
+
+    async def stream(self, msg_type, meta, chunks, timeout=None):
+        """
+        Streamed request to one enclave (see EnclaveConnection.stream).
+
+        Fails over only while no connection could be opened; once chunks
+        have been sent the stream is not retried.
+        """
+        await self._maybe_discover()
+        tried = []
+        start = time.perf_counter()
+        while True:
+            member = self._choose(tried)
+            member.outstanding += 1
+            member.requests += 1
+            started = False
+            status = 'error'
+            try:
+                await self._ensure_configured(member)
+                async for frame in member.pool.stream(msg_type, meta, chunks, timeout):
+                    started = True
+                    if frame.flags & framing.FLAG_END:
+                        self._observe(member, msg_type, frame.meta)
+                        status = frame.meta.get('status', 'error')
+                    yield frame
+            except EnclaveConnectionError as e:
+                self._mark_down(member, e)
+                tried.append(member)
+                if started or not isinstance(e, EnclaveUnavailableError) or len(tried) >= len(self._members):
+                    telemetry.ENCLAVE_REQUESTS.inc(type=msg_type, status='error')
+                    raise
+                telemetry.ENCLAVE_FAILOVERS.inc(enclave=member.address)
+                continue
+            finally:
+                member.outstanding -= 1
+            telemetry.ENCLAVE_REQUEST_SECONDS.observe(time.perf_counter() - start, type=msg_type)
+            telemetry.ENCLAVE_REQUESTS.inc(type=msg_type, status=status)
+            self._mark_up(member)
+            return
+
+    async def check(self):
+        """Ping every enclave and update its health; returns status()."""
+        async def ping(member):
+            try:
+                meta, _ = await member.pool.request('ping', timeout=CONNECT_TIMEOUT)
+            except (EnclaveConnectionError, asyncio.TimeoutError) as e:
+                self._mark_down(member, e)
+            else:
+                if meta.get('status') == 'ok':
+                    self._mark_up(member)
+
+        await self._maybe_discover()
+        await asyncio.gather(*(ping(m) for m in self._members.values()))
+        return self.status()
+
+    async def metrics(self):
+        """Each reachable enclave's metrics snapshot, as [(address, snapshot)]."""
+        async def fetch(member):
+            try:
+                meta, _ = await member.pool.request('metrics', timeout=CONNECT_TIMEOUT)
+            except (EnclaveConnectionError, asyncio.TimeoutError) as e:
+                logger.debug(f"No metrics from enclave {member.address}: {e}")
+                return None
+            return (member.address, meta['metrics']) if 'metrics' in meta else None
+
+        results = await asyncio.gather(*(fetch(m) for m in self._members.values()))
+        return [result for result in results if result is not None]
+
+    async def close(self):
+        members, self._members = self._members, {}
+        for member in members.values():
+            await member.pool.close()
+
+
+_pool = None
+_configure_hook = None
+
+
+def set_configure_hook(configure):
+    """Coroutine function the dispatcher uses to configure each enclave (see EnclaveDispatcher)."""
+    global _configure_hook
+    _configure_hook = configure
+
+
+def get_enclave_pool():
+    """
+    Return this process's dispatcher over ENCLAVE_ADDRESSES (or ENCLAVE_DISCOVERY,
+    or just ENCLAVE_ADDRESS), bound to the running event loop.
+    """
+    global _pool
+    loop = asyncio.get_running_loop()
+    if _pool is None or _pool[0] is not loop:
+        discover = load_discovery(ENCLAVE_DISCOVERY)
+        addresses = () if discover else (ENCLAVE_ADDRESSES or [ENCLAVE_ADDRESS])
+        _pool = (loop, EnclaveDispatcher(addresses, discover=discover, configure=_configure_hook))
+    return _pool[1]
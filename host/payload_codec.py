@@ -0,0 +1,208 @@
+"""
+Payload Codec
+
+Compresses and encrypts every Temporal payload (workflow inputs and results,
+activity arguments and results, failure details) before it leaves the
+worker or starter, so Temporal history holds neither plaintext input nor
+uncompressed payloads.
+
+Each payload is serialized, compressed when larger than
+PAYLOAD_COMPRESSION_THRESHOLD_BYTES and smaller for it, then sealed with
+AES-256-GCM under the codec key:
+
+    metadata  encoding=binary/encrypted, encryption-key-id=<id>[, compression=zstd|lz4|zlib]
+    data      nonce (12) || ciphertext || tag (16)
+
+The key id and compression are bound as associated data. Payloads without
+the binary/encrypted encoding are rejected, so nothing unencrypted reaches
+a workflow or activity once a key is configured.
+
+The key is 32 random bytes, base64, in PAYLOAD_CODEC_KEY or the file at
+PAYLOAD_CODEC_KEY_PATH; `python3 payload_codec.py --generate-key` writes
+one. Worker, starter and codec server (codec_server.py) must share it, and
+refuse to start without it unless PAYLOAD_CODEC=none.
+"""
+
+import argparse
+import asyncio
+import base64
+import dataclasses
+import hashlib
+import logging
+import os
+import zlib
+
+import temporalio.converter
+from temporalio.api.common.v1 import Payload
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from credentials import PROJECT_ROOT
+
+logger = logging.getLogger(__name__)
+
+# 'none' runs without the codec: Temporal payloads are stored unencrypted
+PAYLOAD_CODEC = os.environ.get('PAYLOAD_CODEC', 'aes-gcm')
+PAYLOAD_CODEC_KEY_PATH = os.environ.get('PAYLOAD_CODEC_KEY_PATH', os.path.join(PROJECT_ROOT, 'payload-codec.key'))
+# zstd or lz4 need the zstandard / lz4 packages; zlib is always available
+PAYLOAD_COMPRESSION = os.environ.get('PAYLOAD_COMPRESSION', 'zstd')
+PAYLOAD_COMPRESSION_THRESHOLD = int(os.environ.get('PAYLOAD_COMPRESSION_THRESHOLD_BYTES', '256'))
+# Batches larger than this are encoded off the event loop
+THREAD_THRESHOLD_BYTES = 1024 * 1024
+# Larger payloads are only compressed if their first SAMPLE_BYTES shrink by
+# at least 10%, so ciphertext (e.g. an EncryptedState) is not compressed in vain
+SAMPLE_BYTES = 4096
+
+ENCODING = b'binary/encrypted'
+NONCE_SIZE = 12
+
+
+def load_compressor(name):
+    """Return (compress, decompress) for a compression name."""
+    if name == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor().compress, zstandard.ZstdDecompressor().decompress
+    if name == 'lz4':
+        import lz4.frame
+        return lz4.frame.compress, lz4.frame.decompress
+    if name == 'zlib':
+        return (lambda data: zlib.compress(data, 6)), zlib.decompress
+    raise ValueError(f"Unknown payload compression: {name!r}")
+
+
+def key_id(key):
+    return hashlib.sha256(key).hexdigest()[:16]
+
+
+class EncryptionCodec(temporalio.converter.PayloadCodec):
+    """PayloadCodec that compresses, then AES-256-GCM encrypts, each payload (see module docstring)."""
+
+    def __init__(self, key, compression=PAYLOAD_COMPRESSION, compression_threshold=PAYLOAD_COMPRESSION_THRESHOLD):
+        if len(key) != 32:
+            raise ValueError("The payload codec key must be 32 bytes")
+        self.key_id = key_id(key).encode()
+        self._aead = AESGCM(key)
+        self.compression_threshold = compression_threshold
+        self._decompressors = {}
+        self._compress = None
+        if compression and compression != 'none':
+            try:
+                self._compress = load_compressor(compression)[0]
+            except ImportError:
+                logger.warning(f"{compression} is not installed, compressing payloads with zlib")
+                compression = 'zlib'
+                self._compress = load_compressor(compression)[0]
+        self.compression = compression.encode() if self._compress else b''
+
+    def _decompressor(self, name):
+        if name not in self._decompressors:
+            try:
+                self._decompressors[name] = load_compressor(name.decode())[1]
+            except ImportError:
+                raise ValueError(f"Payload is compressed with {name.decode()}, which is not installed")
+        return self._decompressors[name]
+
+    def _compressible(self, data):
+        if len(data) <= 4 * SAMPLE_BYTES:
+            return True
+        return len(self._compress(data[:SAMPLE_BYTES])) < 0.9 * SAMPLE_BYTES
+
+    def encode_payload(self, payload):
+        data = payload.SerializeToString()
+        compression = b''
+        if self._compress and len(data) > self.compression_threshold and self._compressible(data):
+            compressed = self._compress(data)
+            if len(compressed) < len(data):
+                data, compression = compressed, self.compression
+        metadata = {'encoding': ENCODING, 'encryption-key-id': self.key_id}
+        if compression:
+            metadata['compression'] = compression
+        nonce = os.urandom(NONCE_SIZE)
+        sealed = self._aead.encrypt(nonce, data, self.key_id + b'|' + compression)
+        return Payload(metadata=metadata, data=nonce + sealed)
+
+    def decode_payload(self, payload):
+        if payload.metadata.get('encoding') != ENCODING:
+            raise ValueError(f"Payload is not encrypted (encoding {payload.metadata.get('encoding')!r})")
+        if payload.metadata.get('encryption-key-id') != self.key_id:
+            raise ValueError(f"Payload was encrypted with unknown key {payload.metadata.get('encryption-key-id')!r}")
+        compression = payload.metadata.get('compression', b'')
+        data = self._aead.decrypt(payload.data[:NONCE_SIZE], payload.data[NONCE_SIZE:], self.key_id + b'|' + compression)
+        if compression:
+            data = self._decompressor(compression)(data)
+        return Payload.FromString(data)
+
+    def encode_all(self, payloads):
+        return [self.encode_payload(p) for p in payloads]
+
+    def decode_all(self, payloads):
+        return [self.decode_payload(p) for p in payloads]
+
+    async def encode(self, payloads):
+        if sum(len(p.data) for p in payloads) > THREAD_THRESHOLD_BYTES:
+            return await asyncio.to_thread(self.encode_all, payloads)
+        return self.encode_all(payloads)
+
+    async def decode(self, payloads):
+        if sum(len(p.data) for p in payloads) > THREAD_THRESHOLD_BYTES:
+            return await asyncio.to_thread(self.decode_all, payloads)
+        return self.decode_all(payloads)
+
+
+def load_key():
+    """The codec key from PAYLOAD_CODEC_KEY or PAYLOAD_CODEC_KEY_PATH, or None if neither is set."""
+    encoded = os.environ.get('PAYLOAD_CODEC_KEY')
+    if not encoded:
+        try:
+            with open(PAYLOAD_CODEC_KEY_PATH) as f:
+                encoded = f.read().strip()
+        except FileNotFoundError:
+            return None
+    return base64.b64decode(encoded)
+
+
+def get_payload_codec():
+    """
+    Return the codec for the configured key, or None with PAYLOAD_CODEC=none.
+
+    Raises RuntimeError if there is no key, so the worker and starter fail
+    closed instead of writing plaintext to Temporal.
+    """
+    if PAYLOAD_CODEC == 'none':
+        logger.warning("PAYLOAD_CODEC=none; Temporal payloads are stored unencrypted")
+        return None
+    if PAYLOAD_CODEC != 'aes-gcm':
+        raise ValueError(f"Unknown payload codec: {PAYLOAD_CODEC!r}")
+    key = load_key()
+    if key is None:
+        raise RuntimeError(f"No payload codec key in PAYLOAD_CODEC_KEY or at {PAYLOAD_CODEC_KEY_PATH} "
+                           "(run `python3 host/payload_codec.py --generate-key`, or set PAYLOAD_CODEC=none "
+                           "to store payloads unencrypted)")
+    return EncryptionCodec(key)
+
+
+def data_converter(codec=None):
+    """Temporal's default data converter with the payload codec, for Client.connect (see get_payload_codec)."""
+    codec = codec or get_payload_codec()
+    if codec is None:
+        return temporalio.converter.default()
+    return dataclasses.replace(temporalio.converter.default(), payload_codec=codec)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--generate-key', action='store_true', help='write a new key to PAYLOAD_CODEC_KEY_PATH')
+    args = parser.parse_args()
+
+    if not args.generate_key:
+        parser.print_help()
+        return
+    if os.path.exists(PAYLOAD_CODEC_KEY_PATH):
+        raise SystemExit(f"{PAYLOAD_CODEC_KEY_PATH} already exists; payloads encrypted with it need it to decode")
+    fd = os.open(PAYLOAD_CODEC_KEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(base64.b64encode(AESGCM.generate_key(bit_length=256)).decode() + '\n')
+    print(f"Wrote {PAYLOAD_CODEC_KEY_PATH}")
+
+
+if __name__ == "__main__":
+    main()
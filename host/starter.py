@@ -1,8 +1,25 @@
+"""
+Workflow Starter
+
+Starts a single ConfidentialWorkflow (default), a multi-agent pipeline
+(--pipeline), or a load test of many pipelines (--load N) that reports
+end-to-end latency percentiles.
+
+Usage:
+    python3 starter.py
+    python3 starter.py --pipeline
+    python3 starter.py --load 2000 --concurrency 200
+"""
+
+import argparse
 import asyncio
 import os
 import logging
+import time
+import uuid
 from temporalio.client import Client
-from workflows import ConfidentialWorkflow
+from payload_codec import data_converter
+from workflows import ConfidentialWorkflow, ConfidentialPipelineWorkflow, Pipeline, PipelineStep
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -11,25 +28,105 @@ TEMPORAL_HOST = os.environ.get("TEMPORAL_HOST", "localhost:7233")
 TEMPORAL_NAMESPACE = os.environ.get("TEMPORAL_NAMESPACE", "confidential-workflow-poc")
 TASK_QUEUE = os.environ.get("TASK_QUEUE", "confidential-workflow-tasks")
 
-async def main():
-    logger.info(f"Connecting to Temporal at {TEMPORAL_HOST}")
-    client = await Client.connect(TEMPORAL_HOST, namespace=TEMPORAL_NAMESPACE)
-    
+INPUT_PAYLOAD = "Sensitive Data Needs Encryption"
+
+# planner -> (researcher, analyst) in parallel -> writer
+DEFAULT_STEPS = [
+    PipelineStep('planner'),
+    PipelineStep('researcher', after=['planner']),
+    PipelineStep('analyst', after=['planner']),
+    PipelineStep('writer', after=['researcher', 'analyst']),
+]
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+async def run_single(client):
     logger.info("Starting workflow...")
-    input_payload = "Sensitive Data Needs Encryption"
-    
     handle = await client.start_workflow(
         ConfidentialWorkflow.run,
-        input_payload,
+        INPUT_PAYLOAD,
         id="confidential-workflow-test-1",
         task_queue=TASK_QUEUE,
     )
 
     logger.info(f"Workflow started. ID: {handle.id}, RunID: {handle.run_id}")
     logger.info("Waiting for result...")
-    
+
     result = await handle.result()
-    logger.info(f"Workflow Result: {result}")
+    logger.info(f"Workflow Result: {len(result)} bytes of EncryptedState")
+
+
+async def run_pipeline(client):
+    logger.info(f"Starting pipeline: {', '.join(s.agent_id for s in DEFAULT_STEPS)}")
+    result = await client.execute_workflow(
+        ConfidentialPipelineWorkflow.run,
+        Pipeline(INPUT_PAYLOAD, DEFAULT_STEPS),
+        id=f"confidential-pipeline-{uuid.uuid4()}",
+        task_queue=TASK_QUEUE,
+    )
+    logger.info(f"Pipeline Result: {len(result)} bytes of PipelineResult")
+
+
+async def run_load(client, total, concurrency):
+    """Run `total` pipelines, at most `concurrency` at a time; print a latency report."""
+    semaphore = asyncio.Semaphore(concurrency)
+    run_id = uuid.uuid4().hex[:8]
+    latencies, failures = [], []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await client.execute_workflow(
+                    ConfidentialPipelineWorkflow.run,
+                    Pipeline(INPUT_PAYLOAD, DEFAULT_STEPS),
+                    id=f"confidential-pipeline-load-{run_id}-{i}",
+                    task_queue=TASK_QUEUE,
+                )
+            except Exception as e:
+                failures.append(e)
+                return
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    logger.info(f"Starting {total} pipelines ({concurrency} concurrent)...")
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"workflows: {len(latencies)} completed, {len(failures)} failed in {elapsed:.1f}s "
+          f"({len(latencies) / elapsed:.1f}/s)")
+    print(f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    print(f"{percentile(latencies, 50):>9.1f} {percentile(latencies, 90):>9.1f} "
+          f"{percentile(latencies, 99):>9.1f} {(latencies[-1] if latencies else 0):>9.1f}")
+    if failures:
+        logger.error(f"First failure: {failures[0]}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pipeline', action='store_true', help='run one multi-agent pipeline')
+    parser.add_argument('--load', type=int, default=0, metavar='N', help='run N pipelines and report latency')
+    parser.add_argument('--concurrency', type=int, default=100, help='pipelines in flight during --load')
+    args = parser.parse_args()
+
+    converter = data_converter()
+    logger.info(f"Connecting to Temporal at {TEMPORAL_HOST}")
+    client = await Client.connect(TEMPORAL_HOST, namespace=TEMPORAL_NAMESPACE, data_converter=converter)
+
+    if args.load:
+        await run_load(client, args.load, args.concurrency)
+    elif args.pipeline:
+        await run_pipeline(client)
+    else:
+        await run_single(client)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,181 @@
+"""
+Telemetry
+
+Metrics and tracing for the host side of the enclave request path.
+
+Metrics (common/metrics.py) time each phase on the host: credentials (IMDS),
+configure, connect, the enclave round trip per message type, and whole
+activities. serve_metrics() exposes them in Prometheus text format on
+HOST_METRICS_ADDR:HOST_METRICS_PORT (localhost by default), together with every enclave's own counters and
+histograms, fetched with the `metrics` message on each scrape and labelled
+with the enclave's address.
+
+Tracing uses OpenTelemetry when opentelemetry-api is installed (a no-op
+otherwise). Each activity and each enclave request gets a span; the worker
+adds Temporal's TracingInterceptor so activity spans are children of their
+workflow run. Enclave requests carry the span's trace id, and the enclave
+returns its phase timings (decrypt, agent, encrypt, KMS...) which are added
+to the request span as attributes. Spans are exported over OTLP when
+OTEL_EXPORTER_OTLP_ENDPOINT is set and the SDK and exporter are installed.
+"""
+
+import asyncio
+import contextlib
+import functools
+import logging
+import os
+import sys
+import time
+
+# The host modules' one sys.path entry point: the shared runtime modules
+# (common/) and the generated bindings (proto/) live in the repository root
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path[:0] = [_ROOT, os.path.join(_ROOT, 'proto')]
+from common import metrics
+
+logger = logging.getLogger(__name__)
+
+# Address and port of the Prometheus endpoint (an empty address, or port 0
+# or empty, disables it)
+METRICS_ADDR = os.environ.get('HOST_METRICS_ADDR', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('HOST_METRICS_PORT', '9464') or 0)
+SERVICE_NAME = os.environ.get('OTEL_SERVICE_NAME', 'confidential-workflow-worker')
+
+METRICS = metrics.Registry()
+ACTIVITY_SECONDS = METRICS.histogram('host_activity_seconds', 'Activity run time, by activity and outcome',
+                                     ('activity', 'status'))
+PHASE_SECONDS = METRICS.histogram('host_phase_seconds', 'Time per host phase: credentials, configure, connect',
+                                  ('phase',))
+ENCLAVE_REQUEST_SECONDS = METRICS.histogram('host_enclave_request_seconds',
+                                            'Enclave round trip (send to response), by message type', ('type',))
+ENCLAVE_REQUESTS = METRICS.counter('host_enclave_requests_total', 'Enclave requests, by message type and outcome',
+                                   ('type', 'status'))
+ENCLAVE_FAILOVERS = METRICS.counter('host_enclave_failovers_total', 'Requests moved off an unavailable enclave',
+                                    ('enclave',))
+
+try:
+    from opentelemetry import trace as _trace
+except ImportError:
+    _trace = None
+_tracer = _trace.get_tracer(__name__) if _trace else None
+
+
+def setup_tracing():
+    """Export spans over OTLP if OTEL_EXPORTER_OTLP_ENDPOINT is set and the OpenTelemetry SDK is installed."""
+    if _trace is None or not os.environ.get('OTEL_EXPORTER_OTLP_ENDPOINT'):
+        return False
+    try:
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk / the OTLP exporter is not installed")
+        return False
+    provider = TracerProvider(resource=Resource.create({'service.name': SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    _trace.set_tracer_provider(provider)
+    return True
+
+
+def temporal_interceptors():
+    """Temporal client interceptors that trace workflows and activities (empty without OpenTelemetry)."""
+    try:
+        from temporalio.contrib.opentelemetry import TracingInterceptor
+    except ImportError:
+        return []
+    return [TracingInterceptor()]
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """A tracing span as the current span; yields the span, or None without OpenTelemetry."""
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+
+def trace_id(current):
+    """Hex trace id of a recording span, or None."""
+    if current is None or not current.is_recording():
+        return None
+    return format(current.get_span_context().trace_id, '032x')
+
+
+def record_enclave_timings(current, response):
+    """Add the enclave's phase timings (response `timings`, in ms) to a span."""
+    if current is None:
+        return
+    for phase, ms in (response.get('timings') or {}).items():
+        current.set_attribute(f'enclave.{phase}_ms', ms)
+
+
+def traced_activity(fn):
+    """Wrap an async activity in a span and time it into ACTIVITY_SECONDS."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        from temporalio import activity
+        attributes = {}
+        try:
+            info = activity.info()
+            attributes = {'temporal.workflow_id': info.workflow_id, 'temporal.run_id': info.workflow_run_id,
+                          'temporal.activity_attempt': info.attempt}
+        except RuntimeError:
+            pass
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            with span(f'activity.{fn.__name__}', **attributes):
+                result = await fn(*args, **kwargs)
+            status = 'ok'
+            return result
+        finally:
+            ACTIVITY_SECONDS.observe(time.perf_counter() - start, activity=fn.__name__, status=status)
+    return wrapper
+
+
+async def render_metrics(collect_enclaves=None):
+    """Prometheus text for the host's metrics plus each enclave's (see serve_metrics)."""
+    sources = [(METRICS.snapshot(), {})]
+    if collect_enclaves is not None:
+        for address, snapshot in await collect_enclaves():
+            sources.append((snapshot, {'enclave': address}))
+    return metrics.render_prometheus(sources)
+
+
+def metrics_enabled():
+    """Whether the worker should serve /metrics (HOST_METRICS_ADDR and HOST_METRICS_PORT both set)."""
+    return bool(METRICS_ADDR and METRICS_PORT)
+
+
+async def serve_metrics(port=METRICS_PORT, collect_enclaves=None, host=METRICS_ADDR):
+    """
+    Serve GET /metrics in Prometheus text format on the running event loop.
+
+    `collect_enclaves` is a coroutine function returning [(address,
+    snapshot)] for the enclaves (EnclaveDispatcher.metrics). Returns the
+    asyncio server.
+    """
+    async def handle(reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            parts = request.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', (await render_metrics(collect_enclaves)).encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except Exception as e:
+            logger.warning(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Serving metrics on http://{host}:{server.sockets[0].getsockname()[1]}/metrics")
+    return server
@@ -2,17 +2,40 @@
 Temporal Worker Entry Point
 
 Connects to Temporal server and waits for workflow tasks.
+
+Concurrency limits, pollers and the activity executor come from the
+environment (WORKER_*) or the command line. With --processes N the host
+runs N worker processes that split the host's enclave connections
+(ENCLAVE_POOL_SIZE per enclave) between them. SIGTERM or SIGINT stops
+polling and drains in-flight activities (and their enclave calls) for up
+to WORKER_GRACEFUL_SHUTDOWN_SECONDS before exiting.
+
+Each process serves Prometheus metrics on HOST_METRICS_ADDR (localhost by
+default) and HOST_METRICS_PORT (plus its process index), and traces
+activities with OpenTelemetry when available (see telemetry.py).
+
+Usage:
+    python3 worker.py
+    python3 worker.py --max-concurrent-activities 64 --processes 2
 """
 
+import argparse
 import asyncio
+import multiprocessing
 import os
 import logging
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 
 from temporalio.client import Client
 from temporalio.worker import Worker
 
+import telemetry
+from payload_codec import data_converter
+
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=logging.INFO, format='%(levelname)s:%(processName)s:%(name)s:%(message)s')
 logger = logging.getLogger(__name__)
 
 # Configuration from environment
@@ -21,27 +44,134 @@ TEMPORAL_NAMESPACE = os.environ.get("TEMPORAL_NAMESPACE", "confidential-workflow
 TASK_QUEUE = os.environ.get("TASK_QUEUE", "confidential-workflow-tasks")
 
 
-async def main():
-    """Main worker entry point."""
+def env_int(name):
+    """Integer setting from the environment, or None to keep the library default."""
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-concurrent-activities', type=int, default=env_int('WORKER_MAX_CONCURRENT_ACTIVITIES'),
+                        help='activities run at once per process')
+    parser.add_argument('--max-concurrent-workflow-tasks', type=int,
+                        default=env_int('WORKER_MAX_CONCURRENT_WORKFLOW_TASKS'),
+                        help='workflow tasks run at once per process')
+    parser.add_argument('--activity-pollers', type=int, default=env_int('WORKER_ACTIVITY_POLLERS'),
+                        help='concurrent activity task polls')
+    parser.add_argument('--workflow-pollers', type=int, default=env_int('WORKER_WORKFLOW_POLLERS'),
+                        help='concurrent workflow task polls')
+    parser.add_argument('--activity-threads', type=int, default=env_int('WORKER_ACTIVITY_THREADS'),
+                        help='thread pool for synchronous activities (the enclave activities are async)')
+    parser.add_argument('--processes', type=int, default=env_int('WORKER_PROCESSES') or 1,
+                        help='worker processes on this host')
+    parser.add_argument('--graceful-shutdown-seconds', type=float,
+                        default=float(os.environ.get('WORKER_GRACEFUL_SHUTDOWN_SECONDS', '30')),
+                        help='how long in-flight activities may finish after SIGTERM')
+    return parser.parse_args(argv)
+
+
+def worker_options(args):
+    """Worker keyword arguments for the tuning settings; unset ones keep the library defaults."""
+    options = {
+        'max_concurrent_activities': args.max_concurrent_activities,
+        'max_concurrent_workflow_tasks': args.max_concurrent_workflow_tasks,
+        'max_concurrent_activity_task_polls': args.activity_pollers,
+        'max_concurrent_workflow_task_polls': args.workflow_pollers,
+        'graceful_shutdown_timeout': timedelta(seconds=args.graceful_shutdown_seconds),
+    }
+    if args.activity_threads:
+        options['activity_executor'] = ThreadPoolExecutor(args.activity_threads)
+    return {name: value for name, value in options.items() if value is not None}
+
+
+def pool_share(pool_size, processes):
+    """Enclave connections per process when `processes` split a host's `pool_size`."""
+    return max(1, -(-pool_size // processes))
+
+
+async def run_worker(args, index=0):
+    """Run one worker until SIGTERM/SIGINT, then drain in-flight activities and close the enclave pool."""
+    converter = data_converter()
     logger.info(f"Connecting to Temporal at {TEMPORAL_HOST}")
-    
-    client = await Client.connect(TEMPORAL_HOST, namespace=TEMPORAL_NAMESPACE)
+
+    telemetry.setup_tracing()
+    client = await Client.connect(TEMPORAL_HOST, namespace=TEMPORAL_NAMESPACE, data_converter=converter,
+                                  interceptors=telemetry.temporal_interceptors())
     logger.info(f"Connected to namespace: {TEMPORAL_NAMESPACE}")
-    
+
     # Import activities and workflows
-    from activities import process_in_enclave
-    from workflows import ConfidentialWorkflow
-    
+    from activities import health_check, process_in_enclave, process_batch_in_enclave, run_agent_in_enclave
+    from enclave_client import get_enclave_pool
+    from workflows import ConfidentialWorkflow, ConfidentialBatchWorkflow, ConfidentialPipelineWorkflow
+
+    options = worker_options(args)
     worker = Worker(
         client,
         task_queue=TASK_QUEUE,
-        workflows=[ConfidentialWorkflow],
-        activities=[process_in_enclave],
+        workflows=[ConfidentialWorkflow, ConfidentialBatchWorkflow, ConfidentialPipelineWorkflow],
+        activities=[process_in_enclave, process_batch_in_enclave, run_agent_in_enclave, health_check],
+        **options,
     )
-    
-    logger.info(f"Starting worker on queue: {TASK_QUEUE}")
-    await worker.run()
+
+    metrics_server = None
+    if telemetry.metrics_enabled():
+        metrics_server = await telemetry.serve_metrics(telemetry.METRICS_PORT + index, get_enclave_pool().metrics)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    logger.info(f"Starting worker on queue: {TASK_QUEUE} "
+                f"({', '.join(f'{k}={v}' for k, v in options.items() if k != 'activity_executor') or 'defaults'})")
+    running = asyncio.create_task(worker.run())
+    stopping = asyncio.create_task(stop.wait())
+    await asyncio.wait([running, stopping], return_when=asyncio.FIRST_COMPLETED)
+
+    if not running.done():
+        logger.info(f"Shutting down: draining in-flight activities (up to {args.graceful_shutdown_seconds:g}s)...")
+        await worker.shutdown()
+    stopping.cancel()
+    try:
+        await running
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        await get_enclave_pool().close()
+        logger.info("Worker stopped")
+
+
+def run_process(args, index=0):
+    asyncio.run(run_worker(args, index))
+
+
+def main():
+    """Main worker entry point."""
+    args = parse_args()
+    if args.processes <= 1:
+        run_process(args)
+        return
+
+    # The children pick up their share of the enclave connections from the environment
+    pool_size = int(os.environ.get('ENCLAVE_POOL_SIZE', '4'))
+    os.environ['ENCLAVE_POOL_SIZE'] = str(pool_share(pool_size, args.processes))
+    context = multiprocessing.get_context('spawn')
+    children = [context.Process(target=run_process, args=(args, i), name=f'worker-{i}')
+                for i in range(args.processes)]
+    for child in children:
+        child.start()
+    logger.info(f"Started {args.processes} worker processes ({os.environ['ENCLAVE_POOL_SIZE']} enclave connections each)")
+
+    # Children drain on their own SIGINT; pass SIGTERM on to them
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: [child.terminate() for child in children if child.is_alive()])
+    for child in children:
+        child.join()
+    failed = [child.name for child in children if child.exitcode]
+    if failed:
+        raise SystemExit(f"Worker processes failed: {', '.join(failed)}")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
@@ -4,11 +4,97 @@ Temporal Workflows
 Workflow definitions for confidential processing.
 """
 
+import asyncio
+from dataclasses import dataclass, field
 from datetime import timedelta
+from typing import List
 from temporalio import workflow
+from temporalio.common import RetryPolicy
+from temporalio.exceptions import ApplicationError
 
 with workflow.unsafe.imports_passed_through():
-    from activities import process_in_enclave
+    from activities import process_in_enclave, process_batch_in_enclave, run_agent_in_enclave, batch_item
+    import state_pb2
+
+# Batch limits for EnclaveBatcher
+BATCH_MAX_ITEMS = 64
+BATCH_MAX_BYTES = 4 * 1024 * 1024
+BATCH_MAX_DELAY = timedelta(milliseconds=50)
+
+
+class EnclaveBatcher:
+    """
+    Coalesces states submitted from one workflow into process_batch_in_enclave calls.
+    
+    Pending items are flushed as one batch once `max_items` or `max_bytes` is
+    reached, or `max_delay` after the first item arrived, whichever comes
+    first. Each submit() resolves to that item's ProcessResult.
+    """
+    
+    def __init__(self, max_items=BATCH_MAX_ITEMS, max_bytes=BATCH_MAX_BYTES, max_delay=BATCH_MAX_DELAY,
+                 start_to_close_timeout=timedelta(minutes=5)):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.start_to_close_timeout = start_to_close_timeout
+        self._pending = []
+        self._pending_bytes = 0
+        self._timer = None
+    
+    async def submit(self, request_data) -> state_pb2.ProcessResult:
+        """Queue plaintext input or a previous EncryptedState; returns its ProcessResult."""
+        item = batch_item(request_data, workflow.info().workflow_id)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        self._pending_bytes += item.ByteSize()
+        
+        if len(self._pending) >= self.max_items or self._pending_bytes >= self.max_bytes:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return await future
+    
+    async def process(self, request_data) -> bytes:
+        """Like submit(), but return the new EncryptedState or raise for a failed item."""
+        result = await self.submit(request_data)
+        if result.status != 'ok':
+            raise ApplicationError(f"{result.msg}: {result.details}", type='EnclaveProcessError', non_retryable=True)
+        return result.payload
+    
+    def flush(self):
+        """Send everything pending as one batch now."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending, self._pending_bytes = self._pending, [], 0
+        asyncio.create_task(self._run(batch))
+    
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay.total_seconds())
+        self._timer = None
+        self.flush()
+    
+    async def _run(self, batch):
+        request = state_pb2.ProcessBatch(items=[item for item, _ in batch])
+        try:
+            response = await workflow.execute_activity(
+                process_batch_in_enclave,
+                request.SerializeToString(),
+                start_to_close_timeout=self.start_to_close_timeout,
+            )
+            results = state_pb2.ProcessBatchResult.FromString(response).results
+            if len(results) != len(batch):
+                raise ApplicationError(f"Enclave returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
 
 
 @workflow.defn
@@ -18,11 +104,110 @@ class ConfidentialWorkflow:
     """
     
     @workflow.run
-    async def run(self, input_data: str) -> str:
-        """Execute the confidential workflow."""
+    async def run(self, input_data: str) -> bytes:
+        """Execute the confidential workflow. Returns the serialized EncryptedState."""
         result = await workflow.execute_activity(
             process_in_enclave,
             input_data,
             start_to_close_timeout=timedelta(minutes=5),
         )
         return result
+
+
+@workflow.defn
+class ConfidentialBatchWorkflow:
+    """
+    Fan-out workflow: processes many independent inputs through EnclaveBatcher.
+    """
+    
+    @workflow.run
+    async def run(self, inputs: List[str]) -> bytes:
+        """Returns a serialized ProcessBatchResult, one result per input."""
+        batcher = EnclaveBatcher()
+        results = await asyncio.gather(*(batcher.submit(data) for data in inputs))
+        return state_pb2.ProcessBatchResult(results=results).SerializeToString()
+
+
+@dataclass
+class PipelineStep:
+    """One agent of a ConfidentialPipelineWorkflow."""
+    agent_id: str
+    # Upstream agents whose output this agent consumes; none = the pipeline input
+    after: List[str] = field(default_factory=list)
+    timeout_seconds: float = 300
+    max_attempts: int = 3
+
+
+@dataclass
+class Pipeline:
+    input_data: str
+    steps: List[PipelineStep]
+
+
+def pipeline_order(steps):
+    """
+    Return `steps` in dependency order.
+    
+    Raises ApplicationError (non-retryable) for duplicate agent ids, unknown
+    upstream agents and cycles.
+    """
+    by_id = {}
+    for step in steps:
+        if step.agent_id in by_id:
+            raise ApplicationError(f"Duplicate agent {step.agent_id!r}", type='InvalidPipeline', non_retryable=True)
+        by_id[step.agent_id] = step
+    for step in steps:
+        unknown = [a for a in step.after if a not in by_id]
+        if unknown:
+            raise ApplicationError(f"Agent {step.agent_id!r} depends on unknown agents {unknown}",
+                                   type='InvalidPipeline', non_retryable=True)
+    
+    ordered, done = [], set()
+    remaining = list(steps)
+    while remaining:
+        ready = [s for s in remaining if all(a in done for a in s.after)]
+        if not ready:
+            raise ApplicationError(f"Pipeline has a cycle among {[s.agent_id for s in remaining]}",
+                                   type='InvalidPipeline', non_retryable=True)
+        ordered += ready
+        done.update(s.agent_id for s in ready)
+        remaining = [s for s in remaining if s.agent_id not in done]
+    return ordered
+
+
+@workflow.defn
+class ConfidentialPipelineWorkflow:
+    """
+    Multi-agent pipeline: a DAG of agents, each run in the enclave.
+    
+    Every agent starts as soon as its upstream agents finish, so independent
+    agents run in parallel (fan-out); an agent with several upstream agents
+    receives all their states, merged inside the enclave (fan-in). Only
+    EncryptedStates pass between agents. Each step has its own timeout and
+    retry limit.
+    """
+    
+    @workflow.run
+    async def run(self, pipeline: Pipeline) -> bytes:
+        """Returns a serialized PipelineResult with every agent's final EncryptedState."""
+        steps = pipeline_order(pipeline.steps)
+        workflow_id = workflow.info().workflow_id
+        outputs = {}
+        
+        async def run_step(step):
+            upstream = await asyncio.gather(*(outputs[a] for a in step.after))
+            if upstream:
+                inputs = [state_pb2.ProcessItem(payload=state, encrypted=True) for state in upstream]
+            else:
+                inputs = [batch_item(pipeline.input_data, workflow_id)]
+            return await workflow.execute_activity(
+                run_agent_in_enclave,
+                state_pb2.AgentStep(agent_id=step.agent_id, inputs=inputs).SerializeToString(),
+                start_to_close_timeout=timedelta(seconds=step.timeout_seconds),
+                retry_policy=RetryPolicy(maximum_attempts=step.max_attempts),
+            )
+        
+        for step in steps:
+            outputs[step.agent_id] = asyncio.ensure_future(run_step(step))
+        states = await asyncio.gather(*outputs.values())
+        return state_pb2.PipelineResult(states=dict(zip(outputs, states))).SerializeToString()
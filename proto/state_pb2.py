@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: state.proto
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0bstate.proto\x12\x0c\x63onfidential\"R\n\nAgentState\x12\x10\n\x08\x61gent_id\x18\x01 \x01(\t\x12\x11\n\titeration\x18\x02 \x01(\x05\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\x0c\x12\x11\n\ttimestamp\x18\x04 \x01(\x03\"\x9b\x02\n\x0e\x45ncryptedState\x12\x12\n\nciphertext\x18\x01 \x01(\x0c\x12\r\n\x05nonce\x18\x02 \x01(\x0c\x12\x0b\n\x03tag\x18\x03 \x01(\x0c\x12\x13\n\x0bworkflow_id\x18\x04 \x01(\t\x12\x11\n\titeration\x18\x05 \x01(\x05\x12\x12\n\nchunk_size\x18\x06 \x01(\r\x12#\n\x04\x62lob\x18\x07 \x01(\x0b\x32\x15.confidential.BlobRef\x12\x0e\n\x06key_id\x18\x08 \x01(\t\x12\x13\n\x0b\x63ompression\x18\t \x01(\t\x12\x0e\n\x06padded\x18\n \x01(\x08\x12\x16\n\x0e\x62\x61se_iteration\x18\x0b \x01(\x05\x12+\n\x05\x63hain\x18\x0c \x03(\x0b\x32\x1c.confidential.EncryptedState\"[\n\x0c\x43ontextDelta\x12\'\n\x05state\x18\x01 \x01(\x0b\x32\x18.confidential.AgentState\x12\x13\n\x0b\x62\x61se_sha256\x18\x02 \x01(\x0c\x12\r\n\x05patch\x18\x03 \x01(\x0c\"\'\n\x07\x42lobRef\x12\x0e\n\x06sha256\x18\x01 \x01(\t\x12\x0c\n\x04size\x18\x02 \x01(\x04\"h\n\x0bProcessItem\x12\x0f\n\x07payload\x18\x01 \x01(\x0c\x12\x11\n\tencrypted\x18\x02 \x01(\x08\x12\x0e\n\x06legacy\x18\x03 \x01(\x08\x12\x13\n\x0bworkflow_id\x18\x04 \x01(\t\x12\x10\n\x08\x61gent_id\x18\x05 \x01(\t\"8\n\x0cProcessBatch\x12(\n\x05items\x18\x01 \x03(\x0b\x32\x19.confidential.ProcessItem\"a\n\rProcessResult\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0b\n\x03msg\x18\x02 \x01(\t\x12\x0f\n\x07\x64\x65tails\x18\x03 \x01(\t\x12\x0f\n\x07payload\x18\x04 \x01(\x0c\x12\x11\n\titeration\x18\x05 \x01(\x05\"B\n\x12ProcessBatchResult\x12,\n\x07results\x18\x01 \x03(\x0b\x32\x1b.confidential.ProcessResult\"H\n\tAgentStep\x12\x10\n\x08\x61gent_id\x18\x01 \x01(\t\x12)\n\x06inputs\x18\x02 \x03(\x0b\x32\x19.confidential.ProcessItem\"y\n\x0ePipelineResult\x12\x38\n\x06states\x18\x01 \x03(\x0b\x32(.confidential.PipelineResult.StatesEntry\x1a-\n\x0bStatesEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x0c:\x02\x38\x01\x62\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'state_pb2', _globals)
+if _descriptor._USE_C_DESCRIPTORS == False:
+  DESCRIPTOR._options = None
+  _PIPELINERESULT_STATESENTRY._options = None
+  _PIPELINERESULT_STATESENTRY._serialized_options = b'8\001'
+  _globals['_AGENTSTATE']._serialized_start=29
+  _globals['_AGENTSTATE']._serialized_end=111
+  _globals['_ENCRYPTEDSTATE']._serialized_start=114
+  _globals['_ENCRYPTEDSTATE']._serialized_end=397
+  _globals['_CONTEXTDELTA']._serialized_start=399
+  _globals['_CONTEXTDELTA']._serialized_end=490
+  _globals['_BLOBREF']._serialized_start=492
+  _globals['_BLOBREF']._serialized_end=531
+  _globals['_PROCESSITEM']._serialized_start=533
+  _globals['_PROCESSITEM']._serialized_end=637
+  _globals['_PROCESSBATCH']._serialized_start=639
+  _globals['_PROCESSBATCH']._serialized_end=695
+  _globals['_PROCESSRESULT']._serialized_start=697
+  _globals['_PROCESSRESULT']._serialized_end=794
+  _globals['_PROCESSBATCHRESULT']._serialized_start=796
+  _globals['_PROCESSBATCHRESULT']._serialized_end=862
+  _globals['_AGENTSTEP']._serialized_start=864
+  _globals['_AGENTSTEP']._serialized_end=936
+  _globals['_PIPELINERESULT']._serialized_start=938
+  _globals['_PIPELINERESULT']._serialized_end=1059
+  _globals['_PIPELINERESULT_STATESENTRY']._serialized_start=1014
+  _globals['_PIPELINERESULT_STATESENTRY']._serialized_end=1059
+# @@protoc_insertion_point(module_scope)
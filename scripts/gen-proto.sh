@@ -0,0 +1,23 @@
+#!/bin/bash
+# Regenerate Python bindings for proto/state.proto
+# Bindings are committed; rerun after editing the .proto.
+# Uses grpcio-tools 1.59 (protoc 24.x) so the generated code loads on any
+# protobuf runtime >= 4.24 (see host/ and enclave/ requirements.txt).
+
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+PROJECT_ROOT="$(dirname "$SCRIPT_DIR")"
+
+source "$SCRIPT_DIR/lib/logging.sh"
+
+PYTHON="${PYTHON:-python3}"
+
+if ! "$PYTHON" -c "import grpc_tools" 2>/dev/null; then
+    log_info "Installing grpcio-tools..."
+    "$PYTHON" -m pip install --user "grpcio-tools==1.59.3"
+fi
+
+cd "$PROJECT_ROOT/proto"
+"$PYTHON" -m grpc_tools.protoc -I. --python_out=. state.proto
+log_info "Generated proto/state_pb2.py"
@@ -34,6 +34,7 @@ COMMANDS='[
     "cd /home/ec2-user/confidential-multi-agent-workflow/host",
     "python3 -m pip install -r requirements.txt --user 2>&1 || true",
     "export TEMPORAL_HOST='"$TEMPORAL_HOST"'",
+    "test -f ../payload-codec.key || python3 payload_codec.py --generate-key",
     "nohup python3 worker.py > /tmp/worker.log 2>&1 &",
     "sleep 3",
     "pgrep -f worker.py && echo Worker started || echo Worker not found"
@@ -0,0 +1,79 @@
+"""
+Shared fixtures for the unit tests: the enclave's TSK, enclave/app.py
+served on a UNIX socket in this process, and the host activities wired to
+it with KMS stubbed out.
+"""
+import os
+import socket
+import sys
+import tempfile
+import threading
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.join(ROOT, 'proto'))
+
+import app  # noqa: E402
+
+KEY = bytes(range(32))
+
+
+@pytest.fixture
+def key():
+    """The TSK, stored in the enclave's key cache for the test."""
+    app.KEY_CACHE.store(KEY)
+    yield KEY
+    app.KEY_CACHE.clear()
+
+
+@pytest.fixture
+def serve_enclave():
+    """
+    Start enclave/app.py on a UNIX socket in a thread:
+    serve_enclave(**serve_kwargs) returns its address. Servers stop at
+    the end of the test.
+    """
+    servers = []
+
+    def start(**kwargs):
+        path = os.path.join(tempfile.mkdtemp(), 'enclave.sock')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(app.LISTEN_BACKLOG)
+        stop = threading.Event()
+        threading.Thread(target=app.serve, args=(listener,), kwargs=dict(kwargs, stop_event=stop), daemon=True).start()
+        servers.append((stop, listener))
+        return f'unix:{path}'
+
+    yield start
+    for stop, listener in servers:
+        stop.set()
+        listener.close()
+
+
+@pytest.fixture
+def enclave_host(serve_enclave, monkeypatch, tmp_path):
+    """
+    Point the host activities at an enclave served in this process, with
+    KMS config and Decrypt stubbed to release KEY and the attestation
+    document written under tmp_path; yields its address.
+    """
+    sys.path.insert(0, os.path.join(ROOT, 'host'))
+    import activities
+    import enclave_client
+
+    async def get_kms_config():
+        return {'encrypted_tsk': 'dGVzdA==', 'aws_access_key_id': 'AKIATEST', 'aws_secret_access_key': 's',
+                'aws_session_token': 't'}
+
+    address = serve_enclave()
+    monkeypatch.setattr(app, 'kms_decrypt', lambda *args, **kwargs: (KEY, None))
+    monkeypatch.setattr(activities, 'get_kms_config', get_kms_config)
+    monkeypatch.setattr(activities, '_enclave_configured', False)
+    monkeypatch.setattr(activities, 'PROJECT_ROOT', str(tmp_path))
+    monkeypatch.setattr(enclave_client, 'ENCLAVE_ADDRESS', address)
+    monkeypatch.setattr(enclave_client, '_pool', None)
+    yield address
+    app.KEY_CACHE.clear()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the EC2 instance metadata service (IMDSv2).
+
+Serves the three calls the host worker makes for role credentials:
+
+    PUT /latest/api/token                                  session token
+    GET /latest/meta-data/iam/security-credentials/        role name
+    GET /latest/meta-data/iam/security-credentials/<role>  credentials
+
+Every credentials response carries a new AccessKeyId and an `Expiration`
+`credential_ttl` seconds ahead, so tests can watch refreshes happen.
+Tokens are checked like IMDS does: a missing or revoked token gets 401.
+
+Usage:
+    python3 tests/fake_imds.py --port 8169 --credential-ttl 3600
+    IMDS_ENDPOINT=http://127.0.0.1:8169 python3 host/worker.py
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CREDENTIALS_PATH = '/latest/meta-data/iam/security-credentials/'
+
+
+class FakeImds:
+    """Holds the fake role, tokens and call counters."""
+
+    def __init__(self, role='FakeEnclaveRole', credential_ttl=3600, latency=0.0):
+        self.role = role
+        self.credential_ttl = credential_ttl
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._tokens = set()
+        self._serial = itertools.count(1)
+        self.calls = {'token': 0, 'role': 0, 'credentials': 0}
+
+    def revoke_tokens(self):
+        """Invalidate every issued token, as if it had expired."""
+        with self._lock:
+            self._tokens.clear()
+
+    def handle(self, method, path, headers):
+        """Handle one request; returns (http_status, body text)."""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if method == 'PUT' and path == '/latest/api/token':
+                if not headers.get('X-aws-ec2-metadata-token-ttl-seconds'):
+                    return 400, ''
+                self.calls['token'] += 1
+                token = uuid.uuid4().hex
+                self._tokens.add(token)
+                return 200, token
+            if method != 'GET':
+                return 405, ''
+            if headers.get('X-aws-ec2-metadata-token') not in self._tokens:
+                return 401, ''
+            if path == CREDENTIALS_PATH:
+                self.calls['role'] += 1
+                return 200, self.role
+            if path == CREDENTIALS_PATH + self.role:
+                self.calls['credentials'] += 1
+                serial = next(self._serial)
+                expiration = datetime.now(timezone.utc) + timedelta(seconds=self.credential_ttl)
+                return 200, json.dumps({
+                    'Code': 'Success',
+                    'Type': 'AWS-HMAC',
+                    'AccessKeyId': f'ASIAFAKE{serial:012d}',
+                    'SecretAccessKey': f'secret-{serial}',
+                    'Token': f'session-token-{serial}',
+                    'Expiration': expiration.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                })
+            return 404, ''
+
+
+def start_fake_imds(fake=None, host='127.0.0.1', port=0):
+    """Serve `fake` on a daemon thread; returns (fake, server, endpoint URL)."""
+    fake = fake or FakeImds()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _handle(self, method):
+            status, body = fake.handle(method, self.path, self.headers)
+            raw = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_PUT(self):
+            self._handle('PUT')
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return fake, server, f'http://{host}:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8169)
+    parser.add_argument('--role', default='FakeEnclaveRole')
+    parser.add_argument('--credential-ttl', type=float, default=3600, help='seconds until issued credentials expire')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to each call')
+    args = parser.parse_args()
+
+    _, server, endpoint = start_fake_imds(FakeImds(args.role, args.credential_ttl, args.latency), args.host, args.port)
+    print(f"Fake IMDS listening on {endpoint}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Local fake of the KMS Decrypt API for off-Nitro testing.
+
+Speaks the KMS JSON protocol (`X-Amz-Target: TrentService.Decrypt`) over
+plain HTTP/1.1 with keep-alive. Ciphertext blobs come from
+FakeKms.encrypt(). A Decrypt with a `Recipient` returns the plaintext as
+`CiphertextForRecipient`, a CMS EnvelopedData encrypted to the public key
+in the attestation document. There is no NSM here, so the "document" is
+either the DER public key itself (kms_client.StaticAttestation) or a
+document from the mock libnsm (tests/mock_libnsm.c) carrying the key.
+
+Usage:
+    python3 tests/fake_kms.py --port 4566 --write-tsk encrypted-tsk.b64
+    ENCLAVE_KMS_ENDPOINT=http://127.0.0.1:4566 python3 enclave/app.py
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography.hazmat.primitives import hashes, padding, serialization
+from cryptography.hazmat.primitives.asymmetric import padding as asym_padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from mock_libnsm import parse_document
+
+OID_ENVELOPED_DATA = bytes.fromhex('06092a864886f70d010703')
+OID_DATA = bytes.fromhex('06092a864886f70d010701')
+OID_AES256_CBC = bytes.fromhex('060960864801650304012a')
+OID_RSAES_OAEP = bytes.fromhex('06092a864886f70d010107')
+
+
+def _der(tag, content):
+    if len(content) < 0x80:
+        return bytes([tag, len(content)]) + content
+    length = len(content).to_bytes((len(content).bit_length() + 7) // 8, 'big')
+    return bytes([tag, 0x80 | len(length)]) + length + content
+
+
+def _ber_indefinite(tag, *children):
+    return bytes([tag, 0x80]) + b''.join(children) + b'\x00\x00'
+
+
+def build_enveloped_data(plaintext, public_key):
+    """CMS EnvelopedData as KMS returns it: RSAES-OAEP-SHA-256 + AES-256-CBC, BER indefinite lengths."""
+    cek, iv = os.urandom(32), os.urandom(16)
+    padder = padding.PKCS7(128).padder()
+    encryptor = Cipher(algorithms.AES(cek), modes.CBC(iv)).encryptor()
+    ciphertext = encryptor.update(padder.update(plaintext) + padder.finalize()) + encryptor.finalize()
+    encrypted_key = public_key.encrypt(cek, asym_padding.OAEP(
+        mgf=asym_padding.MGF1(hashes.SHA256()), algorithm=hashes.SHA256(), label=None))
+    key_id = hashlib.sha1(public_key.public_bytes(
+        serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)).digest()
+
+    recipient = _der(0x30, _der(0x02, b'\x02') + _der(0x80, key_id)
+                     + _der(0x30, OID_RSAES_OAEP) + _der(0x04, encrypted_key))
+    content = _ber_indefinite(
+        0x30, OID_DATA, _der(0x30, OID_AES256_CBC + _der(0x04, iv)),
+        _ber_indefinite(0xA0, *(_der(0x04, ciphertext[i:i + 1024]) for i in range(0, len(ciphertext), 1024))))
+    enveloped = _ber_indefinite(0x30, _der(0x02, b'\x02'), _der(0x31, recipient), content)
+    return _ber_indefinite(0x30, OID_ENVELOPED_DATA, _ber_indefinite(0xA0, enveloped))
+
+
+class FakeKms:
+    """Holds the fake master key and serves Decrypt requests."""
+
+    key_id = 'arn:aws:kms:ap-southeast-1:000000000000:key/fake-kms'
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._master = AESGCM(os.urandom(32))
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+    def encrypt(self, plaintext):
+        """Return a base64 CiphertextBlob that this fake can decrypt."""
+        nonce = os.urandom(12)
+        return base64.b64encode(nonce + self._master.encrypt(nonce, plaintext, None)).decode('ascii')
+
+    def decrypt(self, headers, body):
+        """Handle one Decrypt call; returns (http_status, response dict)."""
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if headers.get('X-Amz-Target') != 'TrentService.Decrypt':
+            return 400, {'__type': 'UnknownOperationException'}
+        if not (headers.get('Authorization') or '').startswith('AWS4-HMAC-SHA256'):
+            return 400, {'__type': 'MissingAuthenticationTokenException', 'message': 'Request is not signed'}
+
+        try:
+            request = json.loads(body)
+            blob = base64.b64decode(request['CiphertextBlob'])
+            plaintext = self._master.decrypt(blob[:12], blob[12:], None)
+        except Exception:
+            return 400, {'__type': 'InvalidCiphertextException'}
+
+        recipient = request.get('Recipient')
+        if not recipient:
+            return 200, {'KeyId': self.key_id, 'Plaintext': base64.b64encode(plaintext).decode('ascii')}
+        try:
+            document = base64.b64decode(recipient['AttestationDocument'])
+            if document.startswith(b'MOCKNSM'):
+                document = parse_document(document)[3]
+            public_key = serialization.load_der_public_key(document)
+        except Exception:
+            return 400, {'__type': 'ValidationException', 'message': 'Invalid attestation document'}
+        return 200, {
+            'KeyId': self.key_id,
+            'CiphertextForRecipient': base64.b64encode(build_enveloped_data(plaintext, public_key)).decode('ascii'),
+        }
+
+
+def start_fake_kms(fake=None, host='127.0.0.1', port=0):
+    """Serve `fake` on a daemon thread; returns (fake, server, endpoint URL)."""
+    fake = fake or FakeKms()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            with fake._lock:
+                fake.connections += 1
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            status, result = fake.decrypt(self.headers, body)
+            raw = json.dumps(result).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/x-amz-json-1.1')
+            self.send_header('Content-Length', str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return fake, server, f'http://{host}:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4566)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to each Decrypt')
+    parser.add_argument('--write-tsk', help='write a fresh encrypted TSK (base64) to this path')
+    args = parser.parse_args()
+
+    fake, server, endpoint = start_fake_kms(FakeKms(args.latency), args.host, args.port)
+    if args.write_tsk:
+        with open(args.write_tsk, 'w') as f:
+            f.write(fake.encrypt(os.urandom(32)))
+        print(f"Wrote encrypted TSK to {args.write_tsk}")
+    print(f"Fake KMS listening on {endpoint}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
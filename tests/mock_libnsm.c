@@ -0,0 +1,68 @@
+/*
+ * Mock libnsm with the same C ABI as aws-nitro-enclaves-nsm-api's nsm-lib,
+ * for exercising enclave/nsm_util.py off-Nitro. Built by tests/mock_libnsm.py.
+ *
+ * Documents are "MOCKNSM" || counter (4) || user_data_len (2) ||
+ * nonce_len (2) || pub_key_len (2) || user_data || nonce || pub_key.
+ * MOCK_NSM_DELAY_US adds a per-request delay to mimic the device.
+ */
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+
+#define SUCCESS 0
+#define INVALID_ARGUMENT 1
+#define BUFFER_TOO_SMALL 6
+#define INPUT_TOO_LARGE 7
+
+static volatile int32_t open_fds = 0;
+static volatile uint32_t inits = 0;
+static volatile uint32_t requests = 0;
+
+int32_t nsm_lib_init(void) {
+    __sync_fetch_and_add(&inits, 1);
+    __sync_fetch_and_add(&open_fds, 1);
+    return 3;
+}
+
+void nsm_lib_exit(int32_t fd) {
+    (void)fd;
+    __sync_fetch_and_sub(&open_fds, 1);
+}
+
+static void put16(uint8_t *p, uint32_t v) { p[0] = v >> 8; p[1] = v; }
+
+int nsm_get_attestation_doc(int32_t fd,
+                            const uint8_t *user_data, uint32_t user_data_len,
+                            const uint8_t *nonce, uint32_t nonce_len,
+                            const uint8_t *pub_key, uint32_t pub_key_len,
+                            uint8_t *att_doc, uint32_t *att_doc_len) {
+    if (fd != 3 || att_doc == NULL || att_doc_len == NULL)
+        return INVALID_ARGUMENT;
+    if (user_data_len > 1024 || nonce_len > 1024 || pub_key_len > 1024)
+        return INPUT_TOO_LARGE;
+
+    const char *delay = getenv("MOCK_NSM_DELAY_US");
+    if (delay)
+        usleep((useconds_t)atoi(delay));
+
+    uint32_t n = __sync_add_and_fetch(&requests, 1);
+    uint32_t size = 7 + 4 + 6 + user_data_len + nonce_len + pub_key_len;
+    if (*att_doc_len < size)
+        return BUFFER_TOO_SMALL;
+
+    uint8_t *p = att_doc;
+    memcpy(p, "MOCKNSM", 7); p += 7;
+    p[0] = n >> 24; p[1] = n >> 16; p[2] = n >> 8; p[3] = n; p += 4;
+    put16(p, user_data_len); put16(p + 2, nonce_len); put16(p + 4, pub_key_len); p += 6;
+    if (user_data_len) { memcpy(p, user_data, user_data_len); p += user_data_len; }
+    if (nonce_len) { memcpy(p, nonce, nonce_len); p += nonce_len; }
+    if (pub_key_len) { memcpy(p, pub_key, pub_key_len); p += pub_key_len; }
+    *att_doc_len = size;
+    return SUCCESS;
+}
+
+uint32_t mock_nsm_inits(void) { return inits; }
+uint32_t mock_nsm_requests(void) { return requests; }
+int32_t mock_nsm_open_fds(void) { return open_fds; }
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Build and parse the mock libnsm (tests/mock_libnsm.c).
+
+Usage:
+    python3 tests/mock_libnsm.py /tmp/libnsm.so
+    NSM_LIB_PATH=/tmp/libnsm.so python3 enclave/app.py
+"""
+import os
+import shutil
+import struct
+import subprocess
+import sys
+
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_libnsm.c')
+HEADER = struct.Struct('!7sIHHH')
+
+
+def build(output):
+    """Compile the mock into `output`; returns the path, or None if no C compiler is available."""
+    compiler = shutil.which('cc') or shutil.which('gcc')
+    if not compiler:
+        return None
+    subprocess.run([compiler, '-shared', '-fPIC', '-O2', '-o', output, SOURCE], check=True)
+    return output
+
+
+def parse_document(doc):
+    """Split a mock document into (counter, user_data, nonce, public_key)."""
+    magic, counter, ud_len, nonce_len, pk_len = HEADER.unpack_from(doc)
+    if magic != b'MOCKNSM':
+        raise ValueError("not a mock NSM document")
+    body = doc[HEADER.size:]
+    return counter, body[:ud_len], body[ud_len:ud_len + nonce_len], body[ud_len + nonce_len:ud_len + nonce_len + pk_len]
+
+
+if __name__ == '__main__':
+    path = build(sys.argv[1] if len(sys.argv) > 1 else 'libnsm.so')
+    print(path or "No C compiler found")
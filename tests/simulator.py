@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Local enclave simulator: the real enclave/app.py and host client, no Nitro.
+
+Starts, on this machine:
+
+- one or more enclave servers (`python3 enclave/app.py`, each its own
+  process) listening on UNIX sockets or TCP instead of vsock;
+- the fake KMS (tests/fake_kms.py), with an encrypted TSK written for it;
+- the mock libnsm (tests/mock_libnsm.c), so configure still produces an
+  attestation document and KMS still gets one (StaticAttestation if no C
+  compiler is available);
+- the fake IMDS (tests/fake_imds.py) serving the worker's role credentials.
+
+Each stand-in takes an injected latency (KMS Decrypt, NSM request, IMDS
+call) to model the real services. The host side then runs unchanged:
+host_env() gives the environment for worker.py or starter.py, and
+attach_host() points already-imported host modules at the simulator
+(benchmarks/bench_end_to_end.py, tests/test_simulator.py).
+
+Usage:
+    python3 tests/simulator.py --enclaves 2 --transport unix --kms-latency 0.05 --nsm-latency-us 500
+    # then, in another shell, with the printed environment:
+    ENCLAVE_ADDRESSES=... IMDS_ENDPOINT=... ENCRYPTED_TSK_PATH=... python3 host/worker.py
+"""
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import mock_libnsm
+from fake_imds import FakeImds, start_fake_imds
+from fake_kms import FakeKms, start_fake_kms
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+APP = os.path.join(ROOT, 'enclave', 'app.py')
+
+
+def free_port(host='127.0.0.1'):
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def wait_for(address, timeout=15):
+    """Wait until the enclave at `address` (tcp:/unix:) accepts connections."""
+    scheme, _, rest = address.partition(':')
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if scheme == 'unix':
+                with socket.socket(socket.AF_UNIX) as s:
+                    s.connect(rest)
+            else:
+                host, _, port = rest.rpartition(':')
+                socket.create_connection((host, int(port)), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"enclave at {address} did not start")
+            time.sleep(0.05)
+
+
+class Simulator:
+    """The enclaves and fake AWS services; use as a context manager, or start()/stop()."""
+
+    def __init__(self, enclaves=1, transport='unix', kms_latency=0.0, nsm_latency_us=0, imds_latency=0.0,
+                 enclave_env=None):
+        self.enclaves = enclaves
+        self.transport = transport
+        self.kms_latency = kms_latency
+        self.nsm_latency_us = nsm_latency_us
+        self.imds_latency = imds_latency
+        self.enclave_env = dict(enclave_env or {})
+        self.directory = None
+        self.addresses = []
+        self.processes = []
+        self._servers = []
+
+    def start(self):
+        self.directory = tempfile.mkdtemp(prefix='enclave-sim-')
+        self.kms, kms_server, kms_endpoint = start_fake_kms(FakeKms(self.kms_latency))
+        self.imds, imds_server, self.imds_endpoint = start_fake_imds(FakeImds(latency=self.imds_latency))
+        self._servers = [kms_server, imds_server]
+
+        self.tsk_path = os.path.join(self.directory, 'encrypted-tsk.b64')
+        with open(self.tsk_path, 'w') as f:
+            f.write(self.kms.encrypt(os.urandom(32)))
+
+        env = dict(os.environ, ENCLAVE_KMS_ENDPOINT=kms_endpoint, ENCLAVE_LOG_LEVEL='WARNING', **self.enclave_env)
+        libnsm = mock_libnsm.build(os.path.join(self.directory, 'libnsm.so'))
+        if libnsm:
+            env.update(NSM_LIB_PATH=libnsm, MOCK_NSM_DELAY_US=str(int(self.nsm_latency_us)))
+        else:
+            env['ENCLAVE_ATTESTATION'] = 'static'
+
+        for i in range(self.enclaves):
+            if self.transport == 'tcp':
+                address = f'tcp:127.0.0.1:{free_port()}'
+            else:
+                address = f'unix:{os.path.join(self.directory, f"enclave-{i}.sock")}'
+            log = open(os.path.join(self.directory, f'enclave-{i}.log'), 'w')
+            self.processes.append(subprocess.Popen([sys.executable, '-u', APP], env=dict(env, ENCLAVE_LISTEN=address),
+                                                   stdout=log, stderr=subprocess.STDOUT))
+            log.close()
+            self.addresses.append(address)
+        try:
+            for address in self.addresses:
+                wait_for(address)
+        except Exception:
+            self.stop()
+            raise
+        return self
+
+    def host_env(self):
+        """Environment for a host process (worker, starter) using this simulator."""
+        return {
+            'ENCLAVE_ADDRESSES': ','.join(self.addresses),
+            'IMDS_ENDPOINT': self.imds_endpoint,
+            'ENCRYPTED_TSK_PATH': self.tsk_path,
+        }
+
+    def attach_host(self, setattr=setattr):
+        """
+        Point the imported host modules (activities, credentials,
+        enclave_client) at this simulator, and write the attestation
+        document into its directory. Pass pytest's monkeypatch.setattr to
+        have it undone after the test.
+        """
+        import activities
+        import credentials
+        import enclave_client
+        setattr(credentials, '_provider', credentials.ImdsCredentialProvider(endpoint=self.imds_endpoint))
+        setattr(credentials, '_tsk_file', credentials.TskFile(self.tsk_path))
+        setattr(enclave_client, 'ENCLAVE_ADDRESSES', list(self.addresses))
+        setattr(enclave_client, '_pool', None)
+        setattr(activities, '_enclave_configured', False)
+        setattr(activities, 'PROJECT_ROOT', self.directory)
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self.processes, self._servers = [], []
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--enclaves', type=int, default=1)
+    parser.add_argument('--transport', choices=['unix', 'tcp'], default='unix')
+    parser.add_argument('--kms-latency', type=float, default=0.0, help='seconds added to each KMS Decrypt')
+    parser.add_argument('--nsm-latency-us', type=int, default=0, help='microseconds added to each NSM request')
+    parser.add_argument('--imds-latency', type=float, default=0.0, help='seconds added to each IMDS call')
+    args = parser.parse_args()
+
+    with Simulator(args.enclaves, args.transport, args.kms_latency, args.nsm_latency_us, args.imds_latency) as sim:
+        print(f"Simulating {args.enclaves} enclave(s); logs in {sim.directory}")
+        print("Host environment:")
+        for name, value in sim.host_env().items():
+            print(f"  export {name}={value}")
+        try:
+            while all(process.poll() is None for process in sim.processes):
+                time.sleep(1)
+            for i, process in enumerate(sim.processes):
+                if process.poll() is not None:
+                    with open(os.path.join(sim.directory, f'enclave-{i}.log')) as f:
+                        print(f"Enclave {i} exited ({process.returncode}):\n{f.read()}")
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the enclave's agent process pool (enclave/agent_pool.py):
+tasks run in forked workers through shared memory and the pipe, errors
+and dead workers surface as AgentPoolError, and process / merge requests
+run their agent logic on the pool.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.join(ROOT, 'proto'))
+
+import agent_pool  # noqa: E402
+import app  # noqa: E402
+import state_pb2  # noqa: E402
+
+KEY = bytes(range(32))
+
+
+def echo_task(meta, buffers):
+    return f"{os.getpid()}:{meta['tag']}:".encode() + b'|'.join(buffers)
+
+
+def fail_task(meta, buffers):
+    raise ValueError('bad input')
+
+
+def exit_task(meta, buffers):
+    os._exit(1)
+
+
+TASKS = {'echo': echo_task, 'fail': fail_task, 'exit': exit_task}
+
+
+def test_tasks_run_in_worker_processes():
+    with agent_pool.AgentPool(TASKS, processes=2, shm_bytes=1024) as pool:
+        output = pool.run('echo', {'tag': 'small'}, b'one', b'two')
+        pid, tag, data = bytes(output).split(b':', 2)
+        assert int(pid) != os.getpid() and tag == b'small' and data == b'one|two'
+
+        # Over the shared memory size, both ways: sent over the pipe
+        large = os.urandom(4096)
+        assert bytes(pool.run('echo', {'tag': 'large'}, large)).endswith(b':large:' + large)
+
+
+def test_task_errors_and_dead_workers():
+    with agent_pool.AgentPool(TASKS, processes=1) as pool:
+        with pytest.raises(agent_pool.AgentPoolError, match='ValueError: bad input'):
+            pool.run('fail', {})
+        assert pool.alive == 1
+
+        with pytest.raises(agent_pool.AgentPoolError, match='exited'):
+            pool.run('exit', {})
+        assert pool.alive == 0
+        # Not replaced after the fork point; tasks now run in this process
+        assert bytes(pool.run('echo', {'tag': 'x'}, b'')).startswith(f'{os.getpid()}:'.encode())
+
+
+def test_process_and_merge_on_pool(monkeypatch):
+    pool = agent_pool.AgentPool(app.AGENT_TASKS, processes=2).start()
+    monkeypatch.setattr(app, 'AGENT_POOL', pool)
+    app.KEY_CACHE.store(KEY)
+    try:
+        states = []
+        for agent_id in ('researcher', 'analyst'):
+            response, body = app.handle_process({'workflow_id': 'wf-pool', 'agent_id': agent_id}, agent_id.encode())
+            assert response['status'] == 'ok' and response['iteration'] == 1
+            states.append(body)
+
+        batch = state_pb2.ProcessBatch(items=[state_pb2.ProcessItem(payload=bytes(s), encrypted=True) for s in states])
+        response, body = app.handle_merge({'agent_id': 'writer'}, batch.SerializeToString())
+        assert response['status'] == 'ok' and response['iteration'] == 2
+        merged = app.open_state(KEY, state_pb2.EncryptedState.FromString(body))
+        assert merged.agent_id == 'writer' and merged.data == b'researcheranalyst'
+    finally:
+        app.KEY_CACHE.clear()
+        pool.close()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the claim-check blob store (host/blob_store.py): the
+filesystem backend, offload/resolve of EncryptedState ciphertext, garbage
+collection, and process_in_enclave claim-checking large results against
+enclave/app.py served on a UNIX socket.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+
+import app  # noqa: E402
+import activities  # noqa: E402
+import blob_store  # noqa: E402
+import enclave_client  # noqa: E402
+import state_pb2  # noqa: E402
+from blob_store import (  # noqa: E402
+    BlobIntegrityError, BlobNotFoundError, FileBlobStore, collect_garbage, offload_state, resolve_state,
+)
+
+
+@pytest.fixture
+def store():
+    return FileBlobStore(tempfile.mkdtemp())
+
+
+def test_file_store_dedupes_and_checks_integrity(store):
+    digest = store.put(b'ciphertext', 'wf-1')
+    assert store.put(b'ciphertext', 'wf-2') == digest
+    assert store.get(digest) == b'ciphertext'
+    assert sorted(store.workflows()) == ['wf-1', 'wf-2']
+    assert [name for name, _ in store.blobs()] == [digest]
+    with pytest.raises(BlobNotFoundError):
+        store.get('0' * 64)
+
+    encrypted = state_pb2.EncryptedState(ciphertext=b'x' * 100, workflow_id='wf-1', iteration=1)
+    assert not asyncio.run(offload_state(encrypted, 'wf-1', store, threshold=100))
+    assert asyncio.run(offload_state(encrypted, 'wf-1', store, threshold=10))
+    assert encrypted.ciphertext == b'' and encrypted.blob.size == 100
+
+    # Tampering with the stored blob is caught on resolve
+    with open(store._blob_path(encrypted.blob.sha256), 'wb') as f:
+        f.write(b'y' * 100)
+    with pytest.raises(BlobIntegrityError):
+        asyncio.run(resolve_state(state_pb2.EncryptedState.FromString(encrypted.SerializeToString()), store))
+
+
+def test_offload_and_resolve_round_trip(store):
+    ciphertext = os.urandom(4096)
+    encrypted = state_pb2.EncryptedState(ciphertext=ciphertext, nonce=b'n' * 12, tag=b't' * 16, workflow_id='wf')
+    assert asyncio.run(offload_state(encrypted, 'wf', store, threshold=1024))
+    wire = encrypted.SerializeToString()
+    assert len(wire) < 200
+
+    restored = state_pb2.EncryptedState.FromString(wire)
+    asyncio.run(resolve_state(restored, store))
+    assert restored.ciphertext == ciphertext and not restored.HasField('blob')
+
+
+def test_garbage_collection(store):
+    shared = store.put(b'shared', 'wf-done')
+    store.put(b'shared', 'wf-running')
+    done_only = store.put(b'done-only', 'wf-done')
+    orphan = store.put(b'orphan', 'wf-gone')
+    store.drop_workflow('wf-gone')
+
+    async def workflow_expired(workflow_id):
+        return workflow_id == 'wf-done'
+
+    # Fresh unreferenced blobs survive the grace period
+    assert asyncio.run(collect_garbage(workflow_expired, store)) == {'workflows': 1, 'blobs': 0}
+    assert set(store.workflows()) == {'wf-running'}
+
+    counts = asyncio.run(collect_garbage(workflow_expired, store, grace_seconds=-1))
+    assert counts == {'workflows': 0, 'blobs': 2}
+    assert store.get(shared) == b'shared'
+    for digest in (done_only, orphan):
+        with pytest.raises(BlobNotFoundError):
+            store.get(digest)
+
+
+class RacingStore(FileBlobStore):
+    """A FileBlobStore where another worker puts `data` right after GC calls `hook`."""
+
+    def __init__(self, root, hook, data):
+        super().__init__(root)
+        self.hook, self.data = hook, data
+
+    def _race(self):
+        self.hook = None
+        self.put(self.data, 'wf-new')
+
+    def blobs(self):
+        yield from super().blobs()
+        if self.hook == 'blobs':
+            self._race()
+
+    def referenced(self):
+        referenced = super().referenced()
+        if self.hook == 'referenced':
+            self._race()
+        return referenced
+
+
+@pytest.mark.parametrize('hook', ['blobs', 'referenced'])
+def test_garbage_collection_spares_blob_put_during_sweep(hook):
+    # An old unreferenced blob gets a new reference while GC sweeps
+    store = RacingStore(tempfile.mkdtemp(), hook, b'old')
+    digest = store.put(b'old', 'wf-done')
+    store.drop_workflow('wf-done')
+    past = os.path.getmtime(store._blob_path(digest)) - 7200
+    os.utime(store._blob_path(digest), (past, past))
+
+    async def workflow_expired(workflow_id):
+        return False
+
+    assert asyncio.run(collect_garbage(workflow_expired, store, grace_seconds=60))['blobs'] == 0
+    assert store.hook is None
+    assert store.get(digest) == b'old'
+
+
+def test_process_in_enclave_claim_checks_large_results(store, key, enclave_host, monkeypatch):
+    monkeypatch.setattr(blob_store, '_store', store)
+    monkeypatch.setattr(blob_store, 'CLAIM_CHECK_THRESHOLD', 1024)
+
+    async def scenario():
+        first = await activities.process_in_enclave('x' * 4096)
+        second = await activities.process_in_enclave(first)
+        small = await activities.process_in_enclave('small')
+        await enclave_client.get_enclave_pool().close()
+        return first, second, small
+
+    first, second, small = asyncio.run(scenario())
+
+    for result in (first, second):
+        encrypted = state_pb2.EncryptedState.FromString(result)
+        assert encrypted.HasField('blob') and not encrypted.ciphertext and len(result) < 200
+    assert not state_pb2.EncryptedState.FromString(small).HasField('blob')
+
+    encrypted = state_pb2.EncryptedState.FromString(second)
+    asyncio.run(resolve_state(encrypted, store))
+    state = app.open_state(key, encrypted)
+    assert state.iteration == 2 and state.data == b'x' * 4096
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the host's IMDS credential cache and TSK file cache
+(host/credentials.py), against the local IMDS stand-in in tests/fake_imds.py.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from credentials import ImdsCredentialProvider, TskFile  # noqa: E402
+from fake_imds import FakeImds, start_fake_imds  # noqa: E402
+
+
+@pytest.fixture
+def imds():
+    def start(**kwargs):
+        fake, server, endpoint = start_fake_imds(FakeImds(**kwargs))
+        servers.append(server)
+        return fake, endpoint
+
+    servers = []
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_credentials_cached_until_refresh_due(imds):
+    fake, endpoint = imds()
+
+    async def scenario():
+        provider = ImdsCredentialProvider(endpoint=endpoint)
+        first = await provider.get_credentials()
+        for _ in range(10):
+            assert await provider.get_credentials() is first
+        provider.close()
+        return first
+
+    creds = asyncio.run(scenario())
+    assert creds['aws_access_key_id'].startswith('ASIAFAKE')
+    assert fake.calls == {'token': 1, 'role': 1, 'credentials': 1}
+
+
+def test_concurrent_callers_share_one_fetch(imds):
+    fake, endpoint = imds(latency=0.05)
+
+    async def scenario():
+        provider = ImdsCredentialProvider(endpoint=endpoint)
+        results = await asyncio.gather(*(provider.get_credentials() for _ in range(20)))
+        provider.close()
+        return results
+
+    results = asyncio.run(scenario())
+    assert all(creds is results[0] for creds in results)
+    assert fake.calls == {'token': 1, 'role': 1, 'credentials': 1}
+
+
+def test_background_refresh_before_expiration(imds):
+    fake, endpoint = imds(credential_ttl=4)
+
+    async def scenario():
+        provider = ImdsCredentialProvider(endpoint=endpoint, refresh_margin=3.5)
+        first = await provider.get_credentials()
+        # Refresh is due at half the lifetime (1.5-2s, as Expiration has whole
+        # seconds), without any caller waiting on it; the next one is >= 1.5s later
+        await asyncio.sleep(2.5)
+        assert provider.fetches == 2
+        second = await provider.get_credentials()
+        provider.close()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first['aws_access_key_id'] != second['aws_access_key_id']
+    # The session token is reused across refreshes
+    assert fake.calls['token'] == 1 and fake.calls['role'] == 1
+
+
+def test_revoked_token_is_replaced(imds):
+    fake, endpoint = imds()
+
+    async def scenario():
+        provider = ImdsCredentialProvider(endpoint=endpoint)
+        await provider.get_credentials()
+        fake.revoke_tokens()
+        creds = await provider.refresh()
+        provider.close()
+        return creds
+
+    assert asyncio.run(scenario())['aws_access_key_id'] == 'ASIAFAKE000000000002'
+    assert fake.calls['token'] == 2
+
+
+def test_tsk_file_reloaded_only_on_change():
+    path = os.path.join(tempfile.mkdtemp(), 'encrypted-tsk.b64')
+    tsk = TskFile(path)
+    assert tsk.read() == ''
+
+    with open(path, 'w') as f:
+        f.write('Zmlyc3Q=\n')
+    assert tsk.read() == 'Zmlyc3Q='
+    assert tsk.read() == 'Zmlyc3Q='
+    assert tsk.loads == 1
+
+    # Rotated the way deploy-tsk.sh does it: a new file written in place
+    with open(path, 'w') as f:
+        f.write('c2Vjb25kLWtleQ==\n')
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert tsk.read() == 'c2Vjb25kLWtleQ=='
+    assert tsk.loads == 2
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the host's pooled enclave client (host/enclave_client.py).
+A small asyncio frame server on a UNIX socket stands in for the enclave.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+
+from common import framing  # noqa: E402
+from enclave_client import (  # noqa: E402
+    EnclaveDispatcher, EnclavePool, EnclaveUnavailableError, TcpTransport, UnixTransport, VsockTransport, parse_address,
+)
+
+
+async def start_stand_in(path, connections, state=None):
+    """
+    Frame server that answers each request after meta['delay'] seconds.
+
+    With a `state` dict it also behaves like an enclave without a TSK:
+    requests other than configure/ping fail with not_configured until
+    state['configured'] is set by a configure request.
+    """
+    async def handle(reader, writer):
+        connections.append(writer)
+
+        async def respond(frame):
+            await asyncio.sleep(frame.meta.get('delay', 0))
+            result = {'status': 'ok', 'msg': frame.name}
+            if state is not None:
+                state['requests'] = state.get('requests', 0) + 1
+                if frame.name == 'configure':
+                    state['configured'] = True
+                    state['configures'] = state.get('configures', 0) + 1
+                elif frame.name != 'ping' and not state.get('configured'):
+                    result = {'status': 'error', 'msg': 'not_configured'}
+            for part in framing.encode_frame(frame.type_code | framing.RESPONSE_BIT, frame.request_id,
+                                             result, frame.payload):
+                writer.write(part)
+
+        while True:
+            frame = await framing.read_frame_async(reader)
+            if frame is None:
+                break
+            asyncio.create_task(respond(frame))
+
+    return await asyncio.start_unix_server(handle, path)
+
+
+def test_parse_address():
+    assert isinstance(parse_address('vsock:16:5000'), VsockTransport)
+    tcp = parse_address('tcp:127.0.0.1:5001')
+    assert isinstance(tcp, TcpTransport) and tcp.port == 5001
+    assert isinstance(parse_address('unix:/tmp/enclave.sock'), UnixTransport)
+    with pytest.raises(ValueError):
+        parse_address('http://enclave')
+
+
+def test_requests_multiplexed_on_one_connection():
+    async def scenario():
+        path = os.path.join(tempfile.mkdtemp(), 'enclave.sock')
+        connections = []
+        server = await start_stand_in(path, connections)
+        pool = EnclavePool(UnixTransport(path), size=1)
+
+        slow = asyncio.create_task(pool.request('process', {'delay': 0.2}, b'slow'))
+        await asyncio.sleep(0.01)
+        meta, payload = await pool.request('process', {'delay': 0}, b'fast')
+        assert payload == b'fast'
+        assert not slow.done()
+        assert (await slow)[1] == b'slow'
+        assert len(connections) == 1
+
+        await pool.close()
+        server.close()
+
+    asyncio.run(scenario())
+
+
+def test_reconnects_after_enclave_restart():
+    async def scenario():
+        path = os.path.join(tempfile.mkdtemp(), 'enclave.sock')
+        connections = []
+        server = await start_stand_in(path, connections)
+        pool = EnclavePool(UnixTransport(path), size=1)
+        assert (await pool.request('ping'))[0]['status'] == 'ok'
+
+        # Simulate an enclave restart: drop live connections and rebind
+        server.close()
+        for writer in connections:
+            writer.close()
+        await server.wait_closed()
+        os.unlink(path)
+        server = await start_stand_in(path, connections)
+        await asyncio.sleep(0.01)
+
+        meta, _ = await pool.request('health')
+        assert meta['msg'] == 'health'
+        assert len(connections) == 2
+
+        await pool.close()
+        server.close()
+
+    asyncio.run(scenario())
+
+
+async def start_stand_ins(count):
+    """`count` stateful stand-ins; returns (addresses, servers, states, connections)."""
+    directory = tempfile.mkdtemp()
+    addresses, servers, states, connections = [], [], [], []
+    for i in range(count):
+        path = os.path.join(directory, f'enclave-{i}.sock')
+        states.append({})
+        connections.append([])
+        servers.append(await start_stand_in(path, connections[-1], states[-1]))
+        addresses.append(f'unix:{path}')
+    return addresses, servers, states, connections
+
+
+async def configure(member):
+    meta, _ = await member.pool.request('configure')
+    assert meta['status'] == 'ok'
+
+
+def test_dispatcher_spreads_load_and_configures_each_enclave():
+    async def scenario():
+        addresses, servers, states, _ = await start_stand_ins(3)
+        dispatcher = EnclaveDispatcher(addresses, configure=configure, policy='least')
+
+        results = await asyncio.gather(*(dispatcher.request('process', {'delay': 0.02}) for _ in range(60)))
+        assert all(meta['status'] == 'ok' for meta, _ in results)
+        # Least-outstanding routing keeps the enclaves evenly loaded
+        served = [state['requests'] - state['configures'] for state in states]
+        assert sum(served) == 60 and min(served) >= 15
+        # Each enclave was configured exactly once, before its first request
+        assert [state['configures'] for state in states] == [1, 1, 1]
+        assert all(member['configured'] for member in dispatcher.status())
+
+        # An enclave that lost its TSK is reconfigured and the request retried
+        states[0]['configured'] = False
+        for member in dispatcher.members:
+            member.outstanding = 0 if member.address == addresses[0] else 100
+        meta, _ = await dispatcher.request('process')
+        assert meta['status'] == 'ok' and states[0]['configures'] == 2
+
+        await dispatcher.close()
+        for server in servers:
+            server.close()
+
+    asyncio.run(scenario())
+
+
+def test_dispatcher_fails_over_when_an_enclave_dies():
+    async def scenario():
+        addresses, servers, states, connections = await start_stand_ins(2)
+        dispatcher = EnclaveDispatcher(addresses, configure=configure, policy='p2c', down_seconds=60)
+        await asyncio.gather(*(dispatcher.request('process', {'delay': 0.01}) for _ in range(20)))
+
+        # Kill the first enclave: drop its connections and stop listening
+        servers[0].close()
+        for writer in connections[0]:
+            writer.close()
+        await servers[0].wait_closed()
+        os.unlink(addresses[0][len('unix:'):])
+
+        results = await asyncio.gather(*(dispatcher.request('process') for _ in range(20)))
+        assert all(meta['status'] == 'ok' for meta, _ in results)
+        status = {member['address']: member for member in dispatcher.status()}
+        assert not status[addresses[0]]['healthy'] and status[addresses[0]]['failures'] >= 1
+        assert status[addresses[1]]['healthy']
+
+        # With no enclave left, the error surfaces to the caller
+        servers[1].close()
+        for writer in connections[1]:
+            writer.close()
+        await servers[1].wait_closed()
+        os.unlink(addresses[1][len('unix:'):])
+        with pytest.raises(EnclaveUnavailableError):
+            await dispatcher.request('process')
+
+        await dispatcher.close()
+
+    asyncio.run(scenario())
+
+
+def test_dispatcher_discovery():
+    async def scenario():
+        addresses, servers, states, _ = await start_stand_ins(2)
+        registry = [addresses[0]]
+        dispatcher = EnclaveDispatcher(discover=lambda: list(registry), discovery_interval=0)
+
+        await dispatcher.request('ping')
+        assert [m.address for m in dispatcher.members] == [addresses[0]]
+
+        registry[:] = [addresses[1]]
+        await dispatcher.request('ping')
+        assert [m.address for m in dispatcher.members] == [addresses[1]]
+        assert states[1]['requests'] == 1
+
+        await dispatcher.close()
+        for server in servers:
+            server.close()
+
+    asyncio.run(scenario())
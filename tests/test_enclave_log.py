@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the enclave's logger (enclave/enclave_log.py): level
+filtering, the console drain and its rate limit, and the `get_logs`
+message served from the ring buffer.
+"""
+import io
+import json
+import os
+import socket
+import sys
+import threading
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+
+import app  # noqa: E402
+import enclave_log  # noqa: E402
+
+
+def test_levels_and_ring_buffer():
+    log = enclave_log.EnclaveLog(level=enclave_log.INFO, buffer_size=3, stream=io.StringIO())
+    log.debug("hidden")
+    for i in range(5):
+        log.info("step", i=i)
+    log.error("boom", error=ValueError('bad'))
+
+    records = log.records()
+    assert [r['fields'].get('i') for r in records] == [3, 4, None]
+    assert records[-1]['level'] == 'ERROR'
+    assert [r['msg'] for r in log.records(level=enclave_log.ERROR)] == ['boom']
+    assert log.records(since=records[0]['seq'], limit=1) == records[-1:]
+
+
+def test_console_drain_is_rate_limited():
+    stream = io.StringIO()
+    log = enclave_log.EnclaveLog(buffer_size=100, rate_per_second=10, flush_interval=60, stream=stream)
+    log.start()
+    for i in range(25):
+        log.info("line", i=i)
+    assert stream.getvalue() == ''  # nothing is written on the caller's thread
+
+    log.flush()
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 10 and lines[0].startswith('[ENCLAVE] ') and lines[0].endswith('INFO line i=0')
+    assert log.dropped == 15
+
+
+def test_get_logs_message():
+    app.LOG.info("marker for get_logs", workflow_id='wf-logs')
+    response, _ = app.dispatch('get_logs', {'level': 'info'}, b'')
+    assert response['status'] == 'ok'
+    record = response['logs'][-1]
+    assert record['msg'] == 'marker for get_logs' and record['fields'] == {'workflow_id': 'wf-logs'}
+
+    response, _ = app.dispatch('get_logs', {'since': response['next']}, b'')
+    assert response['logs'] == []
+
+    # The unframed JSON client used by test_kms_attestation.py
+    server, client = socket.socketpair()
+    thread = threading.Thread(target=app.handle_connection, args=(server, 'test', None, threading.Semaphore(1)))
+    thread.start()
+    client.sendall(json.dumps({'type': 'get_logs'}).encode())
+    response = json.loads(client.makefile().read())
+    thread.join()
+    client.close()
+    assert any(r['msg'] == 'marker for get_logs' for r in response['logs'])
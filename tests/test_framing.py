@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the host <-> enclave frame codec (common/framing.py).
+Runs locally over socketpairs; no enclave required.
+"""
+import os
+import socket
+import struct
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common import framing  # noqa: E402
+
+
+def test_round_trip_binary_payload():
+    a, b = socket.socketpair()
+    payload = os.urandom(300 * 1024)  # larger than any single recv
+    sender = threading.Thread(
+        target=framing.send_frame,
+        args=(a, framing.type_code_for('process'), 42, {'workflow_id': 'wf-1'}, payload),
+    )
+    sender.start()
+    frame = framing.read_frame(b)
+    sender.join()
+
+    assert frame.name == 'process'
+    assert not frame.is_response
+    assert frame.request_id == 42
+    assert frame.meta == {'workflow_id': 'wf-1'}
+    assert bytes(frame.payload) == payload
+
+
+def test_response_bit():
+    code = framing.type_code_for('health', response=True)
+    frame = framing.Frame(code, 1, 0, {}, b'')
+    assert frame.is_response
+    assert frame.name == 'health'
+
+
+def test_clean_eof_returns_none():
+    a, b = socket.socketpair()
+    a.close()
+    assert framing.read_frame(b) is None
+
+
+def test_truncated_frame_raises():
+    a, b = socket.socketpair()
+    parts = framing.encode_frame(framing.type_code_for('ping'), 1, {'x': 1}, b'abcdef')
+    a.sendall(b''.join(parts)[:-3])
+    a.close()
+    with pytest.raises(framing.FrameError):
+        framing.read_frame(b)
+
+
+def test_size_limit_enforced_from_header():
+    a, b = socket.socketpair()
+    a.sendall(framing.encode_header(framing.type_code_for('process'), 1, 0, 0, 1024))
+    with pytest.raises(framing.FrameError):
+        framing.read_frame(b, max_size=512)
+
+
+def test_bad_magic_and_version():
+    with pytest.raises(framing.FrameError):
+        framing.decode_header(struct.pack('!2sBBHIII', b'XX', framing.VERSION, 1, 0, 1, 0, 0))
+    with pytest.raises(framing.FrameError):
+        framing.decode_header(struct.pack('!2sBBHIII', framing.MAGIC, 99, 1, 0, 1, 0, 0))
+
+
+def test_unknown_message_type():
+    with pytest.raises(framing.FrameError):
+        framing.type_code_for('no_such_type')
+
+
+def test_send_frame_scatter_gather_partial_writes():
+    class TrickleSocket:
+        """sendmsg writes at most 7 bytes per call."""
+
+        def __init__(self):
+            self.data = bytearray()
+
+        def sendmsg(self, buffers):
+            chunk = b''.join(bytes(b) for b in buffers)[:7]
+            self.data += chunk
+            return len(chunk)
+
+    sock = TrickleSocket()
+    payload = bytearray(os.urandom(100))
+    framing.send_frame(sock, framing.type_code_for('process'), 7, {'k': 'v'}, memoryview(payload))
+    assert bytes(sock.data) == b''.join(framing.encode_frame(framing.type_code_for('process'), 7, {'k': 'v'}, payload))
+
+    a, b = socket.socketpair()
+    a.sendall(sock.data)
+    frame = framing.read_frame(b)
+    assert isinstance(frame.payload, framing.FrameBuffer) and frame.payload == payload
@@ -8,6 +8,10 @@ import json
 import base64
 import os
 
+# Enclave under test (one of ENCLAVE_ADDRESSES when the worker drives several)
+ENCLAVE_CID = int(os.environ.get('ENCLAVE_CID', '16'))
+ENCLAVE_PORT = int(os.environ.get('ENCLAVE_PORT', '5000'))
+
 def test_kms_attestation():
     """Test that enclave can decrypt TSK using kmstool with attestation."""
     
@@ -19,10 +23,10 @@ def test_kms_attestation():
     print(f"Encrypted TSK (first 80 chars): {encrypted_tsk[:80]}...")
     
     # Connect to enclave
-    print("Connecting to Enclave CID 16 Port 5000...")
+    print(f"Connecting to Enclave CID {ENCLAVE_CID} Port {ENCLAVE_PORT}...")
     sock = socket.socket(socket.AF_VSOCK, socket.SOCK_STREAM)
     sock.settimeout(60)  # Longer timeout for KMS call
-    sock.connect((16, 5000))
+    sock.connect((ENCLAVE_CID, ENCLAVE_PORT))
     print("Connected!")
     
     # 1. Ping Test
@@ -43,7 +47,7 @@ def test_kms_attestation():
     # Reconnect for Configure
     sock = socket.socket(socket.AF_VSOCK, socket.SOCK_STREAM)
     sock.settimeout(60) # Apply timeout to the new socket as well
-    sock.connect((16, 5000))
+    sock.connect((ENCLAVE_CID, ENCLAVE_PORT))
 
     # Fetch credentials from IMDS (IMDSv2 support)
     print("Fetching credentials from IMDS...")
@@ -107,7 +111,7 @@ def test_kms_attestation():
     try:
         log_sock = socket.socket(socket.AF_VSOCK, socket.SOCK_STREAM)
         log_sock.settimeout(5)
-        log_sock.connect((16, 5000))
+        log_sock.connect((ENCLAVE_CID, ENCLAVE_PORT))
         log_sock.sendall(json.dumps({'type': 'get_logs'}).encode())
         log_response = json.loads(log_sock.recv(16384).decode())
         print("=== ENCLAVE LOGS (Config Phase) ===")
@@ -130,7 +134,7 @@ def test_kms_attestation():
     print("\nTesting data processing with decrypted TSK...")
     sock = socket.socket(socket.AF_VSOCK, socket.SOCK_STREAM)
     sock.settimeout(10)
-    sock.connect((16, 5000))
+    sock.connect((ENCLAVE_CID, ENCLAVE_PORT))
     
     process_msg = {
         'type': 'process',
@@ -157,7 +161,7 @@ def test_kms_attestation():
         try:
             sock = socket.socket(socket.AF_VSOCK, socket.SOCK_STREAM)
             sock.settimeout(5)
-            sock.connect((16, 5000))
+            sock.connect((ENCLAVE_CID, ENCLAVE_PORT))
             sock.sendall(json.dumps({'type': 'get_logs'}).encode())
             log_response = json.loads(sock.recv(16384).decode())
             print("\n=== ENCLAVE LOGS ===")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the enclave's in-process KMS client (enclave/kms_client.py),
+against the local fake KMS in tests/fake_kms.py.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import kms_client  # noqa: E402
+from fake_kms import start_fake_kms  # noqa: E402
+
+CREDENTIALS = {'ak': 'AKIAFAKE', 'sk': 'secret', 'token': 'session-token'}
+
+
+class CountingAttestation(kms_client.StaticAttestation):
+    calls = 0
+
+    def get_document(self, public_key_der):
+        self.calls += 1
+        return super().get_document(public_key_der)
+
+
+@pytest.fixture
+def kms():
+    fake, server, endpoint = start_fake_kms()
+    yield fake, endpoint
+    server.shutdown()
+    server.server_close()
+
+
+def test_decrypt_reuses_key_pair_and_connection(kms):
+    fake, endpoint = kms
+    attestation = CountingAttestation()
+    backend = kms_client.NitroKmsBackend(endpoint=endpoint, attestation=attestation)
+    tsk = os.urandom(32)
+    blob = fake.encrypt(tsk)
+    for _ in range(3):
+        assert backend.decrypt(blob, CREDENTIALS) == tsk
+    assert fake.requests == 3
+    assert fake.connections == 1 and backend.connections_opened == 1
+    assert attestation.calls == 1
+
+
+def test_reconnects_after_connection_drop(kms):
+    fake, endpoint = kms
+    backend = kms_client.NitroKmsBackend(endpoint=endpoint, attestation=kms_client.StaticAttestation())
+    blob = fake.encrypt(b'k' * 32)
+    backend.decrypt(blob, CREDENTIALS)
+    backend._conn.sock.close()
+    assert backend.decrypt(blob, CREDENTIALS) == b'k' * 32
+
+
+def test_kms_errors_raised(kms):
+    fake, endpoint = kms
+    backend = kms_client.NitroKmsBackend(endpoint=endpoint, attestation=kms_client.StaticAttestation())
+    with pytest.raises(kms_client.KmsError, match='InvalidCiphertextException'):
+        backend.decrypt('bm90IGEgYmxvYg==', CREDENTIALS)
+
+
+def test_malformed_recipient_blob_rejected():
+    backend = kms_client.NitroKmsBackend(endpoint='http://127.0.0.1:1', attestation=kms_client.StaticAttestation())
+    with pytest.raises(kms_client.KmsError):
+        kms_client.open_enveloped_data(b'\x30\x03\x02\x01\x02', backend._private_key)
+
+
+def test_configure_through_backend(kms):
+    import app
+    fake, endpoint = kms
+    tsk = os.urandom(32)
+    app._kms_backend = kms_client.NitroKmsBackend(endpoint=endpoint, attestation=kms_client.StaticAttestation())
+    try:
+        response, _ = app.handle_configure({
+            'aws_access_key_id': CREDENTIALS['ak'],
+            'aws_secret_access_key': CREDENTIALS['sk'],
+            'aws_session_token': CREDENTIALS['token'],
+            'encrypted_tsk': fake.encrypt(tsk),
+        }, b'')
+        assert response['status'] == 'ok'
+        assert app.get_encryption_key() == tsk
+    finally:
+        app._kms_backend = None
+        app.KEY_CACHE.clear()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Unit tests for request-path metrics and tracing: histograms and Prometheus
+rendering (common/metrics.py), the enclave's `metrics` message and traced
+`timings`, and the host's /metrics endpoint and spans (host/telemetry.py)
+against enclave/app.py served on a UNIX socket.
+"""
+import asyncio
+import contextlib
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+
+import app  # noqa: E402
+import activities  # noqa: E402
+import enclave_client  # noqa: E402
+from common import metrics  # noqa: E402
+import telemetry  # noqa: E402
+
+class FakeSpan:
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = dict(attributes or {})
+
+    def is_recording(self):
+        return True
+
+    def get_span_context(self):
+        return type('SpanContext', (), {'trace_id': 0xabc})()
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+
+class FakeTracer:
+    def __init__(self):
+        self.spans = []
+
+    @contextlib.contextmanager
+    def start_as_current_span(self, name, attributes=None):
+        self.spans.append(FakeSpan(name, attributes))
+        yield self.spans[-1]
+
+
+def sample(snapshot, name, **labels):
+    metric = next(m for m in snapshot if m['name'] == name)
+    return next((s for s in metric['samples'] if all(s['labels'].get(k) == v for k, v in labels.items())), None)
+
+
+def test_histogram_and_prometheus_text():
+    registry = metrics.Registry()
+    latency = registry.histogram('latency_seconds', 'Latency', ('type',), buckets=(0.1, 1.0))
+    requests = registry.counter('requests_total', 'Requests', ('type',))
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, type='process')
+    requests.inc(type='process')
+
+    text = metrics.render_prometheus([(registry.snapshot(), {'enclave': 'vsock:16:5000'})])
+    assert '# TYPE latency_seconds histogram' in text
+    assert 'latency_seconds_bucket{enclave="vsock:16:5000",type="process",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{enclave="vsock:16:5000",type="process",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{enclave="vsock:16:5000",type="process",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{enclave="vsock:16:5000",type="process"} 3' in text
+    assert 'requests_total{enclave="vsock:16:5000",type="process"} 1' in text
+
+
+def test_enclave_metrics_and_timings(key):
+    before = sample(app.METRICS.snapshot(), 'enclave_requests_total', type='process', status='ok')
+    before = before['value'] if before else 0
+
+    response, body = app.dispatch('process', {'workflow_id': 'wf-metrics'}, b'data')
+    assert response['status'] == 'ok' and 'timings' not in response
+    response, _ = app.dispatch('process', {'encrypted': True, 'trace_id': 'abc'}, body)
+    assert {'decrypt', 'agent', 'encrypt'} <= set(response['timings'])
+
+    response, _ = app.dispatch('metrics', {}, b'')
+    snapshot = response['metrics']
+    assert sample(snapshot, 'enclave_requests_total', type='process', status='ok')['value'] == before + 2
+    assert sample(snapshot, 'enclave_phase_seconds', phase='encrypt')['count'] >= 2
+
+
+def test_host_metrics_endpoint_and_spans(key, enclave_host, monkeypatch):
+    tracer = FakeTracer()
+    monkeypatch.setattr(telemetry, '_tracer', tracer)
+
+    async def scenario():
+        await activities.process_in_enclave('Sensitive Data')
+        pool = enclave_client.get_enclave_pool()
+        server = await telemetry.serve_metrics(0, pool.metrics, host='127.0.0.1')
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        response = (await reader.read()).decode()
+        writer.close()
+        server.close()
+        await pool.close()
+        return response
+
+    response = asyncio.run(scenario())
+
+    assert response.startswith('HTTP/1.1 200 OK')
+    assert 'host_activity_seconds_count{activity="process_in_enclave",status="ok"}' in response
+    assert 'host_enclave_request_seconds_bucket{type="process",le="+Inf"}' in response
+    assert f'enclave_requests_total{{enclave="{enclave_host}",type="process",status="ok"}}' in response
+
+    names = [s.name for s in tracer.spans]
+    assert 'activity.process_in_enclave' in names and 'enclave.configure' in names
+    process = next(s for s in tracer.spans if s.name == 'enclave.process')
+    assert process.attributes['enclave.address'] == enclave_host
+    assert 'enclave.agent_ms' in process.attributes and 'enclave.encrypt_ms' in process.attributes
+
+
+def test_metrics_endpoint_is_local_by_default(monkeypatch):
+    assert telemetry.METRICS_ADDR == '127.0.0.1' and telemetry.metrics_enabled()
+
+    async def scenario():
+        server = await telemetry.serve_metrics(0)
+        address = server.sockets[0].getsockname()[0]
+        server.close()
+        return address
+
+    assert asyncio.run(scenario()) == '127.0.0.1'
+
+    # Port 0 or an empty address turns the endpoint off
+    monkeypatch.setattr(telemetry, 'METRICS_PORT', 0)
+    assert not telemetry.metrics_enabled()
+    monkeypatch.setattr(telemetry, 'METRICS_PORT', 9464)
+    monkeypatch.setattr(telemetry, 'METRICS_ADDR', '')
+    assert not telemetry.metrics_enabled()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the enclave's NSM session (enclave/nsm_util.py), against the
+mock libnsm in tests/mock_libnsm.c (compiled on the fly).
+"""
+import ctypes
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import mock_libnsm  # noqa: E402
+import nsm_util  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def lib(tmp_path_factory):
+    path = mock_libnsm.build(str(tmp_path_factory.mktemp('nsm') / 'libnsm.so'))
+    if path is None:
+        pytest.skip("no C compiler for the mock libnsm")
+    return ctypes.CDLL(path)
+
+
+def test_request_fields_round_trip(lib):
+    session = nsm_util.NsmSession(lib, cache_ttl=0)
+    doc = session.get_attestation_doc(public_key=b'pk' * 100, nonce=b'n' * 16, user_data=b'ud')
+    _, user_data, nonce, public_key = mock_libnsm.parse_document(doc)
+    assert (user_data, nonce, public_key) == (b'ud', b'n' * 16, b'pk' * 100)
+    session.close()
+
+
+def test_library_opened_once_for_many_requests(lib):
+    inits = lib.mock_nsm_inits()
+    session = nsm_util.NsmSession(lib, cache_ttl=0)
+    counters = set()
+
+    def worker():
+        for _ in range(50):
+            counters.add(mock_libnsm.parse_document(session.get_attestation_doc(nonce=os.urandom(8)))[0])
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert lib.mock_nsm_inits() == inits + 1
+    assert len(counters) == 200
+    session.close()
+    with pytest.raises(nsm_util.NsmError):
+        session.get_attestation_doc(nonce=b'x')
+
+
+def test_nonce_less_documents_cached(lib):
+    session = nsm_util.NsmSession(lib, cache_ttl=60)
+    first = session.get_attestation_doc(public_key=b'key-1')
+    assert session.get_attestation_doc(public_key=b'key-1') == first
+    assert session.get_attestation_doc(public_key=b'key-2') != first
+    assert session.get_attestation_doc(public_key=b'key-1', nonce=b'n') != first
+    session.close()
+
+
+def test_oversized_fields_rejected(lib):
+    session = nsm_util.NsmSession(lib)
+    with pytest.raises(nsm_util.NsmError, match='nonce'):
+        session.get_attestation_doc(nonce=b'x' * (nsm_util.MAX_FIELD_SIZE + 1))
+    session.close()
+
+
+class BlockingLib:
+    """libnsm stand-in whose requests wait until `release` is set."""
+
+    def __init__(self):
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.in_call = False
+        self.exits = []
+
+    def nsm_lib_init(self):
+        return 3
+
+    def nsm_lib_exit(self, fd):
+        self.exits.append(self.in_call)
+
+    def nsm_get_attestation_doc(self, fd, user_data, user_data_len, nonce, nonce_len, pub_key, pub_key_len,
+                                att_doc, att_doc_len):
+        self.in_call = True
+        self.entered.set()
+        self.release.wait(5)
+        att_doc_len._obj.value = 0
+        self.in_call = False
+        return 0
+
+
+def test_close_waits_for_requests_in_flight():
+    lib = BlockingLib()
+    session = nsm_util.NsmSession(lib, cache_ttl=0)
+    request = threading.Thread(target=session.get_attestation_doc, kwargs={'nonce': b'n'})
+    request.start()
+    assert lib.entered.wait(5)
+
+    closer = threading.Thread(target=session.close)
+    closer.start()
+    closer.join(0.2)
+    assert closer.is_alive() and lib.exits == []  # the fd stays open under the request
+    with pytest.raises(nsm_util.NsmError, match='closed'):
+        session.get_attestation_doc(nonce=b'x')
+
+    lib.release.set()
+    request.join(5)
+    closer.join(5)
+    assert lib.exits == [False]
+
+
+def test_document_cache_prunes_expired_and_bounded(lib, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(nsm_util.time, 'monotonic', lambda: now[0])
+    session = nsm_util.NsmSession(lib, cache_ttl=10)
+    for i in range(3):
+        session.get_attestation_doc(public_key=b'key-%d' % i)
+    now[0] += 11
+    first = session.get_attestation_doc(public_key=b'fresh')
+    assert list(session._cache) == [(b'fresh', b'')]
+
+    for i in range(nsm_util.DOC_CACHE_SIZE):
+        session.get_attestation_doc(public_key=b'other-%d' % i)
+    assert len(session._cache) == nsm_util.DOC_CACHE_SIZE
+    assert session.get_attestation_doc(public_key=b'fresh') != first  # evicted as the oldest
+    session.close()
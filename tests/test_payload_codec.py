@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the Temporal payload codec (host/payload_codec.py) and its
+codec server (host/codec_server.py).
+"""
+import asyncio
+import base64
+import json
+import os
+import sys
+import threading
+import urllib.request
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+
+from cryptography.exceptions import InvalidTag  # noqa: E402
+from temporalio.api.common.v1 import Payload  # noqa: E402
+
+import payload_codec  # noqa: E402
+from codec_server import make_server  # noqa: E402
+from payload_codec import EncryptionCodec, data_converter  # noqa: E402
+from workflows import Pipeline, PipelineStep  # noqa: E402
+
+KEY = bytes(range(32))
+SECRET = "Sensitive Data Needs Encryption"
+
+
+def test_round_trip_through_data_converter():
+    converter = data_converter(EncryptionCodec(KEY, compression='zlib'))
+    values = [SECRET, os.urandom(1000), Pipeline(SECRET * 50, [PipelineStep('planner')])]
+
+    payloads = asyncio.run(converter.encode(values))
+    for payload in payloads:
+        assert payload.metadata['encoding'] == b'binary/encrypted'
+        assert SECRET.encode() not in payload.data
+    # The repetitive pipeline input compresses; random bytes and short strings don't
+    assert [p.metadata.get('compression') for p in payloads] == [None, None, b'zlib']
+
+    decoded = asyncio.run(converter.decode(payloads, [str, bytes, Pipeline]))
+    assert decoded == values
+
+
+def test_tampering_and_wrong_key_are_rejected():
+    codec = EncryptionCodec(KEY, compression='zlib')
+    payload = Payload(metadata={'encoding': b'json/plain'}, data=json.dumps(SECRET * 20).encode())
+    encoded = codec.encode_all([payload])[0]
+    assert encoded.metadata['compression'] == b'zlib'
+
+    # Compression is bound as associated data
+    stripped = Payload()
+    stripped.CopyFrom(encoded)
+    del stripped.metadata['compression']
+    with pytest.raises(InvalidTag):
+        codec.decode_all([stripped])
+
+    with pytest.raises(ValueError, match='unknown key'):
+        EncryptionCodec(bytes(32)).decode_all([encoded])
+
+    # Unencrypted payloads are rejected, not passed through
+    with pytest.raises(ValueError, match='not encrypted'):
+        codec.decode_all([payload])
+
+
+def test_missing_key_fails_closed(monkeypatch, tmp_path):
+    monkeypatch.delenv('PAYLOAD_CODEC_KEY', raising=False)
+    monkeypatch.setattr(payload_codec, 'PAYLOAD_CODEC_KEY_PATH', str(tmp_path / 'missing.key'))
+    with pytest.raises(RuntimeError, match='PAYLOAD_CODEC=none'):
+        data_converter()
+
+    # Only an explicit opt-out runs without the codec
+    monkeypatch.setattr(payload_codec, 'PAYLOAD_CODEC', 'none')
+    assert data_converter().payload_codec is None
+
+    monkeypatch.setattr(payload_codec, 'PAYLOAD_CODEC', 'aes-gcm')
+    monkeypatch.setenv('PAYLOAD_CODEC_KEY', base64.b64encode(KEY).decode())
+    assert isinstance(data_converter().payload_codec, EncryptionCodec)
+
+
+def test_codec_server_decodes_for_the_ui():
+    codec = EncryptionCodec(KEY)
+    server = make_server(codec, port=0, origins='http://localhost:8080')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    encoded = codec.encode_all([Payload(metadata={'encoding': b'json/plain'}, data=b'"hello"')])[0]
+    body = {'payloads': [{
+        'metadata': {k: base64.b64encode(v).decode() for k, v in encoded.metadata.items()},
+        'data': base64.b64encode(encoded.data).decode(),
+    }]}
+    request = urllib.request.Request(url + '/decode', json.dumps(body).encode(), method='POST', headers={
+        'Content-Type': 'application/json', 'Origin': 'http://localhost:8080', 'X-Namespace': 'default'})
+    try:
+        with urllib.request.urlopen(request) as response:
+            assert response.headers['Access-Control-Allow-Origin'] == 'http://localhost:8080'
+            result = json.loads(response.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert result['payloads'][0]['data'] == 'ImhlbGxvIg=='
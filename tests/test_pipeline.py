@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Unit tests for multi-agent pipelines: DAG ordering (host/workflows.py), the
+enclave's merge (fan-in) handler, and run_agent_in_enclave against
+enclave/app.py served on a UNIX socket.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+
+import app  # noqa: E402
+import activities  # noqa: E402
+import enclave_client  # noqa: E402
+import state_pb2  # noqa: E402
+from temporalio.exceptions import ApplicationError  # noqa: E402
+from workflows import PipelineStep, pipeline_order  # noqa: E402
+
+
+def open_result(key, body):
+    return app.open_state(key, state_pb2.EncryptedState.FromString(body))
+
+
+def test_pipeline_order():
+    steps = [
+        PipelineStep('writer', after=['researcher', 'analyst']),
+        PipelineStep('analyst', after=['planner']),
+        PipelineStep('planner'),
+        PipelineStep('researcher', after=['planner']),
+    ]
+    order = [s.agent_id for s in pipeline_order(steps)]
+    assert order[0] == 'planner' and order[-1] == 'writer'
+
+    with pytest.raises(ApplicationError, match='cycle'):
+        pipeline_order([PipelineStep('a', after=['b']), PipelineStep('b', after=['a'])])
+    with pytest.raises(ApplicationError, match='unknown'):
+        pipeline_order([PipelineStep('a', after=['missing'])])
+    with pytest.raises(ApplicationError, match='Duplicate'):
+        pipeline_order([PipelineStep('a'), PipelineStep('a')])
+
+
+def test_merge_combines_upstream_states(key):
+    _, root = app.handle_process({'workflow_id': 'wf-1', 'agent_id': 'planner'}, b'plan;')
+    _, left = app.handle_process({'encrypted': True, 'agent_id': 'researcher'}, root)
+    _, right = app.handle_process({'encrypted': True, 'agent_id': 'analyst'}, left)
+
+    batch = state_pb2.ProcessBatch(items=[
+        state_pb2.ProcessItem(payload=bytes(left), encrypted=True),
+        state_pb2.ProcessItem(payload=bytes(right), encrypted=True),
+    ])
+    response, body = app.handle_merge({'agent_id': 'writer'}, batch.SerializeToString())
+    assert response['status'] == 'ok' and response['iteration'] == 4
+    state = open_result(key, body)
+    assert state.agent_id == 'writer' and state.data == b'plan;plan;'
+
+    # States of another workflow cannot be folded in
+    _, other = app.handle_process({'workflow_id': 'wf-2'}, b'other')
+    batch.items.add(payload=bytes(other), encrypted=True)
+    response, _ = app.handle_merge({'agent_id': 'writer'}, batch.SerializeToString())
+    assert response['msg'] == 'workflow_mismatch'
+
+
+def test_run_agent_in_enclave_fan_out_and_in(key, enclave_host):
+    def step(agent_id, *inputs):
+        return state_pb2.AgentStep(agent_id=agent_id, inputs=inputs).SerializeToString()
+
+    async def scenario():
+        planner = await activities.run_agent_in_enclave(
+            step('planner', state_pb2.ProcessItem(payload=b'ctx|', workflow_id='wf-pipeline')))
+        researcher, analyst = await asyncio.gather(*(
+            activities.run_agent_in_enclave(step(agent, state_pb2.ProcessItem(payload=planner, encrypted=True)))
+            for agent in ('researcher', 'analyst')))
+        writer = await activities.run_agent_in_enclave(step(
+            'writer',
+            state_pb2.ProcessItem(payload=researcher, encrypted=True),
+            state_pb2.ProcessItem(payload=analyst, encrypted=True)))
+        await enclave_client.get_enclave_pool().close()
+        return planner, writer
+
+    planner, writer = asyncio.run(scenario())
+
+    assert open_result(key, planner).agent_id == 'planner'
+    state = open_result(key, writer)
+    assert state.agent_id == 'writer' and state.iteration == 3 and state.data == b'ctx|ctx|'
+    assert state_pb2.EncryptedState.FromString(writer).workflow_id == 'wf-pipeline'
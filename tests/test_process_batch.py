@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Unit tests for state processing in the enclave: batches (handle_process_batch)
+and the in-place serialization of single states.
+"""
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.join(ROOT, 'proto'))
+
+import app  # noqa: E402
+from common import framing  # noqa: E402
+import state_pb2  # noqa: E402
+
+
+def run_batch(items):
+    request = state_pb2.ProcessBatch(items=items).SerializeToString()
+    response, body = app.handle_process_batch({}, request)
+    return response, state_pb2.ProcessBatchResult.FromString(body).results
+
+
+def test_batch_results_in_order(key):
+    items = [state_pb2.ProcessItem(payload=f'input {i}'.encode(), workflow_id=f'wf-{i}') for i in range(5)]
+    response, results = run_batch(items)
+    assert response['status'] == 'ok' and response['items'] == 5 and response['failed'] == 0
+    for i, result in enumerate(results):
+        assert result.status == 'ok' and result.iteration == 1
+        encrypted = state_pb2.EncryptedState.FromString(result.payload)
+        assert encrypted.workflow_id == f'wf-{i}'
+        state = app.open_state(key, encrypted)
+        assert state.data == f'input {i}'.encode()
+
+
+def test_batch_chains_encrypted_states(key):
+    _, first = run_batch([state_pb2.ProcessItem(payload=b'ctx', workflow_id='wf-1')])
+    _, second = run_batch([state_pb2.ProcessItem(payload=first[0].payload, encrypted=True)])
+    assert second[0].status == 'ok' and second[0].iteration == 2
+
+
+def test_item_errors_do_not_fail_batch(key):
+    _, good = run_batch([state_pb2.ProcessItem(payload=b'ctx', workflow_id='wf-1')])
+    tampered = state_pb2.EncryptedState.FromString(good[0].payload)
+    tampered.iteration = 5
+    response, results = run_batch([
+        state_pb2.ProcessItem(payload=b'not protobuf \xff', encrypted=True),
+        state_pb2.ProcessItem(payload=tampered.SerializeToString(), encrypted=True),
+        state_pb2.ProcessItem(payload=good[0].payload, encrypted=True),
+    ])
+    assert response['failed'] == 2
+    assert [r.msg for r in results] == ['invalid_state', 'decrypt_failed', 'processed']
+
+
+def test_batch_requires_key():
+    app.KEY_CACHE.clear()
+    response, body = app.handle_process_batch({}, b'')
+    assert response['msg'] == 'not_configured' and body == b''
+
+
+def test_data_key_rotation(key, monkeypatch):
+    monkeypatch.setattr(app, 'DATA_KEYS', app.state_crypto.DataKeys())
+    _, first = run_batch([state_pb2.ProcessItem(payload=b'ctx', workflow_id='wf-1')])
+    assert state_pb2.EncryptedState.FromString(first[0].payload).key_id == '1'
+
+    # States sealed under the TSK itself (no key id) are still accepted
+    legacy = app.state_crypto.encrypt_parts(app.state_crypto.aead_for(key),
+                                            state_pb2.AgentState(iteration=1, data=b'old').SerializeToString(),
+                                            'wf-2', 1)
+    legacy = state_pb2.EncryptedState(nonce=bytes(legacy[0]), ciphertext=bytes(legacy[1]), tag=bytes(legacy[2]),
+                                      workflow_id='wf-2', iteration=1)
+
+    response, _ = app.dispatch('rotate_keys', {}, b'')
+    assert response['data_key_generation'] == 2
+    _, results = run_batch([state_pb2.ProcessItem(payload=first[0].payload, encrypted=True),
+                            state_pb2.ProcessItem(payload=legacy.SerializeToString(), encrypted=True)])
+    assert [r.status for r in results] == ['ok', 'ok']
+    assert {state_pb2.EncryptedState.FromString(r.payload).key_id for r in results} == {'2'}
+
+    app.dispatch('rotate_keys', {'retire': True}, b'')
+    _, results = run_batch([state_pb2.ProcessItem(payload=results[0].payload, encrypted=True)])
+    assert results[0].msg == 'key_retired'
+
+
+def test_states_sealed_and_opened_in_place(key):
+    state = state_pb2.AgentState(agent_id='a', iteration=3, data=os.urandom(1000))
+    sealed = app.seal_state_buffer(key, state, 'wf-1')
+    # Byte for byte what protobuf would serialize
+    assert bytes(sealed) == state_pb2.EncryptedState.FromString(bytes(sealed)).SerializeToString()
+
+    encrypted, offsets = app.parse_state_buffer(sealed)
+    assert offsets and encrypted.workflow_id == 'wf-1' and not encrypted.ciphertext
+    copy = bytearray(sealed)
+    assert app.open_state_buffer(key, sealed, encrypted, offsets) == state
+    assert sealed == copy  # put back as it was
+
+    received = framing.FrameBuffer(sealed)
+    response, body = app.handle_process({'encrypted': True}, received)
+    assert response['iteration'] == 4 and len(received) == 0  # released once decrypted
+
+    # Other field orders (and bytes) take the parsing path
+    message = state_pb2.EncryptedState.FromString(bytes(body))
+    reordered = bytearray(state_pb2.EncryptedState(workflow_id=message.workflow_id, iteration=message.iteration,
+                                                   key_id=message.key_id).SerializeToString())
+    reordered += state_pb2.EncryptedState(ciphertext=message.ciphertext, nonce=message.nonce,
+                                          tag=message.tag).SerializeToString()
+    assert app.parse_state_buffer(reordered)[1] is None and app.parse_state_buffer(bytes(body))[1] is None
+    response, _ = app.handle_process({'encrypted': True}, reordered)
+    assert response['status'] == 'ok' and response['iteration'] == 5
+
+
+def test_states_sealed_and_opened_without_encrypt_into(key, monkeypatch):
+    # cryptography releases without encrypt_into/decrypt_into take the copying path
+    state = state_pb2.AgentState(agent_id='a', iteration=3, data=os.urandom(1000))
+    fast = app.seal_state_buffer(key, state, 'wf-1')
+    monkeypatch.setattr(app.state_crypto, '_HAS_INTO', False)
+
+    sealed = app.seal_state_buffer(key, state, 'wf-1')
+    assert bytes(sealed) == state_pb2.EncryptedState.FromString(bytes(sealed)).SerializeToString()
+    for buffer in (sealed, fast):
+        encrypted, offsets = app.parse_state_buffer(buffer)
+        assert offsets and app.open_state_buffer(key, buffer, encrypted, offsets) == state
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Unit tests for streamed state processing in the enclave (process_stream),
+including more concurrent streams than request workers over a UNIX socket.
+"""
+import asyncio
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.join(ROOT, 'proto'))
+
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+
+import app  # noqa: E402
+import enclave_client  # noqa: E402
+from common import framing  # noqa: E402
+
+CODE = framing.MSG_TYPES['process_stream']
+
+
+def run_stream(meta, segments):
+    frames = [
+        framing.Frame(CODE, 1, framing.FLAG_END if i == len(segments) - 1 else 0, meta if i == 0 else {}, seg)
+        for i, seg in enumerate(segments)
+    ]
+    responses = []
+    app.process_stream(iter(frames), lambda m, p, end: responses.append((m, bytes(p), end)))
+    return responses
+
+
+def test_plaintext_then_encrypted_stream(key):
+    data = b'abcdefgh' * 5
+    responses = run_stream({'workflow_id': 'wf-1', 'chunk_size': 16}, [data[i:i + 16] for i in range(0, 40, 16)])
+    header, segments = responses[0][0], [p for _, p, _ in responses[1:]]
+    assert header['iteration'] == 1 and responses[-1][0]['status'] == 'ok' and responses[-1][2]
+    assert [end for _, _, end in responses] == [False, False, False, True]
+
+    meta = {'encrypted': True, 'workflow_id': 'wf-1', 'iteration': 1,
+            'nonce_prefix': header['nonce_prefix'], 'key_id': header['key_id'], 'chunk_size': 16}
+    responses = run_stream(meta, segments)
+    assert responses[-1][0]['status'] == 'ok' and responses[-1][0]['bytes'] == len(data)
+
+    aead = app.DATA_KEYS.aead(key, 'wf-1', responses[0][0]['key_id'])
+    decryptor = app.state_crypto.StreamDecryptor(aead, 'wf-1', 2, bytes.fromhex(responses[0][0]['nonce_prefix']))
+    segments = [p for _, p, _ in responses[1:]]
+    assert b''.join(decryptor.decrypt_chunk(s, i == len(segments) - 1) for i, s in enumerate(segments)) == data
+
+
+def test_truncated_stream_rejected(key):
+    responses = run_stream({'workflow_id': 'wf-1', 'chunk_size': 4}, [b'aaaa', b'bbbb', b'cc'])
+    meta = {'encrypted': True, 'workflow_id': 'wf-1', 'iteration': 1,
+            'nonce_prefix': responses[0][0]['nonce_prefix'], 'key_id': responses[0][0]['key_id'], 'chunk_size': 4}
+    result = run_stream(meta, [p for _, p, _ in responses[1:3]])
+    assert result[-1] == ({'status': 'error', 'msg': 'decrypt_failed', 'details': result[-1][0]['details']}, b'', True)
+
+
+def test_wrong_segment_size_rejected(key):
+    result = run_stream({'workflow_id': 'wf-1', 'chunk_size': 4}, [b'aaa', b'bbbb'])
+    assert result[-1][0]['msg'] == 'invalid_chunk' and result[-1][2]
+
+
+def test_more_streams_than_workers(key, serve_enclave):
+    # Sessions must not wait on the reader that feeds them: with streams
+    # holding request workers, this used to hang the whole enclave
+    address = serve_enclave(max_workers=2, max_streams=4)
+    chunk = bytes(256 * 1024)
+
+    async def run(pool, i):
+        meta = {'workflow_id': f'wf-{i}', 'chunk_size': len(chunk)}
+        frames = [frame async for frame in pool.stream('process_stream', meta, [chunk] * 8, timeout=10)]
+        return frames[-1].meta
+
+    async def scenario():
+        pool = enclave_client.EnclavePool(enclave_client.parse_address(address), size=1)
+        *results, (pong, _) = await asyncio.gather(*(run(pool, i) for i in range(10)),
+                                                   pool.request('ping', timeout=10))
+        await pool.close()
+        fresh = enclave_client.EnclavePool(enclave_client.parse_address(address), size=1)
+        fresh_pong, _ = await fresh.request('ping', timeout=10)
+        await fresh.close()
+        return results, pong, fresh_pong
+
+    results, pong, fresh_pong = asyncio.run(scenario())
+
+    assert pong['status'] == 'ok' and fresh_pong['status'] == 'ok'
+    assert all(r['status'] == 'ok' or r['msg'] == 'busy' for r in results)
+    assert sum(r['status'] == 'ok' for r in results) >= 4
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+End-to-end test through the local simulator (tests/simulator.py): the host
+activities configure real enclave/app.py processes over UNIX and TCP
+sockets, with credentials from the fake IMDS, the TSK released by the fake
+KMS, and attestation from the mock libnsm.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import activities  # noqa: E402
+import enclave_client  # noqa: E402
+import state_pb2  # noqa: E402
+from simulator import Simulator  # noqa: E402
+
+
+@pytest.mark.parametrize('transport', ['unix', 'tcp'])
+def test_activities_against_simulated_enclaves(transport, monkeypatch):
+    with Simulator(enclaves=2, transport=transport) as sim:
+        sim.attach_host(monkeypatch.setattr)
+
+        async def scenario():
+            first = await activities.process_in_enclave('Sensitive Data')
+            results = await asyncio.gather(*(activities.process_in_enclave(first) for _ in range(8)))
+            health = await activities.health_check()
+            await enclave_client.get_enclave_pool().close()
+            return results, health
+
+        results, health = asyncio.run(scenario())
+
+        assert sim.kms.requests == 2  # one configure per enclave
+        assert sim.imds.calls['credentials'] == 1
+    for result in results:
+        state = state_pb2.EncryptedState.FromString(result)
+        assert state.iteration == 2
+    assert all(enclave['configured'] for enclave in health['enclaves'])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Unit tests for compression and padding of states before encryption
+(enclave/state_codec.py) and its use on the enclave's process path.
+"""
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.join(ROOT, 'proto'))
+
+import app  # noqa: E402
+from common import framing  # noqa: E402
+import state_codec  # noqa: E402
+import state_pb2  # noqa: E402
+
+KEY = bytes(range(32))
+CONTEXT = json.dumps([{'role': 'user', 'content': f'Summarise section {i} of the report.'} for i in range(200)]).encode()
+
+
+@pytest.mark.parametrize('padding, sizes', [
+    ('padme', {1: 5, 100: 104, 1000: 1024, 70000: 71680}),
+    ('pow2', {1: 8, 100: 128, 1000: 1024, 70000: 131072}),
+    ('4096', {1: 4096, 5000: 8192}),
+])
+def test_padding_buckets(padding, sizes):
+    codec = state_codec.StateCodec(compression='none', padding=padding)
+    for length, bucket in sizes.items():
+        data = os.urandom(length)
+        buffer, compression, padded = codec.encode(data)
+        assert len(buffer) == bucket and padded and compression == ''
+        assert bytes(codec.decode(buffer, compression, padded)) == data
+    # Padmé costs at most 12%
+    assert all(state_codec.padme(n) <= n * 1.12 for n in range(2, 100000, 97))
+
+
+def test_compression_threshold_and_errors():
+    codec = state_codec.StateCodec(compression='zlib', threshold=512)
+    assert codec.encode(CONTEXT[:500])[1] == ''  # below the threshold
+    assert codec.encode(os.urandom(4096))[1] == ''  # does not shrink
+    buffer, compression, padded = codec.encode(CONTEXT)
+    assert compression == 'zlib' and len(buffer) < len(CONTEXT) / 4
+    assert bytes(codec.decode(buffer, compression, padded)) == CONTEXT
+
+    with pytest.raises(state_codec.StateCodecError):
+        codec.decode(b'not zlib', 'zlib', False)
+    with pytest.raises(state_codec.StateCodecError):
+        codec.decode(b'\x00\x00\x00\x09', '', True)
+    with pytest.raises(state_codec.StateCodecError):
+        codec.decode(buffer, 'brotli', False)
+
+
+def test_process_compresses_and_pads_states(monkeypatch):
+    app.KEY_CACHE.store(KEY)
+    try:
+        # Sealed before compression was enabled
+        _, plain = app.handle_process({'workflow_id': 'wf-z'}, CONTEXT)
+        monkeypatch.setattr(app, 'STATE_CODEC', state_codec.StateCodec('zlib', threshold=512, padding='padme'))
+
+        response, body = app.handle_process({'encrypted': True}, framing.FrameBuffer(plain))
+        assert response['status'] == 'ok'
+        encrypted = state_pb2.EncryptedState.FromString(bytes(body))
+        assert encrypted.compression == 'zlib' and encrypted.padded
+        assert len(encrypted.ciphertext) == state_codec.padme(len(encrypted.ciphertext)) < len(CONTEXT) / 4
+        assert app.open_state(KEY, encrypted).data == CONTEXT
+
+        response, body = app.handle_process({'encrypted': True}, bytes(body))
+        assert response['iteration'] == 3
+
+        # Compression and padding are authenticated
+        for field, value in (('compression', ''), ('padded', False)):
+            tampered = state_pb2.EncryptedState.FromString(bytes(body))
+            setattr(tampered, field, value)
+            response, _ = app.handle_process({'encrypted': True}, tampered.SerializeToString())
+            assert response['msg'] == 'decrypt_failed'
+    finally:
+        app.KEY_CACHE.clear()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Unit tests for enclave state encryption (enclave/state_crypto.py).
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'enclave'))
+
+import state_crypto  # noqa: E402
+
+KEY = bytes(range(32))
+
+
+def test_round_trip():
+    aead = state_crypto.aead_for(KEY)
+    blob = state_crypto.encrypt_state(aead, b'agent context', 'wf-1', 3)
+    assert len(blob) == len(b'agent context') + state_crypto.OVERHEAD
+    assert bytes(state_crypto.decrypt_state(aead, blob, 'wf-1', 3)) == b'agent context'
+
+
+def test_fresh_nonce_per_encryption():
+    aead = state_crypto.aead_for(KEY)
+    first = state_crypto.encrypt_state(aead, b'same', 'wf-1', 0)
+    second = state_crypto.encrypt_state(aead, b'same', 'wf-1', 0)
+    assert first[:state_crypto.NONCE_SIZE] != second[:state_crypto.NONCE_SIZE]
+
+
+def test_aead_instance_reused_per_key():
+    assert state_crypto.aead_for(KEY) is state_crypto.aead_for(bytes(KEY))
+    assert state_crypto.aead_for(os.urandom(32)) is not state_crypto.aead_for(KEY)
+
+
+@pytest.mark.parametrize('workflow_id, iteration', [('wf-2', 3), ('wf-1', 2)])
+def test_associated_data_binds_workflow_and_iteration(workflow_id, iteration):
+    aead = state_crypto.aead_for(KEY)
+    blob = state_crypto.encrypt_state(aead, b'agent context', 'wf-1', 3)
+    with pytest.raises(state_crypto.InvalidTag):
+        state_crypto.decrypt_state(aead, blob, workflow_id, iteration)
+
+
+def test_tampering_detected():
+    aead = state_crypto.aead_for(KEY)
+    blob = state_crypto.encrypt_state(aead, b'agent context', 'wf-1', 0)
+    blob[-1] ^= 1
+    with pytest.raises(state_crypto.InvalidTag):
+        state_crypto.decrypt_state(aead, blob, 'wf-1', 0)
+    with pytest.raises(state_crypto.InvalidTag):
+        state_crypto.decrypt_state(aead, b'short', 'wf-1', 0)
+
+
+def test_parts_round_trip():
+    aead = state_crypto.aead_for(KEY)
+    nonce, ciphertext, tag = state_crypto.encrypt_parts(aead, b'agent context', 'wf-1', 1)
+    assert len(nonce) == state_crypto.NONCE_SIZE and len(tag) == state_crypto.TAG_SIZE
+    plaintext = state_crypto.decrypt_parts(aead, bytes(nonce), bytes(ciphertext), bytes(tag), 'wf-1', 1)
+    assert bytes(plaintext) == b'agent context'
+    with pytest.raises(state_crypto.InvalidTag):
+        state_crypto.decrypt_parts(aead, bytes(nonce), bytes(ciphertext), bytes(tag), 'wf-1', 2)
+    with pytest.raises(state_crypto.InvalidTag):
+        state_crypto.decrypt_parts(aead, b'', bytes(ciphertext), bytes(tag), 'wf-1', 1)
+
+
+def stream_segments(data, chunk_size, workflow_id='wf-1', iteration=1):
+    encryptor = state_crypto.StreamEncryptor(state_crypto.aead_for(KEY), workflow_id, iteration)
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)] or [b'']
+    return encryptor.prefix, [encryptor.encrypt_chunk(c, i == len(chunks) - 1) for i, c in enumerate(chunks)]
+
+
+def test_stream_round_trip():
+    prefix, segments = stream_segments(b'0123456789' * 10, 16)
+    assert len(prefix) == state_crypto.STREAM_PREFIX_SIZE and len(segments) == 7
+    decryptor = state_crypto.StreamDecryptor(state_crypto.aead_for(KEY), 'wf-1', 1, prefix)
+    out = b''.join(decryptor.decrypt_chunk(s, i == len(segments) - 1) for i, s in enumerate(segments))
+    assert out == b'0123456789' * 10
+    with pytest.raises(ValueError):
+        decryptor.decrypt_chunk(segments[0])
+
+
+@pytest.mark.parametrize('mutate', [
+    lambda segs: segs[:2],                                  # truncated
+    lambda segs: [segs[1], segs[0]] + segs[2:],             # reordered
+    lambda segs: segs[:1] + segs[2:],                       # segment dropped
+])
+def test_stream_detects_truncation_and_reordering(mutate):
+    prefix, segments = stream_segments(b'x' * 64, 16)
+    segments = mutate(segments)
+    decryptor = state_crypto.StreamDecryptor(state_crypto.aead_for(KEY), 'wf-1', 1, prefix)
+    with pytest.raises(state_crypto.InvalidTag):
+        for i, segment in enumerate(segments):
+            decryptor.decrypt_chunk(segment, i == len(segments) - 1)
+
+
+def test_data_keys_per_workflow_cached_lru():
+    keys = state_crypto.DataKeys(cache_size=2)
+    key_id = keys.new_key_id()
+    wf1 = keys.aead(KEY, 'wf-1', key_id)
+    blob = state_crypto.encrypt_state(wf1, b'context', 'wf-1', 1)
+    with pytest.raises(state_crypto.InvalidTag):
+        state_crypto.decrypt_state(keys.aead(KEY, 'wf-2', key_id), blob, 'wf-1', 1)
+    with pytest.raises(state_crypto.InvalidTag):
+        state_crypto.decrypt_state(state_crypto.aead_for(KEY), blob, 'wf-1', 1)
+    assert keys.aead(KEY, 'wf-1', key_id) is wf1 and keys.derived == 2
+
+    keys.aead(KEY, 'wf-3', key_id)  # evicts wf-2, the least recently used
+    keys.aead(KEY, 'wf-1', key_id)
+    assert keys.derived == 3
+    keys.aead(KEY, 'wf-2', key_id)
+    assert keys.derived == 4
+
+    # A new TSK drops every derived key
+    assert keys.aead(os.urandom(32), 'wf-1', key_id) is not wf1
+    assert state_crypto.derive_key(KEY, 'wf-1', key_id) == state_crypto.derive_key(bytearray(KEY), 'wf-1', key_id)
+
+
+def test_data_key_rotation_and_retirement():
+    keys = state_crypto.DataKeys(scope='agent')
+    old = keys.new_key_id('planner')
+    blob = state_crypto.encrypt_state(keys.aead(KEY, 'wf-1', old), b'context', 'wf-1', 1)
+    assert keys.rotate() == 2 and keys.new_key_id('planner') == '2:planner'
+    assert bytes(state_crypto.decrypt_state(keys.aead(KEY, 'wf-1', old), blob, 'wf-1', 1)) == b'context'
+
+    keys.rotate(retire=True)
+    with pytest.raises(state_crypto.KeyRetired):
+        keys.aead(KEY, 'wf-1', old)
+    keys.advance(2)  # never moves back
+    assert keys.generation == 3 and keys.min_generation == 3
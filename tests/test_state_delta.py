@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Unit tests for delta states (enclave/state_delta.py): patches, the
+enclave's context cache, sealing and rebuilding deltas in `process`
+(including the chain replay on a cache miss), and process_in_enclave in
+delta mode against enclave/app.py served on a UNIX socket.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'enclave'))
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+
+import app  # noqa: E402
+import activities  # noqa: E402
+import enclave_client  # noqa: E402
+import state_delta  # noqa: E402
+import state_pb2  # noqa: E402
+
+TURN = b'{"role": "assistant", "content": "next turn"},'
+
+
+@pytest.mark.parametrize('base, data', [
+    (b'context', b'context' + TURN),
+    (b'abcdef', b'abXYZef'),
+    (b'abcdef', b'abef'),
+    (b'same', b'same'),
+    (b'', b'new'),
+    (b'old', b''),
+    (b'aaaa', b'aaaaaa'),
+    (bytes(200000), bytes(70000) + b'\x01' + bytes(130000)),
+])
+def test_patch_round_trip(base, data):
+    patch = state_delta.make_patch(base, data)
+    assert state_delta.apply_patch(base, patch) == data
+    assert len(patch) <= state_delta.SPLICE.size + len(data)
+
+
+def test_patch_is_the_appended_bytes():
+    base = os.urandom(300000)
+    assert len(state_delta.make_patch(base, base + TURN)) == state_delta.SPLICE.size + len(TURN)
+    with pytest.raises(state_delta.DeltaError):
+        state_delta.apply_patch(b'short', state_delta.make_patch(base, base + TURN))
+    with pytest.raises(state_delta.DeltaError):
+        state_delta.apply_patch(base, b'\x00')
+
+
+def test_context_cache_lru_by_bytes():
+    cache = state_delta.ContextCache(max_bytes=100)
+    first = cache.put('wf', 1, b'a' * 40)
+    second = cache.put('wf', 2, b'b' * 40)
+    assert cache.get('wf', 1, first) == b'a' * 40  # now most recent
+    cache.put('wf', 3, b'c' * 40)
+    assert cache.get('wf', 2, second) is None
+    assert cache.get('wf', 1, first) and cache.get('wf', 1, second) is None and cache.get('other', 1, first) is None
+    assert cache.put('wf', 4, b'd' * 101) is None
+    assert cache.describe()['context_cache_bytes'] == 80
+
+
+def test_use_delta_heuristic():
+    assert state_delta.use_delta(100, 10000, 0, 0, max_ratio=0.5, max_chain=4)
+    assert not state_delta.use_delta(100, 10000, 0, 4950, max_ratio=0.5, max_chain=4)
+    assert not state_delta.use_delta(100, 10000, 4, 400, max_ratio=0.5, max_chain=4)
+    assert not state_delta.use_delta(6000, 10000, 0, 0, max_ratio=0.5, max_chain=4)
+
+
+@pytest.fixture
+def growing_agent(key, monkeypatch):
+    """An agent that appends a turn to the context at each step."""
+    def run_agent_step(state, req):
+        return state_pb2.AgentState(agent_id=state.agent_id, iteration=state.iteration + 1, data=state.data + TURN)
+    monkeypatch.setattr(app, 'run_agent_step', run_agent_step)
+    monkeypatch.setattr(app, 'CONTEXT_CACHE', state_delta.ContextCache())
+
+
+def process(payload, **req):
+    response, body = app.handle_process(dict(req, encrypted=True), payload)
+    assert response['status'] == 'ok', response
+    return state_pb2.EncryptedState.FromString(bytes(body))
+
+
+def test_process_seals_and_rebuilds_deltas(key, growing_agent):
+    _, body = app.handle_process({'workflow_id': 'wf-d'}, b'x' * 10000)
+    full = state_pb2.EncryptedState.FromString(bytes(body))
+
+    first = process(full.SerializeToString(), delta=True)
+    assert first.base_iteration == 1 and len(first.ciphertext) < 200
+    second = process(first.SerializeToString(), delta=True, delta_chain=1, delta_chain_bytes=len(first.ciphertext))
+    assert second.base_iteration == 2
+
+    # Not asked for, or the host's chain is long enough: a full state
+    assert not process(second.SerializeToString()).base_iteration
+    compacted = process(second.SerializeToString(), delta=True, delta_chain=state_delta.MAX_CHAIN)
+    assert not compacted.base_iteration and compacted.iteration == 4
+    assert app.open_state(key, compacted).data == b'x' * 10000 + TURN * 4
+
+    # The base is bound into the associated data
+    second.base_iteration = 1
+    response, _ = app.handle_process({'encrypted': True}, second.SerializeToString())
+    assert response['msg'] == 'decrypt_failed'
+    # Deltas are not merged
+    batch = state_pb2.ProcessBatch(items=[state_pb2.ProcessItem(payload=first.SerializeToString(), encrypted=True)])
+    response, _ = app.handle_merge({'agent_id': 'join'}, batch.SerializeToString())
+    assert response['msg'] == 'unsupported_state'
+
+
+def test_process_replays_chain_on_cache_miss(key, growing_agent):
+    _, body = app.handle_process({'workflow_id': 'wf-m'}, b'y' * 5000)
+    full = state_pb2.EncryptedState.FromString(bytes(body))
+    first = process(full.SerializeToString(), delta=True)
+    second = process(first.SerializeToString(), delta=True, delta_chain=1)
+    app.CONTEXT_CACHE.clear()
+
+    response, _ = app.handle_process({'encrypted': True}, second.SerializeToString())
+    assert response['msg'] == 'delta_base_missing'
+
+    second.chain.extend([full, first])
+    third = process(second.SerializeToString())
+    assert app.open_state(key, third).data == b'y' * 5000 + TURN * 4
+
+    # A chain that does not lead to the base is rejected
+    del second.chain[0]
+    app.CONTEXT_CACHE.clear()
+    response, _ = app.handle_process({'encrypted': True}, second.SerializeToString())
+    assert response['msg'] == 'invalid_state'
+
+
+def test_process_in_enclave_delta_mode(key, growing_agent, enclave_host, monkeypatch):
+    monkeypatch.setattr(activities, 'DELTA_STATES', True)
+    monkeypatch.setattr(activities.blob_store, 'CLAIM_CHECK_THRESHOLD', 0)
+    sent = []
+    request = activities.request_enclave
+
+    async def recording_request(msg_type, meta=None, payload=b'', timeout=10):
+        sent.append((dict(meta or {}), len(payload)))
+        return await request(msg_type, meta, payload, timeout)
+
+    monkeypatch.setattr(activities, 'request_enclave', recording_request)
+
+    async def scenario():
+        states = [await activities.process_in_enclave('z' * 20000)]
+        for step in range(4):
+            if step == 2:
+                app.CONTEXT_CACHE.clear()
+            states.append(await activities.process_in_enclave(states[-1]))
+        await enclave_client.get_enclave_pool().close()
+        return states
+
+    states = asyncio.run(scenario())
+
+    states = [state_pb2.EncryptedState.FromString(state) for state in states]
+    assert [state.base_iteration for state in states] == [0, 1, 2, 3, 4]
+    assert [len(state.chain) for state in states] == [0, 1, 2, 3, 4]
+    # Deltas go out without their chain, except after the cache was cleared
+    process_sent = [(meta, size) for meta, size in sent if 'delta' in meta]
+    assert [meta['delta_chain'] for meta, _ in process_sent] == [0, 1, 2, 2, 3]
+    assert all(size < 1000 for _, size in process_sent[1:3] + process_sent[4:])
+    assert process_sent[3][1] > 20000
+
+    last = states[-1]
+    state = app.rebuild_state(key, last, app.open_state(key, last))
+    assert state.iteration == 5 and state.data == b'z' * 20000 + TURN * 5
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the worker's tuning settings (host/worker.py): environment
+and command-line precedence, library defaults for unset knobs, and the
+enclave connection split across worker processes.
+"""
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+
+from worker import parse_args, pool_share, worker_options  # noqa: E402
+
+
+def test_unset_settings_keep_library_defaults(monkeypatch):
+    for name in list(os.environ):
+        if name.startswith('WORKER_'):
+            monkeypatch.delenv(name)
+    args = parse_args([])
+    assert args.processes == 1
+    assert worker_options(args) == {'graceful_shutdown_timeout': timedelta(seconds=30)}
+
+
+def test_environment_and_command_line(monkeypatch):
+    monkeypatch.setenv('WORKER_MAX_CONCURRENT_ACTIVITIES', '32')
+    monkeypatch.setenv('WORKER_ACTIVITY_POLLERS', '8')
+    monkeypatch.setenv('WORKER_GRACEFUL_SHUTDOWN_SECONDS', '5')
+    args = parse_args(['--max-concurrent-activities', '64', '--workflow-pollers', '2', '--activity-threads', '4'])
+    options = worker_options(args)
+    assert options['max_concurrent_activities'] == 64
+    assert options['max_concurrent_activity_task_polls'] == 8
+    assert options['max_concurrent_workflow_task_polls'] == 2
+    assert options['graceful_shutdown_timeout'] == timedelta(seconds=5)
+    assert isinstance(options['activity_executor'], ThreadPoolExecutor)
+    assert 'max_concurrent_workflow_tasks' not in options
+
+
+def test_processes_split_enclave_connections():
+    assert pool_share(4, 1) == 4
+    assert pool_share(4, 2) == 2
+    assert pool_share(4, 3) == 2
+    assert pool_share(4, 8) == 1